@@ -0,0 +1,184 @@
+import csv
+from functools import cached_property
+
+from django.db.models import Prefetch, prefetch_related_objects
+from loguru import logger
+
+from .models import Authorship, Location, PureEntry
+
+MUS_URL = 'https://openalex.samuelmok.cc/'
+MUS_API_URL = 'https://openalex.samuelmok.cc/api/'
+CSV_CHUNK_SIZE = 500
+
+
+class EchoBuffer:
+    # file-like object for csv.writer: writerow() returns the formatted line instead of storing it
+    def write(self, value):
+        return value
+
+
+class PaperRow:
+    '''
+    the data of a paper & its prefetched related objects for the csv columns
+    each value is calculated once per paper, and only if a column uses it
+    '''
+    def __init__(self, paper):
+        self.paper = paper
+
+    @cached_property
+    def authors(self):
+        return [authorship.author for authorship in self.paper.authorships.all()]
+
+    @cached_property
+    def ut_authors(self):
+        return [author for author in self.authors if hasattr(author, 'utdata')]
+
+    @cached_property
+    def pure_entries(self):
+        return list(self.paper.pure_entries.all())
+
+    @cached_property
+    def pure_entry(self):
+        return self.pure_entries[0] if self.pure_entries else None
+
+    @cached_property
+    def oa_links(self):
+        return self.paper.get_oa_links()
+
+
+def pure_entry_field(field):
+    return lambda row: getattr(row.pure_entry, field) if row.pure_entry else ''
+
+
+def journal_field(field):
+    return lambda row: getattr(row.paper.journal, field) if row.paper.journal else ''
+
+
+def paper_field(field):
+    return lambda row: getattr(row.paper, field)
+
+
+def empty(row):
+    # separator columns ('Authorinfo ->', ...) and columns without data
+    return ''
+
+
+# csv column -> function that returns the value for a PaperRow; columns not in here are left empty
+CSV_COLUMNS = {
+    'title': paper_field('title'),
+    'doi': paper_field('doi'),
+    'year': paper_field('year'),
+    'itemtype': paper_field('itemtype'),
+    'isbn': pure_entry_field('isbn'),
+    'topics': lambda row: ' | '.join([topic.get('display_name') for topic in row.paper.topics]) if row.paper.topics else '',
+    'ut_authors': lambda row: ' | '.join([author.name for author in row.ut_authors]),
+    'ut_groups': lambda row: ' | '.join([author.utdata.current_group for author in row.ut_authors]),
+    # is_eemcs?, is_ee? & is_tcs? are not filled (yet), see CSV_EEMCS_KEYS
+    'ut_corresponding_author': lambda row: ' | '.join([author.name for author in row.ut_authors]),
+    'all_authors': lambda row: ' | '.join([author.name for author in row.authors]),
+    'is_openaccess': paper_field('is_oa'),
+    'openaccess_type': paper_field('openaccess'),
+    'found_as_green': paper_field('is_in_pure'),
+    'present_in_pure': paper_field('has_pure_oai_match'),
+    'license': paper_field('license'),
+    'primary_link': paper_field('primary_link'),
+    'pdf_link_primary': paper_field('pdf_link_primary'),
+    'best_oa_link': lambda row: row.oa_links[0]['landing_page_url'],
+    'pdf_link_best_oa': lambda row: row.oa_links[0]['pdf_url'],
+    'other_oa_links': lambda row: ' | '.join(row.oa_links[1]),
+    'openalex_url': paper_field('openalex_url'),
+    'pure_page_link': pure_entry_field('researchutwente'),
+    'pure_file_link': pure_entry_field('risutwente'),
+    'scopus_link': pure_entry_field('scopus'),
+    'journal': journal_field('name'),
+    'journal_issn': journal_field('issn'),
+    'journal_e_issn': journal_field('e_issn'),
+    'journal_publisher': journal_field('publisher'),
+    'volume': paper_field('volume'),
+    'issue': paper_field('issue'),
+    'pages': paper_field('pages'),
+    'pagescount': paper_field('pagescount'),
+    'mus_paper_details': lambda row: f'{MUS_URL}article/{row.paper.id}',
+    'mus_api_url_paper': lambda row: f'{MUS_API_URL}paper/{row.paper.id}',
+    'mus_api_url_pure_entry': lambda row: ' | '.join([f'{MUS_API_URL}pureentry/{entry.id}' for entry in row.pure_entries]),
+    'mus_api_url_pure_report_details': lambda row: ' | '.join([f'{MUS_API_URL}pilotpure/{entry.pilot_pure_data_id}'
+                                                              for entry in row.pure_entries if entry.pilot_pure_data_id]),
+}
+
+
+def get_csv_prefetches():
+    # only the related data used by CSV_COLUMNS
+    return [
+        Prefetch('authorships', queryset=Authorship.objects.select_related('author__utdata')),
+        Prefetch('pure_entries', queryset=PureEntry.objects.only(
+            'paper', 'isbn', 'researchutwente', 'risutwente', 'scopus', 'pilot_pure_data')),
+        Prefetch('locations', queryset=Location.objects.only('is_oa', 'is_best_oa', 'landing_page_url', 'pdf_url')),
+    ]
+
+
+def iter_paper_chunks(papers, prefetches, chunk_size=CSV_CHUNK_SIZE):
+    '''
+    yields the papers of the queryset in lists of chunk_size papers, with the prefetches done per list
+    the papers are read with a server-side cursor, so only one chunk is in memory at a time
+    '''
+    chunk = []
+    for paper in papers.prefetch_related(None).iterator(chunk_size=chunk_size):
+        chunk.append(paper)
+        if len(chunk) >= chunk_size:
+            prefetch_related_objects(chunk, *prefetches)
+            yield chunk
+            chunk = []
+    if chunk:
+        prefetch_related_objects(chunk, *prefetches)
+        yield chunk
+
+
+def iter_csv_values(papers, keys, chunk_size=CSV_CHUNK_SIZE):
+    '''
+    yields a list with the values for keys for each paper in the queryset
+    '''
+    extractors = [CSV_COLUMNS.get(key, empty) for key in keys]
+    papers = papers.select_related('journal')
+    for chunk in iter_paper_chunks(papers, get_csv_prefetches(), chunk_size):
+        for paper in chunk:
+            row = PaperRow(paper)
+            yield [extract(row) for extract in extractors]
+
+
+def stream_csv(papers, keys, chunk_size=CSV_CHUNK_SIZE):
+    '''
+    yields the csv file for the papers in the queryset: the header, then the rows of each chunk of papers as one string
+    '''
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(keys)
+    lines = []
+    count = 0
+    for values in iter_csv_values(papers, keys, chunk_size):
+        lines.append(writer.writerow(values))
+        if len(lines) >= chunk_size:
+            count += len(lines)
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        count += len(lines)
+        yield ''.join(lines)
+    logger.info('csv export finished [# papers] {}', count)
+
+
+def stream_api_csv(papers, chunk_size=CSV_CHUNK_SIZE):
+    '''
+    same as stream_csv, with the fields of the api PaperSchema as columns
+    '''
+    from .serializers import serialize_as_list_of_dicts
+    prefetches = ['locations', 'locations__source', 'journal', 'journal__dealdata', 'pure_entries', 'authors',
+                  'authors__utdata', 'authors__affils']
+    writer = None
+    count = 0
+    for chunk in iter_paper_chunks(papers, prefetches, chunk_size):
+        raw_data = serialize_as_list_of_dicts(chunk)
+        if writer is None:
+            writer = csv.DictWriter(EchoBuffer(), fieldnames=raw_data[0].keys())
+            yield writer.writeheader()
+        count += len(raw_data)
+        yield ''.join([writer.writerow(item) for item in raw_data])
+    logger.info('csv export finished [# papers] {}', count)
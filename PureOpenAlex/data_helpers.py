@@ -11,6 +11,7 @@ from django.db import transaction
 from loguru import logger
 import re
 from .constants import  LICENSESOA
+from mus_wizard.utils import reconstruct_abstract
 
 ORCID_RECORD_API = "https://pub.orcid.org/v3.0/"
 APILOCK = threading.Lock()
@@ -18,26 +19,16 @@ APILOCK = threading.Lock()
 
 def invertAbstract(inverted_abstract):
     """
-    Inverts the given abstract by converting it from a string representation to a dictionary.
-    Then, it creates a list of word-index pairs by iterating over the inverted abstract dictionary.
-    Finally, it sorts the list based on the index and returns the concatenation of all word-index pairs.
+    Rebuilds the text of an abstract from an OpenAlex abstract_inverted_index ({word: [positions]}).
+    See mus_wizard.utils.reconstruct_abstract.
 
     Parameters:
-    - inverted_abstract (str): The string representation of the inverted abstract.
+    - inverted_abstract (dict): The inverted index of the abstract.
 
     Returns:
-    - str: The concatenated word-index pairs.
+    - str: The abstract text, or an empty string if the index is empty or invalid.
     """
-    try:
-        word_index = []
-        for k, v in inverted_abstract.items():
-            for index in v:
-                word_index.append([k, index])
-        word_index = sorted(word_index, key=lambda x: x[1])
-        text = " ".join(word[0] for word in word_index)
-    except Exception:
-        text = ""
-    return text
+    return reconstruct_abstract(inverted_abstract)
 
 
 def convertToEuro(amount, currency, publishdate):
@@ -9,6 +9,7 @@ from .models import (
     UTData
 )
 from .constants import FACULTYNAMES, TCSGROUPSABBR, EEGROUPSABBR
+from .stats import get_faculty_stats
 from loguru import logger
 from django.db.models import Q
 from rich import print
@@ -36,8 +37,15 @@ def generateMainPage(user):
         "inpurematch": 0,
     }
     faculties = []
+    # one grouped (cached) query for all faculties, instead of getPapers + get_stats per faculty
+    faculty_stats = get_faculty_stats()
     for faculty in facultynamelist:
-        facultyname, stats, _ = getPapers(faculty, "all", user)
+        if faculty == "marked":
+            facultyname = "Marked papers"
+            stats = Paper.objects.get_marked_papers(user).get_stats()
+        else:
+            facultyname = faculty
+            stats = faculty_stats[faculty]
         total["articles"] += stats["num"]
         total["numoa"] += stats["numoa"]
         total["inpure"] += stats["articlesinpure"]
@@ -61,52 +69,58 @@ def generateMainPage(user):
     total['articles'] += -1
     return total, faculties
 def getPapers(name, filter="all", user=None):
-    facultyname = ""
-    listpapers = []
-    if user is None:
-        username = "none"
-    else:
-        username = user.username
     if isinstance(name, int):
+        username = "none" if user is None else user.username
         logger.info("getpaper [id] {} [user] {}", name, username)
         paperid = name
         facultyname = "single"
         listpapers = Paper.objects.get_single_paper_data(paperid,user)
         stats = None
         return facultyname, stats, listpapers
+
+    facultyname, filterpapers, filter = getPaperQuerySet(name, filter, user)
+    listpapers = filterpapers.get_table_data(filter,user)
+    stats = listpapers.get_stats()
+    return facultyname, stats, listpapers
+def getPaperQuerySet(name, filter="all", user=None):
+    '''
+    returns the display name, the unfiltered queryset and the filter list for the papers of a faculty/author/bookmarks
+    used by getPapers and by the table_data view for a single page of the same table
+    '''
+    facultyname = ""
+    if user is None:
+        username = "none"
     else:
-        logger.info("getpapers [name] {} [filter] {} [user] {}", name, filter, username)
-        if filter == 'author':
-            facultyname = name+" [Author]"
-            filterpapers = Paper.objects.get_author_papers(name)
-            filter = [['all','']]
-        elif name == "marked" or name == "Marked papers":
-            facultyname = "Marked papers"
-            filterpapers=Paper.objects.get_marked_papers(user)
+        username = user.username
+    logger.info("getpapers [name] {} [filter] {} [user] {}", name, filter, username)
+    if filter == 'author':
+        facultyname = name+" [Author]"
+        filterpapers = Paper.objects.get_author_papers(name)
+        filter = [['all','']]
+    elif name == "marked" or name == "Marked papers":
+        facultyname = "Marked papers"
+        filterpapers=Paper.objects.get_marked_papers(user)
+        if isinstance(filter, str):
+            filter = [[str(filter),""]]
+    else:
+        filterpapers = Paper.objects.all().distinct()
+        if name == "all" or name == "All items":
+            facultyname = "All MUS papers"
+            name = 'all'
             if isinstance(filter, str):
                 filter = [[str(filter),""]]
         else:
-            filterpapers = Paper.objects.all().distinct()
-            if name == "all" or name == "All items":
-                facultyname = "All MUS papers"
-                name = 'all'
-                if isinstance(filter, str):
-                    filter = [[str(filter),""]]
+            if name not in FACULTYNAMES:
+                facultyname = "Other groups"
+                name = 'other'
             else:
-                if name not in FACULTYNAMES:
-                    facultyname = "Other groups"
-                    name = 'other'
-                else:
-                    facultyname = name
-                if isinstance(filter, str):
-                    filter = [[str(filter),""],['faculty',name]]
-                if isinstance(filter, list):
-                    if ['faculty', name] not in filter:
-                        filter.append(['faculty',name])
-
-    listpapers = filterpapers.get_table_data(filter,user)
-    stats = listpapers.get_stats()
-    return facultyname, stats, listpapers
+                facultyname = name
+            if isinstance(filter, str):
+                filter = [[str(filter),""],['faculty',name]]
+            if isinstance(filter, list):
+                if ['faculty', name] not in filter:
+                    filter.append(['faculty',name])
+    return facultyname, filterpapers, filter
 def open_alex_autocomplete(query, types=['works','authors'], amount=5):
     '''
     Uses the OpenAlex autocomplete API to fetch data
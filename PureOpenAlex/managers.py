@@ -1,5 +1,5 @@
 from django.db import models, transaction
-from django.db.models import Q, Prefetch, Exists, OuterRef, Count, prefetch_related_objects
+from django.db.models import Q, F, Case, When, Value, Prefetch, Exists, OuterRef, Count, prefetch_related_objects
 from collections import defaultdict
 from loguru import logger
 from .constants import TCSGROUPS, TCSGROUPSABBR, EEGROUPS, EEGROUPSABBR, FACULTYNAMES, CSV_EXPORT_KEYS, CSV_EEMCS_KEYS
@@ -8,11 +8,15 @@ from django.apps import apps
 import re
 from django.conf import settings
 import pymongo
-from rapidfuzz import process, fuzz, utils
+from rapidfuzz import fuzz
+from mus_wizard.database.name_matching import NameIndex
 import os
 import requests
 from io import StringIO
-import csv
+import base64
+import json
+import threading
+from contextlib import contextmanager
 MONGOURL = getattr(settings, "MONGOURL")
 client=pymongo.MongoClient(MONGOURL)
 db=client['mus']
@@ -24,6 +28,61 @@ pure_org_mapping = db['pure_org_mapping']
 pure_full_orgs_mapping = db['pure_full_orgs_mapping']
 pure_cerif_ut_authors = db['pure_cerif_ut_authors']
 
+# the paper counts in the stats of PaperQuerySet.get_stats and PaperMembershipManager.get_faculty_stats: name -> lookups
+STATS_COUNTS = {
+    'num': {},
+    'numoa': {'is_oa': True},
+    'numpure': {'is_in_pure': True},
+    'numpurematch': {'has_pure_oai_match': True},
+    'numarticles': {'itemtype': "journal-article"},
+    'articlesinpure': {'is_in_pure': True, 'itemtype': "journal-article"},
+    'articlesinpurematch': {'has_pure_oai_match': True, 'itemtype': "journal-article"},
+    'numarticlesoa': {'is_oa': True, 'itemtype': "journal-article"},
+}
+
+def add_stats_percentages(stats):
+    # adds the percentages to a dict with the STATS_COUNTS counts
+    stats["oa_percent"] = (
+        round((stats["numoa"] / stats["num"]) * 100, 2) if stats["num"] else 0
+    )
+    stats["numpure_percent"] = (
+        round((stats["numpure"] / stats["num"]) * 100, 2) if stats["num"] else 0
+    )
+    stats["oa_percent_articles"] = (
+        round((stats["numarticlesoa"] / stats["numarticles"]) * 100, 2)
+        if stats["numarticles"]
+        else 0
+    )
+    stats["articlesinpure_percent"] = (
+        round((stats["articlesinpure"] / stats["numarticles"]) * 100, 2)
+        if stats["numarticles"]
+        else 0
+    )
+    stats["numpurematch_percent"] = (
+        round((stats["numpurematch"] / stats["num"]) * 100, 2)
+        if stats["num"]
+        else 0
+    )
+    stats["articlesinpurematch_percent"] = (
+        round((stats["articlesinpurematch"] / stats["numarticles"]) * 100, 2)
+        if stats["numarticles"]
+        else 0
+    )
+    return stats
+
+def encode_table_cursor(value, paper_id):
+    # cursor for get_table_page: the order field value & id of the last paper on a page
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, paper_id]).encode()).decode()
+
+def decode_table_cursor(cursor):
+    try:
+        value, paper_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(paper_id)
+    except Exception as e:
+        raise ValueError(f"Invalid table cursor: {e}")
+
 class AuthorManager(models.Manager):
     # possible TODO
     # Deduplicate authors
@@ -293,22 +352,18 @@ class PureEntryManager(models.Manager):
         entries_with_no_authors = self.filter(authors__isnull=True)
         Author = apps.get_model('PureOpenAlex', 'Author')
         dbauthordata = Author.objects.order_by('last_name','first_name').only('id','openalex_url','name','first_name','last_name','known_as', 'initials')
-        matchlist = []
-        idnamemapping = defaultdict(set)
+        nameindex = NameIndex()
         i = 0
         api_responses_pure = db['api_responses_pure']
         for author in dbauthordata:
             i += 1
             id = author.id
-            matchlist.append(author.name)
-            idnamemapping[author.name].add(id)
+            nameindex.add(author.name, id)
             if author.known_as != {} and author.known_as is not None:
                 for name in author.known_as:
-                    matchlist.append(name)
-                    idnamemapping[name].add(id)
+                    nameindex.add(name, id)
             for name in [f'{author.first_name} {author.last_name}', f'{author.last_name}, {author.first_name}', f'{author.initials} {author.last_name}', f'{author.last_name}, {author.initials}']:
-                matchlist.append(name)
-                idnamemapping[name].add(id)
+                nameindex.add(name, id)
         faillist = []
         donelist = []
         matched = 0
@@ -351,19 +406,18 @@ class PureEntryManager(models.Manager):
 
             with transaction.atomic():
                 for author in authorlist:
-                    matches = process.extract(author,matchlist, processor=utils.default_process, scorer=fuzz.QRatio, score_cutoff=90)
-                    if len(matches) == 0 or not matches:
+                    match = nameindex.match_one(author, scorer=fuzz.QRatio, score_cutoff=90)
+                    if not match:
                         failed += 1
                     else:
-                        matchname=matches[0][0]
-                        authorid=idnamemapping[matchname]
+                        authorid=match.ids
                         if isinstance(authorid, set):
                             matched += 1
                             id = max(authorid)
                             authorobj = Author.objects.get(id=id)
                             if authorobj:
                                 if authorobj not in entry.authors.all():
-                                    logger.debug(f'match: {author} == {authorobj.name} ({authorobj.id}) | score {matches[0][1]}')
+                                    logger.debug(f'match: {author} == {authorobj.name} ({authorobj.id}) | score {match.score}')
                                     entry.authors.add(authorobj)
                                     entry.save()
                                 else:
@@ -676,6 +730,100 @@ class JournalManager(models.Manager):
 
 
         return journal, created
+
+class PaperMembershipManager(models.Manager):
+    '''
+    keeps the denormalised PaperMembership table in sync with Authorship & UTData
+    per paper & ut author there is one row for the current group/faculty of the author, and one per entry in
+    employment_data. Paper.objects.filter_by uses it for the group/faculty/TCS/EE filters.
+    '''
+
+    # per thread: number of active deferred() blocks
+    deferred_state = threading.local()
+
+    @contextmanager
+    def deferred(self, refresh=False):
+        '''
+        suspends the signal receivers that keep the rows in sync (see signals.py) in this thread, for bulk imports
+        that add authorships & utdata one by one. refresh=True rebuilds the full table at the end of the outermost
+        block, otherwise call refresh() afterwards.
+        '''
+        self.deferred_state.depth = getattr(self.deferred_state, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            self.deferred_state.depth -= 1
+        if refresh and not self.is_deferred():
+            self.refresh()
+
+    def is_deferred(self) -> bool:
+        return getattr(self.deferred_state, 'depth', 0) > 0
+
+    def make_rows(self, authorships) -> list:
+        '''
+        builds the PaperMembership rows for an Authorship queryset
+        '''
+        rows = set()
+        values = authorships.filter(author__utdata__isnull=False).values_list(
+            'paper_id', 'author_id', 'author__utdata__current_group', 'author__utdata__current_faculty',
+            'author__utdata__employment_data')
+        for paper_id, author_id, current_group, current_faculty, employment_data in values.iterator(chunk_size=5000):
+            rows.add((paper_id, author_id, current_group, current_faculty, current_faculty, True))
+            if isinstance(employment_data, list):
+                for entry in employment_data:
+                    if isinstance(entry, dict) and (entry.get('group') or entry.get('faculty')):
+                        rows.add((paper_id, author_id, entry.get('group'), entry.get('faculty'), current_faculty, False))
+        return [self.model(paper_id=paper_id, author_id=author_id, group=group, faculty=faculty,
+                           current_faculty=current_faculty, is_current=is_current)
+                for paper_id, author_id, group, faculty, current_faculty, is_current in rows]
+
+    @transaction.atomic
+    def refresh(self, paper_ids=None, author_ids=None) -> int:
+        '''
+        rebuilds the rows for the given papers and/or authors; rebuilds the full table if both are None
+        returns the number of rows written
+        '''
+        Authorship = apps.get_model('PureOpenAlex', 'Authorship')
+        authorships = Authorship.objects.all()
+        existing = self.all()
+        if paper_ids is not None:
+            authorships = authorships.filter(paper_id__in=paper_ids)
+            existing = existing.filter(paper_id__in=paper_ids)
+        if author_ids is not None:
+            authorships = authorships.filter(author_id__in=author_ids)
+            existing = existing.filter(author_id__in=author_ids)
+        existing.delete()
+        rows = self.bulk_create(self.make_rows(authorships), batch_size=5000)
+        if paper_ids is None and author_ids is None:
+            logger.info(f'rebuilt PaperMembership table: {len(rows)} rows')
+        return len(rows)
+
+    def get_faculty_stats(self):
+        '''
+        the get_stats() counts for the papers of each faculty (as in filter_by [['faculty', name]]), and 'Other groups'
+        for ut authors outside FACULTYNAMES, in one grouped query on the memberships
+        returns {faculty: stats}
+        '''
+        faculties = [name for name in FACULTYNAMES if name.isupper()]
+        buckets = (
+            self.filter(is_current=True)
+            # lowercase faculty names are not matched by filter_by
+            .exclude(current_faculty__in=[name for name in FACULTYNAMES if not name.isupper()])
+            .annotate(bucket=Case(
+                When(current_faculty__in=faculties, then=F('current_faculty')),
+                default=Value('Other groups'),
+            ))
+            .values('bucket')
+            .annotate(**{
+                name: Count('paper', distinct=True, filter=Q(**{f'paper__{key}': value for key, value in lookups.items()}) if lookups else None)
+                for name, lookups in STATS_COUNTS.items()
+            })
+        )
+        stats = {name: add_stats_percentages({count: 0 for count in STATS_COUNTS}) for name in faculties + ['Other groups']}
+        for row in buckets:
+            stats[row.pop('bucket')] = add_stats_percentages(row)
+        return stats
+
 class PaperManager(models.Manager):
     api_responses_works_openalex = db["api_responses_works_openalex"]
     api_responses_journals_openalex = db["api_responses_journals_openalex"]
@@ -804,6 +952,8 @@ class PaperQuerySet(models.QuerySet):
             'apc_paid_value', 'apc_paid_currency', 'apc_paid_value_eur', 'apc_paid_value_usd',
             'published_print', 'published_online', 'issued', 'published',
             'license', 'citations','pages','pagescount', 'volume','issue']
+    # fields the paper tables can be sorted on, see get_table_page
+    TABLEORDERFIELDS = ['year', 'date', 'title', 'doi', 'itemtype']
 
     # convenience functions to get sets of papers based on foreign key fields, itemtype, etc
     def get_all_without_pure_entry(self):
@@ -824,47 +974,48 @@ class PaperQuerySet(models.QuerySet):
         return self.exclude(itemtype__in=['journal-article', 'proceedings'])
 
     # prefetching functions
+    # the prefetches are done for the evaluated papers only: django runs each prefetch query with '__in=<pks of the
+    # papers>', so the prefetch querysets should not filter on the outer queryset (that adds it as a subquery).
+    # the only() fields are the fields used in faculty_table_rows.html and papercomponents/*.html
     def get_table_prefetches(self):
         Location = apps.get_model('PureOpenAlex', 'Location')
         Author = apps.get_model('PureOpenAlex', 'Author')
-        PureEntry = apps.get_model('PureOpenAlex', 'PureEntry')
         location_prefetch = Prefetch(
             "locations",
-            queryset=Location.objects.filter(papers__in=self.all()).select_related('source'),
+            queryset=Location.objects.select_related('source').only(
+                'pdf_url', 'is_oa', 'is_primary', 'source', 'source__host_org', 'source__type'
+            ),
             to_attr="pref_locations",
         )
         authors_prefetch =Prefetch(
             'authors',
-            queryset=Author.objects.filter(authorships__paper__in=self.all()).distinct().select_related('utdata'),
+            queryset=Author.objects.only('name', 'is_ut').distinct(),
             to_attr="pref_authors",
         )
-        pureentry_prefetch = Prefetch(
-            'pure_entries',
-            queryset=PureEntry.objects.filter(paper__in=self.all()).select_related('pilot_pure_data'),
-            to_attr="pref_pure_entries",
-        )
-        return self.select_related().prefetch_related(location_prefetch, authors_prefetch, pureentry_prefetch)
+        return self.prefetch_related(location_prefetch, authors_prefetch)
     def get_detailed_prefetches(self):
         Location = apps.get_model('PureOpenAlex', 'Location')
         Author = apps.get_model('PureOpenAlex', 'Author')
         Authorship = apps.get_model('PureOpenAlex', 'Authorship')
+        Affiliation = apps.get_model('PureOpenAlex', 'Affiliation')
 
         authorships_prefetch = Prefetch(
             "authorships",
-            queryset=Authorship.objects.filter(paper__in=self.model.objects.all()).select_related(
-                "author"
+            queryset=Authorship.objects.select_related("author").only(
+                'paper', 'position', 'corresponding', 'author', 'author__id'
             ),
             to_attr="preloaded_authorships",
         )
         location_prefetch = Prefetch(
             "locations",
-            queryset=Location.objects.filter(papers__in=self.model.objects.all()).select_related("source"),
+            queryset=Location.objects.select_related("source"),
             to_attr="preloaded_locations",
         )
         authors_and_affiliation_prefetch =Prefetch(
             'authors',
-            queryset=Author.objects.filter(authorships__paper__in=self.model.objects.all()).distinct()
-            .prefetch_related('affils').select_related('utdata'),
+            queryset=Author.objects.distinct().select_related('utdata').prefetch_related(
+                'affils', Prefetch('affiliations', queryset=Affiliation.objects.select_related('organization'))
+            ),
             to_attr="preloaded_authors",
         )
         return self.select_related('journal').prefetch_related(location_prefetch, authorships_prefetch, authors_and_affiliation_prefetch)
@@ -882,6 +1033,37 @@ class PaperQuerySet(models.QuerySet):
     def get_table_data(self, filter: list, user, order='-year'):
         # for all the views that show a table of papers
         return self.filter_by(filter).annotate_marked(user).get_table_prefetches().defer(*self.TABLEDEFERFIELDS).order_by(order)
+    def get_table_page(self, user, order='-year', after=None, start=0, length=50, search=''):
+        '''
+        returns a single page of table data for the (filtered) papers in this queryset, and the cursor for the next page
+        uses keyset pagination on (order field, id): pass the cursor of the previous page as 'after', so the page is
+        found with an index seek instead of skipping 'start' rows. start is only used if there is no cursor.
+        order: one of TABLEORDERFIELDS, prefixed with '-' for descending
+        search: optional text to search for in title & doi
+        the prefetches & annotations are only done for the papers on the page
+        '''
+        field = order.lstrip('-')
+        if field not in self.TABLEORDERFIELDS:
+            raise ValueError(f"Invalid order field {field}")
+        descending = order.startswith('-')
+        papers = self
+        if search:
+            papers = papers.filter(Q(title__icontains=search) | Q(doi__icontains=search))
+        papers = papers.order_by(order, '-id' if descending else 'id')
+        if after:
+            value, last_id = decode_table_cursor(after)
+            lookup = 'lt' if descending else 'gt'
+            papers = papers.filter(Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'id__{lookup}': last_id}))
+            start = 0
+        keys = list(papers.values_list('id', field)[start:start + length + 1])
+        next_cursor = None
+        if len(keys) > length:
+            keys = keys[:length]
+            next_cursor = encode_table_cursor(keys[-1][1], keys[-1][0])
+        ids = [paper_id for paper_id, _ in keys]
+        page = self.model.objects.filter(pk__in=ids).annotate_marked(user).get_table_prefetches().defer(*self.TABLEDEFERFIELDS)
+        page = {paper.id: paper for paper in page}
+        return [page[paper_id] for paper_id in ids if paper_id in page], next_cursor
     def get_single_paper_data(self, paperid, user):
         # for the single_article view
         return self.filter(id=paperid).annotate_marked(user).select_related().get_detailed_prefetches()
@@ -935,6 +1117,10 @@ class PaperQuerySet(models.QuerySet):
         '''
 
         Author = apps.get_model('PureOpenAlex', 'Author')
+        Authorship = apps.get_model('PureOpenAlex', 'Authorship')
+        # group, faculty, TCS & EE filters are semi-joins on the paper memberships, instead of joins through
+        # authorships -> author -> utdata that need a .distinct()
+        PaperMembership = apps.get_model('PureOpenAlex', 'PaperMembership')
         if len(filter) == 0:
             return self
         if len(filter) == 1:
@@ -975,21 +1161,11 @@ class PaperQuerySet(models.QuerySet):
                     grouplist = TCSGROUPS + TCSGROUPSABBR
                 elif filter == 'EE':
                     grouplist = EEGROUPS + EEGROUPSABBR
-                q_expressions = Q()
-                for group_abbr in grouplist:
-                    q_expressions |= (
-                            Q(
-                                authorships__author__utdata__employment_data__contains={'group': group_abbr}
-                            )
-                        &
-                            Q(
-                                authorships__author__utdata__employment_data__contains={'faculty':'EEMCS'}
-                            )
-                    )
-
-                finalfilters['groups'].append(((Q(authorships__author__utdata__current_group__in=grouplist) | q_expressions)) & Q(
-                        authorships__author__utdata__current_faculty='EEMCS'
-                    ))
+                # an author currently at EEMCS, with a current group in grouplist or an EEMCS employment_data entry for
+                # a group in grouplist
+                memberships = PaperMembership.objects.filter(current_faculty='EEMCS', group__in=grouplist).filter(
+                    Q(is_current=True) | Q(faculty='EEMCS'))
+                finalfilters['groups'].append(Q(pk__in=memberships.values('paper_id')))
 
             if filter == 'author':
                 if isinstance(value, str):
@@ -997,7 +1173,7 @@ class PaperQuerySet(models.QuerySet):
                 for item in value:
                     author = Author.objects.get(name = item)
                     finalfilters['authors'].append(Q(
-                        authorships__author=author
+                        pk__in=Authorship.objects.filter(author=author).values('paper_id')
                     ))
             if filter == 'group':
                 if isinstance(value, str):
@@ -1005,7 +1181,7 @@ class PaperQuerySet(models.QuerySet):
                 for item in value:
                     group = item
                     finalfilters['groups'].append(Q(
-                        authorships__author__utdata__current_group=group
+                        pk__in=PaperMembership.objects.filter(is_current=True, group=group).values('paper_id')
                     ))
 
             if filter == 'start_date':
@@ -1054,12 +1230,10 @@ class PaperQuerySet(models.QuerySet):
                     faculty=item
                     if faculty in FACULTYNAMES:
                         faculty = faculty.upper()
-                        finalfilters['faculties'].append(Q(
-                            authorships__author__utdata__current_faculty=faculty
-                        ))
+                        memberships = PaperMembership.objects.filter(is_current=True, current_faculty=faculty)
                     else:
-                        authors = Author.objects.filter(utdata__isnull=False).filter(~Q(utdata__current_faculty__in=FACULTYNAMES)).select_related('utdata')
-                        finalfilters['faculties'].append(Q(authorships__author__in=authors))
+                        memberships = PaperMembership.objects.filter(is_current=True).filter(~Q(current_faculty__in=FACULTYNAMES))
+                    finalfilters['faculties'].append(Q(pk__in=memberships.values('paper_id')))
 
             if filter == 'taverne_passed':
                 date = datetime.today().strftime('%Y-%m-%d')
@@ -1094,55 +1268,25 @@ class PaperQuerySet(models.QuerySet):
         # returns a dict with stats for the papers in the current queryset
         # currently only used for the 'dbinfo' view
         stats = self.aggregate(
-            num=Count("id"),
-            numoa=Count("id", filter=Q(is_oa=True)),
-            numpure=Count("id", filter=Q(is_in_pure=True)),
-            numpurematch=Count("id", filter=Q(has_pure_oai_match=True)),
-            numarticles=Count("id", filter=Q(itemtype="journal-article")),
-            articlesinpure=Count(
-                "id", filter=Q(is_in_pure=True, itemtype="journal-article")
-            ),
-            articlesinpurematch=Count(
-                "id", filter=Q(has_pure_oai_match=True, itemtype="journal-article")
-            ),
-            numarticlesoa=Count("id", filter=Q(is_oa=True, itemtype="journal-article")),
-        )
-
-        stats["oa_percent"] = (
-            round((stats["numoa"] / stats["num"]) * 100, 2) if stats["num"] else 0
-        )
-        stats["numpure_percent"] = (
-            round((stats["numpure"] / stats["num"]) * 100, 2) if stats["num"] else 0
-        )
-        stats["oa_percent_articles"] = (
-            round((stats["numarticlesoa"] / stats["numarticles"]) * 100, 2)
-            if stats["numarticles"]
-            else 0
-        )
-        stats["articlesinpure_percent"] = (
-            round((stats["articlesinpure"] / stats["numarticles"]) * 100, 2)
-            if stats["numarticles"]
-            else 0
+            **{name: Count("id", filter=Q(**lookups) if lookups else None) for name, lookups in STATS_COUNTS.items()}
         )
-        stats["numpurematch_percent"] = (
-            round((stats["numpurematch"] / stats["num"]) * 100, 2)
-            if stats["num"]
-            else 0
-        )
-        stats["articlesinpurematch_percent"] = (
-            round((stats["articlesinpurematch"] / stats["numarticles"]) * 100, 2)
-            if stats["numarticles"]
-            else 0
-        )
-        return stats
+        return add_stats_percentages(stats)
 
     def get_csv(self, filters=[], papers=None, use_api=False):
-        if filters:
-            logger.info(f'Getting csv data using filters: {filters}')
-        else:
-            logger.info(f'Getting csv data for {papers.count()} papers')
+        '''
+        returns the csv export of stream_csv as a single string
+        '''
+        return ''.join(self.stream_csv(filters, papers, use_api))
+
+    def stream_csv(self, filters=[], papers=None, use_api=False, chunk_size=None):
+        '''
+        Returns a generator with the csv export for the papers, for use in a StreamingHttpResponse.
+        The papers are read & written in chunks, see csv_export.py.
+        '''
+        from .csv_export import CSV_CHUNK_SIZE, stream_api_csv, stream_csv
+        logger.info(f'Getting csv data using filters: {filters}')
 
-        if not papers:
+        if papers is None:
             papers =  self.filter_by(filters)
         else:
             papers = papers.filter_by(filters)
@@ -1164,161 +1308,21 @@ class PaperQuerySet(models.QuerySet):
         else:
             keys = CSV_EXPORT_KEYS
 
-        grouplist=list(set(grouplist))
+        chunk_size = chunk_size or CSV_CHUNK_SIZE
         if use_api:
-            from PureOpenAlex.serializers import serialize_as_list_of_dicts
-            papers = papers.prefetch_related('locations', 'locations__source','journal', 'journal__dealdata', 'pure_entries', 'authors', 'authors__utdata', 'authors__affils')
-            raw_data = serialize_as_list_of_dicts(papers)
-            keys = raw_data[0].keys()
-        else:
-            raw_data=papers.create_csv(grouplist, keys)
-
-        content = StringIO()
-        with content as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(raw_data)
-            return content.getvalue()
+            return stream_api_csv(papers, chunk_size)
+        return stream_csv(papers, keys, chunk_size)
 
     def create_csv(self, groups=None, keys=[]):
         '''
         Returns a list containing a dict with data for each paper in the current queryset.
         Not only data from the paper object -- also from related tables like authors, pure entries, etc.
+        The columns are filled using csv_export.CSV_COLUMNS.
         Param:
         groups: filter the groups included in the 'ut_groups' column. Defaults to 'None': all ut groups are shown.
         '''
-        from rich import print, inspect
-        data=[]
-        Journal = apps.get_model('PureOpenAlex', 'Journal')
-        Authorship = apps.get_model('PureOpenAlex', 'Authorship')
-        Author = apps.get_model('PureOpenAlex', 'Author')
-        PureEntry = apps.get_model('PureOpenAlex', 'PureEntry')
-        PilotPureData = apps.get_model('PureOpenAlex', 'PilotPureData')
-        UTData = apps.get_model('PureOpenAlex', 'UTData')
-
-        mus_url = 'https://openalex.samuelmok.cc/'
-        mus_api_url = 'https://openalex.samuelmok.cc/api/'
-        logger.info(f'Creating list with data for CSV for {self.count()} papers')
-        paperlist = self.all().distinct().prefetch_related('journal', 'authorships','authorships__author', 'authors', 'authors__utdata','pure_entries', 'pure_entries__pilot_pure_data', 'locations')
-        for paper in paperlist:
-            authors = paper.authors.all()
-            pure_entries = paper.pure_entries.all()
-            journal = paper.journal if paper.journal else ''
-            utauthors = [a for a in authors if hasattr(a,'utdata')]
-            authorgroups = [author.utdata.current_group for author in utauthors]
-            corresponding_authors = [authorship.author for authorship in paper.authorships.all()]
-            ut_corresponding_author = ' | '.join([author.name for author in corresponding_authors if hasattr(author,'utdata')])
-            best_oa, oa_list = paper.get_oa_links()
-            mapping = {}
-            for keyname in keys:
-                    if keyname == 'title':
-                        mapping[keyname] = paper.title
-                    if keyname == 'doi':
-                        mapping[keyname] = paper.doi
-                    if keyname == 'year':
-                        mapping[keyname] = paper.year
-                    if keyname == 'itemtype':
-                        mapping[keyname] = paper.itemtype
-                    if keyname == 'isbn':
-                        mapping[keyname] = pure_entries[0].isbn if pure_entries else ''
-                    if keyname == 'topics':
-                        mapping[keyname] = ' | '.join([topic.get('display_name') for topic in paper.topics]) if paper.topics else ''
-                    if keyname == 'Authorinfo ->':
-                        mapping[keyname] = ''
-                    if keyname == 'ut_authors':
-                        mapping[keyname] = ' | '.join([author.name for author in utauthors])
-                    if keyname == 'ut_groups':
-                        mapping[keyname] = ' | '.join(authorgroups) if authorgroups else ''
-                    '''
-                    if keyname == 'is_eemcs?':
-                        mapping[keyname] = paperauthors.filter(Q(utdata__current_faculty__iexact='EEMCS') | Q(utdata__employment_data__contains=[{'faculty':'EEMCS'}])).exists()
-                    if keyname == 'is_ee?':
-                        mapping[keyname] = paperauthors.filter(Q(utdata__current_group__in=EEGROUPSABBR)).exists() ,
-                    if keyname == 'is_tcs?':
-                        mapping[keyname] = paperauthors.filter(Q(utdata__current_group__in=TCSGROUPSABBR)).exists(),
-                    '''
-                    if keyname == 'ut_corresponding_author':
-                        mapping[keyname] = ut_corresponding_author if ut_corresponding_author != [] else ''
-                    if keyname == 'all_authors':
-                        mapping[keyname] = ' | '.join([author.name for author in authors])
-                    if keyname == 'Openaccessinfo ->':
-                        mapping[keyname] = ''
-                    if keyname == 'is_openaccess':
-                        mapping[keyname] = paper.is_oa
-                    if keyname == 'openaccess_type':
-                        mapping[keyname] = paper.openaccess
-                    if keyname == 'found_as_green':
-                        mapping[keyname] = paper.is_in_pure
-                    if keyname == 'present_in_pure':
-                        mapping[keyname] = paper.has_pure_oai_match
-                    if keyname == 'license':
-                        mapping[keyname] = paper.license
-                    if keyname == 'URLs ->':
-                        mapping[keyname] = ''
-                    if keyname == 'primary_link':
-                        mapping[keyname] = paper.primary_link
-                    if keyname == 'pdf_link_primary':
-                        mapping[keyname] = paper.pdf_link_primary
-                    if keyname == 'best_oa_link':
-                        mapping[keyname] = best_oa['landing_page_url']
-                    if keyname == 'pdf_link_best_oa':
-                        mapping[keyname] = best_oa['pdf_url']
-                    if keyname == 'other_oa_links':
-                        mapping[keyname] = ' | '.join(oa_list) if oa_list else ''
-                    if keyname == 'openalex_url':
-                        mapping[keyname] = paper.openalex_url
-                    if keyname == 'pure_page_link':
-                        mapping[keyname] = pure_entries[0].researchutwente if pure_entries else ''
-                    if keyname == 'pure_file_link':
-                        mapping[keyname] = pure_entries[0].risutwente if pure_entries else ''
-                    if keyname == 'scopus_link':
-                        mapping[keyname] = pure_entries[0].scopus if pure_entries else ''
-                    if keyname == 'Journalinfo ->':
-                        mapping[keyname] = ''
-                    if keyname == 'journal':
-                        mapping[keyname] = journal.name if journal else ''
-                    if keyname == 'journal_issn':
-                        mapping[keyname] = journal.issn if journal else ''
-                    if keyname == 'journal_e_issn':
-                        mapping[keyname] = journal.e_issn if journal else ''
-                    if keyname == 'journal_publisher':
-                        mapping[keyname] = journal.publisher if journal else ''
-                    if keyname == 'volume':
-                        mapping[keyname] = paper.volume
-                    if keyname == 'issue':
-                        mapping[keyname] = paper.issue
-                    if keyname == 'pages':
-                        mapping[keyname] = paper.pages
-                    if keyname == 'pagescount':
-                        mapping[keyname] = paper.pagescount
-                    if keyname == 'MUS links ->':
-                        mapping[keyname] = ''
-                    if keyname == 'mus_paper_details':
-                        mapping[keyname] = mus_url+'article/'+str(paper.id)
-                    if keyname == 'mus_api_url_paper':
-                        mapping[keyname] = mus_api_url+'paper/'+str(paper.id)
-
-            pureentrylist=''
-            pilotpuredatalist=''
-            if pure_entries:
-                for pure_entry in pure_entries:
-                    if pureentrylist != '':
-                        pureentrylist = ' | '.join([pureentrylist, mus_api_url+'pureentry/'+str(pure_entry.id)])
-                    else:
-                        pureentrylist = mus_api_url+'pureentry/'+str(pure_entry.id)
-                    if 'pilot_pure_data' in pure_entry.__dict__:
-                        if pilotpuredatalist != '':
-                            pilotpuredatalist = ' | '.join([pilotpuredatalist, mus_api_url+'pilotpure/'+str(pure_entry.pilot_pure_data.id)])
-                        else:
-                            pilotpuredatalist = mus_api_url+'pilotpure/'+str(pure_entry.pilot_pure_data.id)
-
-            mapping['mus_api_url_pure_entry']=pureentrylist
-            mapping['mus_api_url_pure_report_details']=pilotpuredatalist
-            data.append(mapping)
-
-
-
-        return data
+        from .csv_export import iter_csv_values
+        return [dict(zip(keys, values)) for values in iter_csv_values(self.distinct(), keys)]
 
     def exportris(self):
         '''
@@ -0,0 +1,83 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_memberships(apps, schema_editor):
+    Authorship = apps.get_model("PureOpenAlex", "Authorship")
+    PaperMembership = apps.get_model("PureOpenAlex", "PaperMembership")
+    rows = set()
+    values = Authorship.objects.filter(author__utdata__isnull=False).values_list(
+        "paper_id", "author_id", "author__utdata__current_group", "author__utdata__current_faculty",
+        "author__utdata__employment_data")
+    for paper_id, author_id, current_group, current_faculty, employment_data in values.iterator(chunk_size=5000):
+        rows.add((paper_id, author_id, current_group, current_faculty, current_faculty, True))
+        if isinstance(employment_data, list):
+            for entry in employment_data:
+                if isinstance(entry, dict) and (entry.get("group") or entry.get("faculty")):
+                    rows.add((paper_id, author_id, entry.get("group"), entry.get("faculty"), current_faculty, False))
+    PaperMembership.objects.bulk_create(
+        [PaperMembership(paper_id=paper_id, author_id=author_id, group=group, faculty=faculty,
+                         current_faculty=current_faculty, is_current=is_current)
+         for paper_id, author_id, group, faculty, current_faculty, is_current in rows],
+        batch_size=5000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PureOpenAlex", "0045_pureentry_checked_for_match"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaperMembership",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("group", models.CharField(blank=True, max_length=256, null=True)),
+                ("faculty", models.CharField(blank=True, max_length=256, null=True)),
+                (
+                    "current_faculty",
+                    models.CharField(blank=True, max_length=256, null=True),
+                ),
+                ("is_current", models.BooleanField(default=True)),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="paper_memberships",
+                        to="PureOpenAlex.author",
+                    ),
+                ),
+                (
+                    "paper",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="memberships",
+                        to="PureOpenAlex.paper",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["group", "is_current", "paper"],
+                        name="PureOpenAle_group_ac7ed2_idx",
+                    ),
+                    models.Index(
+                        fields=["current_faculty", "is_current", "paper"],
+                        name="PureOpenAle_current_d28c02_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("PureOpenAlex", "0046_papermembership"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="paper",
+            index=models.Index(
+                fields=["year", "id"], name="PureOpenAle_year_83cb7c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paper",
+            index=models.Index(
+                fields=["date", "id"], name="PureOpenAle_date_d39d88_idx"
+            ),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django_extensions.db.models import TimeStampedModel
-from .managers import PaperQuerySet, PaperManager, JournalManager, PureEntryManager, AuthorManager, AuthorQuerySet
+from .managers import PaperQuerySet, PaperManager, JournalManager, PureEntryManager, AuthorManager, AuthorQuerySet, PaperMembershipManager
 
 class Organization(models.Model):
     name = models.CharField(max_length=256)
@@ -235,6 +235,9 @@ class Paper(TimeStampedModel, models.Model):
                                 'openaccess',
                                 'date',
                                 ]),
+            # keyset pagination of the paper tables, see PaperQuerySet.get_table_page
+            models.Index(fields=["year", "id"]),
+            models.Index(fields=["date", "id"]),
         ]
 
 
@@ -255,6 +258,26 @@ class Authorship(models.Model):
                                 ]),
         ]
 
+class PaperMembership(models.Model):
+    # denormalised paper -> ut group/faculty membership, one row per paper, ut author and group/faculty
+    # kept in sync by PaperMembership.objects.refresh() (see signals.py); used by Paper.objects.filter_by
+    paper = models.ForeignKey(
+        Paper, on_delete=models.CASCADE, related_name="memberships"
+    )
+    author = models.ForeignKey(
+        Author, on_delete=models.CASCADE, related_name="paper_memberships"
+    )
+    group = models.CharField(max_length=256, blank=True, null=True)
+    faculty = models.CharField(max_length=256, blank=True, null=True)
+    current_faculty = models.CharField(max_length=256, blank=True, null=True)
+    is_current = models.BooleanField(default=True) # True: current_group/faculty of the author, False: from employment_data
+    objects = PaperMembershipManager()
+    class Meta:
+        indexes = [
+            models.Index(fields=["group", "is_current", "paper"]),
+            models.Index(fields=["current_faculty", "is_current", "paper"]),
+        ]
+
 class viewPaper(TimeStampedModel, models.Model):
     from django.conf import settings
     displayed_paper = models.ForeignKey(
@@ -0,0 +1,70 @@
+import copy
+
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import Authorship, DBUpdate, Paper, PaperMembership, UTData
+from .stats import invalidate_stats
+
+# keeps PaperMembership in sync with single authorship/utdata changes, and invalidates the cached stats on a DBUpdate
+# bulk operations (bulk_create, queryset.update/delete) don't send signals: call PaperMembership.objects.refresh()
+# afterwards, or run 'python manage.py refreshmemberships'
+# imports that add many authorships/utdata one by one should run inside PaperMembership.objects.deferred()
+
+# the UTData fields used in the PaperMembership rows
+UTDATA_MEMBERSHIP_FIELDS = ('current_group', 'current_faculty', 'employment_data')
+
+
+NOT_LOADED = object()
+
+
+def get_utdata_membership_values(instance):
+    # deferred fields are not loaded here, they count as changed
+    return tuple(copy.deepcopy(instance.__dict__[field]) if field in instance.__dict__ else NOT_LOADED
+                 for field in UTDATA_MEMBERSHIP_FIELDS)
+
+
+@receiver(post_init, sender=UTData)
+def store_utdata_membership_values(sender, instance, **kwargs):
+    instance._membership_values = get_utdata_membership_values(instance)
+
+
+@receiver(post_save, sender=UTData)
+def refresh_utdata_memberships(sender, instance, created, **kwargs):
+    values = get_utdata_membership_values(instance)
+    unchanged = not created and values == instance._membership_values and NOT_LOADED not in values
+    instance._membership_values = values
+    if unchanged or not instance.employee_id or PaperMembership.objects.is_deferred():
+        return
+    PaperMembership.objects.refresh(author_ids=[instance.employee_id])
+
+
+@receiver(post_delete, sender=UTData)
+def refresh_deleted_utdata_memberships(sender, instance, **kwargs):
+    if instance.employee_id and not PaperMembership.objects.is_deferred():
+        PaperMembership.objects.refresh(author_ids=[instance.employee_id])
+
+
+@receiver(post_save, sender=Authorship)
+@receiver(post_delete, sender=Authorship)
+def refresh_authorship_memberships(sender, instance, **kwargs):
+    if PaperMembership.objects.is_deferred():
+        return
+    PaperMembership.objects.refresh(paper_ids=[instance.paper_id], author_ids=[instance.author_id])
+
+
+@receiver(m2m_changed, sender=Paper.authors.through)
+def refresh_paper_author_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    # paper.authors.add/remove/clear() or author.papers.add/remove/clear()
+    if action not in ('post_add', 'post_remove', 'post_clear') or PaperMembership.objects.is_deferred():
+        return
+    if reverse:
+        PaperMembership.objects.refresh(author_ids=[instance.pk])
+    else:
+        PaperMembership.objects.refresh(paper_ids=[instance.pk])
+
+
+@receiver(post_save, sender=DBUpdate)
+def invalidate_dbupdate_stats(sender, instance, created, **kwargs):
+    if created:
+        invalidate_stats()
@@ -0,0 +1,39 @@
+import time
+
+from django.core.cache import cache
+from loguru import logger
+
+from .models import PaperMembership
+
+# cached dashboard stats; the version is set to the current time for each new DBUpdate (see signals.py), so the
+# cached stats are recalculated after every database update. Change STATS_KEY when the format of the stats changes.
+STATS_KEY = 'mus:faculty_stats:1'
+STATS_VERSION_KEY = 'mus:faculty_stats_version'
+STATS_TIMEOUT = 60 * 60 * 24
+
+
+def get_stats_version():
+    version = cache.get(STATS_VERSION_KEY)
+    if version is None:
+        cache.add(STATS_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(STATS_VERSION_KEY)
+    return version
+
+
+def invalidate_stats():
+    cache.set(STATS_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_faculty_stats(use_cache=True):
+    '''
+    returns {faculty: stats} for all faculties & 'Other groups', see PaperMembershipManager.get_faculty_stats
+    '''
+    if not use_cache:
+        return PaperMembership.objects.get_faculty_stats()
+    version = get_stats_version()
+    stats = cache.get(STATS_KEY, version=version)
+    if stats is None:
+        logger.info('calculating faculty stats [version] {}', version)
+        stats = PaperMembership.objects.get_faculty_stats()
+        cache.set(STATS_KEY, stats, timeout=STATS_TIMEOUT, version=version)
+    return stats
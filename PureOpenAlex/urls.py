@@ -21,6 +21,7 @@ from .views import (
     getcsv,
     viewlog,
     oa_chart,
+    table_data,
 )
 
 app_name = "PureOpenAlex"
@@ -50,5 +51,6 @@ urlpatterns = [
     path('oachart/', oa_chart, name='oachart'),
     path('affiliations/<int:author_id>/', load_affils, name='affiliations'),
     path('log/<str:file>', viewlog, name='viewlog'),
+    path('tabledata/', table_data, name='tabledata'),
 
 ]
@@ -1,5 +1,8 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+import json
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from .models import Paper, viewPaper, Author
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
@@ -7,7 +10,7 @@ from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
 from .data_add import addPaper
-from .data_view import generateMainPage, getPapers, getAuthorPapers, open_alex_autocomplete, get_raw_data, generate_chart, read_log, generate_oa_chart
+from .data_view import generateMainPage, getPapers, getPaperQuerySet, getAuthorPapers, open_alex_autocomplete, get_raw_data, generate_chart, read_log, generate_oa_chart
 from django.conf import settings
 from .data_helpers import processDOI
 from django.views.decorators.cache import cache_page
@@ -34,7 +37,6 @@ CACHE_TTL = getattr(settings, "CACHE_TTL", DEFAULT_TIMEOUT)
 
 # TODO: proper update bookmark count on frontend
 # TODO: fix filtertable not working more than once
-# TODO: add serverside rendering of tables? paginate, filter, sort
 # TODO: get from apis: worldcat, semanticscholar, scopus, opencitations, orcid, zenodo, CORE/BASE
 
 # TODO: easy/quick open or view pdf(s)
@@ -175,7 +177,8 @@ def faculty(request, name="all", filter="all"):
     response = render(
         request,
         "faculty.html",
-        {"faculty": facultyname, "stats": stats, "articles": listpapers, "filter":filter},
+        {"faculty": facultyname, "stats": stats, "filter":filter,
+         "table_params": make_table_params(name, filter, stats)},
     )
 
     return response
@@ -187,20 +190,72 @@ def author(request, name):
     Returns a table with all papers for a specific author. Uses the same logic as the faculty views. Another convenience function.
     '''
     try:
-        _, stats, listpapers = getAuthorPapers(name, request.user)
+        _, stats, _ = getAuthorPapers(name, request.user)
+        table_params = make_table_params(name, 'author', stats)
     except ObjectDoesNotExist:
         name = "Author {} not found" % name
         stats = {}
-        listpapers = []
+        table_params = None
 
     logger.info("[url] /authorarticles/{} [user] {}", name, request.user.username)
     response = render(
     request,
     "faculty.html",
-    {"faculty": name, "stats": stats, "articles": listpapers},)
+    {"faculty": name, "stats": stats, "articles": [], "table_params": table_params},)
     return response
 
 
+def make_table_params(name, filter, stats=None):
+    '''
+    the parameters for the server-side paper table in faculty_table.html, see table_data
+    '''
+    return {
+        "url": reverse('PureOpenAlex:tabledata'),
+        "name": name,
+        "filter": filter,
+        "total": stats.get('num') if stats else None,
+    }
+
+
+@login_required
+def table_data(request):
+    '''
+    Returns a single page of a paper table as json for the DataTables server-side mode (see faculty_table.html):
+    {'draw', 'recordsTotal', 'recordsFiltered', 'next', 'html'}
+    name & filter are the same as for getPapers; the page is found using the cursor in 'after' (the 'next' value of
+    the previous page) if given, otherwise by offset 'start'.
+    'total' is the total number of papers if known by the client, it is only counted if missing.
+    '''
+    if request.method != "POST":
+        return JsonResponse({"error": "POST required"}, status=405)
+    try:
+        name = request.POST.get('name', 'all')
+        filter = json.loads(request.POST.get('filter') or '"all"')
+        order = request.POST.get('order', '-year')
+        start = max(int(request.POST.get('start', 0)), 0)
+        length = min(max(int(request.POST.get('length', 50)), 1), 500)
+        search = request.POST.get('search', '').strip()
+        total = request.POST.get('total', '')
+        _, papers, filter = getPaperQuerySet(name, filter, request.user)
+        papers = papers.filter_by(filter)
+        page, next_cursor = papers.get_table_page(request.user, order=order, after=request.POST.get('after'),
+                                                  start=start, length=length, search=search)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if total == '':
+        if search:
+            papers = papers.filter(Q(title__icontains=search) | Q(doi__icontains=search))
+        total = papers.count()
+    logger.info("table_data [name] {} [order] {} [start] {} [user] {}", name, order, start, request.user.username)
+    return JsonResponse({
+        "draw": int(request.POST.get('draw', 0)),
+        "recordsTotal": int(total),
+        "recordsFiltered": int(total),
+        "next": next_cursor,
+        "html": render_to_string("faculty_table_rows.html", {"articles": page}, request=request),
+    })
+
+
 @transaction.atomic
 @login_required
 def removemark(request, id="all"):
@@ -295,16 +350,15 @@ def getcsv(request):
     if not filters:
         filters='marked papers'
 
-    logger.info("getcsv [# papers] {} [filters] {} [user] {}", articles.count(), filters, request.user.username)
+    logger.info("getcsv [filters] {} [user] {}", filters, request.user.username)
 
-    csvfile = articles.get_csv(papers=articles)
+    # streamed in chunks of papers: the first rows are sent right away & large exports are never fully in memory
+    csvstream = articles.stream_csv(papers=articles)
     contentdisp = f'attachment; filename="mus_csv_export_{user.username}_{datetime.now().strftime("%Y-%m-%d")}.csv"'
-    response = HttpResponse(csvfile, headers={
+    response = StreamingHttpResponse(csvstream, headers={
         "Content-Type": 'text/csv',
         "Content-Disposition": contentdisp,
     })
-    #for debugging the query:
-    #response = render(request, "csv.html", {"csvfile": csvfile, "contentdisp": contentdisp})
 
     return response
 
@@ -400,8 +454,9 @@ def customfilter(request):
                             filters.append(['end_date',"-".join([str(request.POST['year_end']),month,'01'])])
 
         logger.info("customfilter [filters] {} [user] {}",filters, request.user.username)
-        facultyname, stats, listpapers = getPapers('all', filters, request.user)
-        return render(request, "faculty_table.html",{"faculty": facultyname, "stats": stats, "articles": listpapers, "filter":filters})
+        facultyname, stats, _ = getPapers('all', filters, request.user)
+        return render(request, "faculty_table.html",{"faculty": facultyname, "stats": stats, "filter":filters,
+                                                     "table_params": make_table_params('all', filters, stats)})
 
 @login_required
 def load_affils(request,author_id):
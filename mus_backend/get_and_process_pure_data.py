@@ -1,12 +1,12 @@
 from loguru import logger
 from django.conf import settings
 from pymongo import MongoClient
-import xmltodict
 from rich import print
 import csv
 from collections import defaultdict
 from datetime import datetime
 import PureOpenAlex.constants
+from mus_wizard.harvester.cerif_lxml import ListRecordsParser
 
 
 MONGOURL = getattr(settings, "MONGOURL")
@@ -123,44 +123,57 @@ IMPORT CERIF XML
 '''
 # export pure CERIF xml, use importpurexml to import
 # when done it calls functions to process the data further into separate mongo collections
-def importpurexml(file='eemcs_output_2023_2024q1cerif.xml', replace=False):
+def importpurexml(file='eemcs_output_2023_2024q1cerif.xml', replace=False, batch_size=1000):
     '''
     this reads in a pure cerif xml export file containing research products
+    the file is streamed with lxml iterparse, so only a single record (+ the current batch) is kept in memory
     '''
     logger.info(f'importing from cerif xml file {file}')
 
-    with open(file, encoding='utf-8') as f:
-        xmldict = xmltodict.parse(f.read())
-    recordlist = xmldict.get('OAI-PMH').get('ListRecords').get('record')
-    recordlist = [entry['metadata'] for entry in recordlist]
-    logger.info(f'found {len(recordlist)} records in {file}, sorting by type')
-    products = [entry.get('cerif:Product') for entry in recordlist if entry.get('cerif:Product')]
-    patents = [entry.get('cerif:Patent') for entry in recordlist if entry.get('cerif:Patent')]
-    publications = [entry.get('cerif:Publication') for entry in recordlist if entry.get('cerif:Publication')]
     if not replace:
-        logger.info('removing already imported records')
-        ids=[]
-        for item in mongo_pure_xmls.find({'@id':True}):
-            ids.append(item.get('@id'))
-        products = [p for p in products if p.get('@id') not in ids]
-        patents = [p for p in patents if p.get('@id') not in ids]
-        publications = [p for p in publications if p.get('@id') not in ids]
-        logger.info(f'after removing duplicates: importing {len(products)} products, {len(patents)} patents, {len(publications)} publications to collection pure_xmls')
+        logger.info('skipping already imported records')
+        ids = {item.get('@id') for item in mongo_pure_xmls.find({}, projection={'@id': True}) if item.get('@id')}
     else:
-        logger.info('replace=True: removing records from collection if @id matches with @id in recordlist')
-        ids = [p.get('@id') for p in recordlist]
-        logger.info(f'found {len(ids)} ids in recordlist, removing from collection if present')
-        for item in mongo_pure_xmls.find({'@id':True}):
+        logger.info('replace=True: removing records from collection if @id matches with @id of an imported record')
+        ids = set()
+
+    counts = defaultdict(int)
+    batch = []
+
+    def insert_batch():
+        if replace:
+            try:
+                mongo_pure_xmls.delete_many({'@id': {'$in': [item.get('@id') for item in batch]}})
+            except Exception as e:
+                logger.warning(f'error removing existing records from collection: {e}')
+        mongo_pure_xmls.insert_many(batch)
+        batch.clear()
+
+    parser = ListRecordsParser()
+    for record in parser.iter_records(file):
+        metadata = record.get('metadata')
+        if not isinstance(metadata, dict):
+            continue
+        counts['records'] += 1
+        for itemtype in ['cerif:Product', 'cerif:Patent', 'cerif:Publication']:
+            item = metadata.get(itemtype)
+            if not item:
+                continue
             if item.get('@id') in ids:
-                try:
-                    mongo_pure_xmls.delete_one({'@id':item.get('@id')})
-                except Exception as e:
-                    logger.warning(f'error removing {item.get("@id")} from collection: {e}')
-
-    mongo_pure_xmls.insert_many(products) if products else None
-    mongo_pure_xmls.insert_many(patents) if patents else None
-    mongo_pure_xmls.insert_many(publications) if publications else None
-    if any([products, patents, publications]):
+                counts['skipped'] += 1
+                continue
+            ids.add(item.get('@id'))
+            counts[itemtype] += 1
+            batch.append(item)
+        if len(batch) >= batch_size:
+            insert_batch()
+    if batch:
+        insert_batch()
+
+    logger.info(f'found {counts["records"]} records in {file}, skipped {counts["skipped"]} already imported records. '
+                f'imported {counts["cerif:Product"]} products, {counts["cerif:Patent"]} patents, '
+                f'{counts["cerif:Publication"]} publications to collection pure_xmls')
+    if any([counts['cerif:Product'], counts['cerif:Patent'], counts['cerif:Publication']]):
         process_data_from_pure_xmls()
         process_pure_uuids_works()
         process_pure_uuids_authors()
@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from PureOpenAlex.models import Paper
+from PureOpenAlex.views import faculty, single_article, table_data
+
+class Command(BaseCommand):
+    help = 'Counts the sql queries and measures the time of the single article and paper table views, fails if a view uses more than --max-queries queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=str, default=None, help='username to render the views for, defaults to the first superuser')
+        parser.add_argument('--paper', type=int, default=None, help='paper id for the single article view, defaults to the most recent paper')
+        parser.add_argument('--faculty', type=str, default='EEMCS', help='faculty for the table views')
+        parser.add_argument('--repeat', type=int, default=3, help='number of runs per view, the fastest run is reported')
+        parser.add_argument('--max-queries', type=int, default=None, help='max number of queries per view')
+
+    def handle(self, *args, **kwargs):
+        User = get_user_model()
+        if kwargs['user']:
+            user = User.objects.get(username=kwargs['user'])
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if not user:
+            raise CommandError('no user found, pass --user')
+        paper_id = kwargs['paper'] or Paper.objects.order_by('-year', '-id').values_list('id', flat=True).first()
+        factory = RequestFactory()
+
+        def make_request(method, path, data=None):
+            # the views are called directly, with the user set on the request instead of logging in
+            request = getattr(factory, method)(path, data)
+            request.user = user
+            request._dont_enforce_csrf_checks = True
+            return request
+
+        table_params = {'name': kwargs['faculty'], 'filter': json.dumps('all'), 'order': '-year', 'start': 0,
+                        'length': 50, 'draw': 1}
+        views = {
+            'single_article': lambda: single_article(make_request('get', f'/article/{paper_id}/'), paper_id),
+            'faculty': lambda: faculty(make_request('get', f'/faculty/{kwargs["faculty"]}/'), kwargs['faculty']),
+            'table_data (first page)': lambda: table_data(make_request('post', '/tabledata/', table_params)),
+        }
+
+        failed = []
+        for name, view in views.items():
+            timings = []
+            for _ in range(kwargs['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = view()
+                    timings.append(time.perf_counter() - start)
+            num_queries = len(queries.captured_queries)
+            print(f'{name:<25} status {response.status_code} | {num_queries:>4} queries | {min(timings) * 1000:>8.1f} ms')
+            if kwargs['max_queries'] is not None and num_queries > kwargs['max_queries']:
+                failed.append(f'{name}: {num_queries} queries')
+        if failed:
+            raise CommandError(f'more than {kwargs["max_queries"]} queries for {", ".join(failed)}')
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from PureOpenAlex.models import PaperMembership
+
+class Command(BaseCommand):
+    help = 'Rebuild the PaperMembership table (paper -> ut group/faculty) used by Paper.objects.filter_by'
+
+    def handle(self, *args, **kwargs):
+        rows = PaperMembership.objects.refresh()
+        print(f'{rows} paper memberships written')
@@ -1,12 +1,13 @@
 from collections import defaultdict
 from django.conf import settings
 from loguru import logger
-from PureOpenAlex.models import DBUpdate, Paper, Author, Journal, UTData, PureEntry, Location, DealData, viewPaper
+from PureOpenAlex.models import DBUpdate, Paper, Author, Journal, UTData, PureEntry, Location, DealData, viewPaper, PaperMembership
 from .get_from_api import getCrossrefWorks, getOpenAlexWorks, getOpenAlexAuthorData, getDataCiteItems, getPureItems, addItemsFromOpenAire
 from .get_from_file import getfrompurereport, getdblp
 from .get_from_scraper import fillJournalData, fillUTPeopleData
 from PureOpenAlex.data_add import addOpenAlexWorksFromMongo, addPureWorksFromMongo, addOpenAireWorksFromMongo
 from PureOpenAlex.data_view import get_oa_chart_data
+from PureOpenAlex.stats import invalidate_stats
 from django.db.models import Q
 from pymongo import DeleteOne,MongoClient
 from pymongo.collection import Collection
@@ -160,17 +161,26 @@ def update_all(clean=False, people=False, get_dbupdates=False):
             updatedata=dbupdate.details
             if len(updatedata['dois'])>0:
                 processpapers['works'].extend(updatedata['dois'])
-    processpapers = update_works(years, processpapers)
-    processpapers = update_pure_items(years, processpapers)
+    # the imports add authorships & utdata one by one: don't rebuild the memberships for each of them,
+    # rebuild the full table once afterwards
+    with PaperMembership.objects.deferred(refresh=True):
+        processpapers = update_works(years, processpapers)
+        processpapers = update_pure_items(years, processpapers)
     logger.info('done with updateAll()')
 
     logger.info('gathering chartdata')
     get_oa_chart_data()
     logger.info('done gathering chartdata')
-    if clean:
-        logger.info('clean = True, running cleandb()')
-        clean_all()
-    if people:
-        logger.info('people = True, running update_people_page_data()')
-        update_people_page_data()
-        logger.info('done running update_people_page_data()')
\ No newline at end of file
+    if clean or people:
+        with PaperMembership.objects.deferred():
+            if clean:
+                logger.info('clean = True, running cleandb()')
+                clean_all()
+            if people:
+                logger.info('people = True, running update_people_page_data()')
+                update_people_page_data()
+                logger.info('done running update_people_page_data()')
+        # signals only cover single changes and are deferred above, rebuild after the updates
+        logger.info('rebuilding paper memberships')
+        PaperMembership.objects.refresh()
+    invalidate_stats()
\ No newline at end of file
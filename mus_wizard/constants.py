@@ -18,6 +18,7 @@ ORCID_CLIENT_SECRET = str(os.getenv('ORCID_CLIENT_SECRET'))
 ORCID_ACCESS_TOKEN = os.getenv('ORCID_ACCESS_TOKEN')
 APIEMAIL = str(os.getenv('APIEMAIL'))
 OPENAIRETOKEN = str(os.getenv('OPENAIRETOKEN'))
+OPENALEX_API_KEY = os.getenv('OPENALEX_API_KEY')  # optional; needed for the from_updated_date filter (incremental harvests)
 
 # IDs, names, groups, URLS for current main institute/uni/...
 
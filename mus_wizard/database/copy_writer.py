@@ -0,0 +1,159 @@
+'''
+Fast path for writing large numbers of model instances to PostgreSQL using COPY ... FROM STDIN.
+
+abulk_create sends the rows as (batched) INSERT statements; COPY streams them in psycopg's binary copy format, which
+is many times faster for big tables such as Work, Authorship, Location and the m2m through tables.
+
+- the pks of new items are reserved up front from the table's sequence, so the items have their pk after writing
+  (needed for the m2m rows that refer to them), just like after abulk_create
+- key_field set: the rows are copied into a temporary staging table and merged into the table: rows with a new key are
+  inserted, existing rows are updated if update_existing is set, and the items get the pk of the existing row
+- ignore_conflicts: rows are copied into a staging table and inserted with ON CONFLICT DO NOTHING (for through tables)
+- otherwise: rows are copied into the table directly
+
+usage:
+    writer = CopyWriter(Work, key_field='openalex_id')
+    await writer.awrite(works)  # works now have their pk set
+    await CopyWriter(Work.topics.through, ignore_conflicts=True).awrite(rows)
+'''
+
+import re
+from typing import Type
+
+from asgiref.sync import sync_to_async
+from django.db import connection, models, transaction
+from psycopg import sql
+
+
+class CopyWriter:
+    def __init__(self, model: Type[models.Model], key_field: str = None, update_existing: bool = False,
+                 ignore_conflicts: bool = False, binary: bool = True, batch_size: int = 10000) -> None:
+        '''
+        model: the model to write instances of
+        key_field: unique id field to merge on (e.g. 'openalex_id'); it does not need a unique constraint
+        update_existing: update rows that have the same key_field value, only used with key_field
+        ignore_conflicts: skip rows that violate a unique constraint
+        binary: use the binary copy format, text format otherwise
+        batch_size: suggested number of items per awrite() call
+        '''
+        self.model: Type[models.Model] = model
+        self.key_field: str | None = key_field
+        self.update_existing: bool = update_existing
+        self.ignore_conflicts: bool = ignore_conflicts
+        self.binary: bool = binary
+        self.batch_size: int = batch_size
+        self.table: str = model._meta.db_table
+        self.fields: list[models.Field] = list(model._meta.concrete_fields)
+        self.pk_field: models.Field = model._meta.pk
+        self.results: dict[str, int] = {'copied': 0, 'inserted': 0, 'updated': 0, 'existing': 0}
+
+    def db_types(self) -> list[str]:
+        '''
+        postgres type names of the columns, for psycopg's binary copy (without length modifiers, e.g. varchar(200))
+        '''
+        serial_types = {'smallserial': 'smallint', 'serial': 'integer', 'bigserial': 'bigint'}
+        db_types = [re.sub(r'\(.*\)', '', field.db_type(connection)).strip() for field in self.fields]
+        return [serial_types.get(db_type, db_type) for db_type in db_types]
+
+    def rows(self, items: list[models.Model]):
+        for item in items:
+            yield tuple(field.get_db_prep_save(field.pre_save(item, True), connection) for field in self.fields)
+
+    def reserve_pks(self, cursor, items: list[models.Model]) -> None:
+        '''
+        sets the pk of items without one using nextval on the pk sequence of the table
+        '''
+        new_items = [item for item in items if item.pk is None]
+        if not new_items:
+            return
+        cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                       [self.table, self.pk_field.column, len(new_items)])
+        for item, (pk,) in zip(new_items, cursor.fetchall()):
+            item.pk = pk
+
+    def copy(self, cursor, table: str, items: list[models.Model]) -> None:
+        columns = sql.SQL(', ').join(sql.Identifier(field.column) for field in self.fields)
+        statement = sql.SQL('COPY {} ({}) FROM STDIN {}').format(
+            sql.Identifier(table), columns, sql.SQL('(FORMAT BINARY)' if self.binary else ''))
+        with cursor.copy(statement) as copy:
+            if self.binary:
+                copy.set_types(self.db_types())
+            for row in self.rows(items):
+                copy.write_row(row)
+        self.results['copied'] += len(items)
+
+    def merge(self, cursor, staging: str, items: list[models.Model]) -> None:
+        table = sql.Identifier(self.table)
+        staging = sql.Identifier(staging)
+        pk = sql.Identifier(self.pk_field.column)
+        columns = sql.SQL(', ').join(sql.Identifier(field.column) for field in self.fields)
+        if not self.key_field:
+            cursor.execute(sql.SQL('INSERT INTO {} ({}) SELECT {} FROM {} ON CONFLICT DO NOTHING').format(
+                table, columns, columns, staging))
+            self.results['inserted'] += cursor.rowcount
+            return
+
+        key_column = self.model._meta.get_field(self.key_field).column
+        key = sql.Identifier(key_column)
+        # point the items at the existing rows
+        cursor.execute(sql.SQL('SELECT DISTINCT ON (t.{key}) t.{key}, t.{pk} FROM {table} t JOIN {staging} s '
+                               'ON t.{key} = s.{key} ORDER BY t.{key}, t.{pk}').format(
+            key=key, pk=pk, table=table, staging=staging))
+        existing = dict(cursor.fetchall())
+        for item in items:
+            if getattr(item, self.key_field) in existing:
+                item.pk = existing[getattr(item, self.key_field)]
+        self.results['existing'] += len(existing)
+
+        if self.update_existing and existing:
+            updated_columns = sql.SQL(', ').join(
+                sql.SQL('{} = s.{}').format(sql.Identifier(field.column), sql.Identifier(field.column))
+                for field in self.fields if not field.primary_key and field.column != key_column)
+            cursor.execute(sql.SQL('UPDATE {table} t SET {columns} FROM {staging} s WHERE t.{key} = s.{key}').format(
+                table=table, columns=updated_columns, staging=staging, key=key))
+            self.results['updated'] += cursor.rowcount
+
+        cursor.execute(sql.SQL('INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} s '
+                               'WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = s.{key})').format(
+            table=table, columns=columns, staging=staging, key=key))
+        self.results['inserted'] += cursor.rowcount
+
+    def write(self, items: list[models.Model]) -> list[models.Model]:
+        '''
+        writes items in a single transaction, see module docstring
+        returns items, with their pks set
+        '''
+        if not items:
+            return items
+        if self.key_field:
+            # one item per key, the first one wins
+            unique_items = {}
+            for item in items:
+                unique_items.setdefault(getattr(item, self.key_field), item)
+            items_to_copy = list(unique_items.values())
+        else:
+            items_to_copy = items
+
+        with transaction.atomic():
+            connection.ensure_connection()
+            with connection.connection.cursor() as cursor:
+                self.reserve_pks(cursor, items_to_copy)
+                if not self.key_field and not self.ignore_conflicts:
+                    self.copy(cursor, self.table, items_to_copy)
+                    self.results['inserted'] += len(items_to_copy)
+                else:
+                    staging = f'{self.table}_staging'
+                    cursor.execute(sql.SQL('CREATE TEMPORARY TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP').format(
+                        sql.Identifier(staging), sql.Identifier(self.table)))
+                    self.copy(cursor, staging, items_to_copy)
+                    self.merge(cursor, staging, items_to_copy)
+
+        if self.key_field:
+            # duplicates get the pk of the item that was written
+            for item in items:
+                if item.pk is None:
+                    item.pk = unique_items[getattr(item, self.key_field)].pk
+        return items
+
+    async def awrite(self, items: list[models.Model]) -> list[models.Model]:
+        return await sync_to_async(self.write)(items)
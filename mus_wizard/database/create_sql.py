@@ -2,20 +2,24 @@
 The logic for creating the SQL entries from the MongoDB data will be put here
 """
 from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime
 
 import asyncio
 import motor.motor_asyncio
 import pytz
+from django.db import transaction
 from nameparser import HumanName
 from rich import print
 
 from mus_wizard.constants import (FACULTYNAMES, MONGOURL, OPENALEX_INSTITUTE_ID, get_flat_groups)
-from mus_wizard.harvester.base_classes import GenericSQLImport
+from mus_wizard.database.db_pool import DBWorkerPool
+from mus_wizard.database.import_scheduler import ImportStage, StageScheduler
+from mus_wizard.harvester.base_classes import ForeignKeyResolver, GenericSQLImport, make_projection
 from mus_wizard.models import (Abstract, Affiliation, Author, Authorship, CrossrefData, DataCiteData, DealData, Funder,
                                Grant, Group, Location, MongoData, MusModel, OpenAireData, Organization,
                                OrganizationTopic, Publisher, RepositoryData, Source, SourceTopic, Tag, Topic, Work)
-from mus_wizard.utils import parse_reversed_abstract
+from mus_wizard.utils import reconstruct_abstract
 
 timezone = pytz.utc
 motorclient: motor.motor_asyncio.AsyncIOMotorClient = motor.motor_asyncio.AsyncIOMotorClient(MONGOURL).metadata_unification_system
@@ -24,8 +28,53 @@ motorclient: motor.motor_asyncio.AsyncIOMotorClient = motor.motor_asyncio.AsyncI
 # do something with missing items
 # implement links to cerif data and others
 
+
+def make_fk_resolvers(max_size: int = 500_000) -> dict[str, ForeignKeyResolver]:
+    '''
+    the openalex_id -> pk caches shared by the importers, see ForeignKeyResolver
+    max_size: max number of cached ids per model
+    '''
+    return {
+        'author'      : ForeignKeyResolver(Author, max_size=max_size),
+        'organization': ForeignKeyResolver(Organization, max_size=max_size),
+        'funder'      : ForeignKeyResolver(Funder, max_size=max_size),
+        'source'      : ForeignKeyResolver(Source, fields=('source_type',), max_size=max_size),
+        'topic'       : ForeignKeyResolver(Topic, max_size=max_size),
+    }
+
+
+# the Work fields that are set from the openalex data in ImportWork.add_item; updated by the incremental sync
+WORK_UPDATE_FIELDS = ['openalex_created_date', 'openalex_updated_date', 'ngrams_url', 'cited_by_api_url', 'cited_by_count',
+                      'cited_by_percentile_year', 'referenced_works_count', 'doi', 'title', 'publication_year',
+                      'publication_date', 'pmid', 'pmcid', 'isbn', 'mag', 'language', 'mesh_terms', 'type_crossref',
+                      'volume', 'issue', 'first_page', 'last_page', 'locations_count', 'is_oa', 'oa_status', 'oa_url',
+                      'is_also_green', 'itemtype', 'apc_listed', 'apc_paid', 'has_fulltext', 'is_paratext',
+                      'is_retracted', 'indexed_in', 'keywords', 'sdgs', 'versions']
+
+
+@dataclass
+class WorkRelations:
+    '''
+    the related objects of a chunk of works, built by ImportWork.build_m2m_chunk and written by write_m2m_chunk
+    '''
+    abstracts: list[tuple[Work, Abstract]] = field(default_factory=list)
+    updated_works: list[Work] = field(default_factory=list)
+    topic_rows: list = field(default_factory=list)
+    authorships: list[tuple[Authorship, list[int]]] = field(default_factory=list)
+    grants: list[Grant] = field(default_factory=list)
+    locations: list[tuple[Work, Location]] = field(default_factory=list)
+
+
 class CreateSQL:
-    def __init__(self, detailed_topics=False):
+    def __init__(self, detailed_topics=False, use_copy=False, incremental=False, metrics=False, metrics_dir=None,
+                 db_workers=0):
+        '''
+        use_copy: write works and their authorships, locations, grants & m2m rows with postgresql COPY
+        incremental: only import works updated in mongodb since the last import, and update changed works
+        metrics: collect timing metrics per importer stage; written as json files to metrics_dir if set
+        db_workers: number of threads (each with its own db connection) that write the batches of all importers in
+                    the background, see mus_wizard.database.db_pool; 0 writes with the async ORM instead
+        '''
         self.INSTITUTE_GROUPS: dict[str, str] = get_flat_groups()
         self.motorclient: motor.motor_asyncio.AsyncIOMotorClient = motor.motor_asyncio.AsyncIOMotorClient(
             MONGOURL).metadata_unification_system
@@ -36,12 +85,103 @@ class CreateSQL:
         self.missing_authors: list[str] = []
         self.missing_sources: list[str] = []
         self.detailed_topics = detailed_topics
+        self.use_copy = use_copy
+        self.incremental = incremental
+        self.metrics = metrics
+        self.metrics_dir = metrics_dir
+        self.db_workers = db_workers
+        self.db_pool: DBWorkerPool | None = None
+        self.resolvers: dict[str, ForeignKeyResolver] = make_fk_resolvers()
 
     async def load_topics(self):
         self.all_topics: list[Topic] = [topic async for topic in Topic.objects.all()]
         self.topics_dict: dict[str:Topic] = {topic.openalex_id: topic for topic in self.all_topics}
 
-    async def add_all(self):
+    async def get_topics_dict(self) -> dict[str:Topic]:
+        if not self.topics_dict:
+            await self.load_topics()
+        return self.topics_dict
+
+    def setup_importer(self, importer: GenericSQLImport) -> GenericSQLImport:
+        if self.metrics:
+            importer.enable_metrics(self.metrics_dir)
+        importer.db_pool = self.db_pool
+        return importer
+
+    async def import_topics(self) -> dict:
+        topics = self.setup_importer(self.ImportTopic(self.motorclient.topics_openalex))
+        results = await topics.import_all()
+        await self.load_topics()
+        await topics.add_siblings(self.all_topics, self.topics_dict)
+        return results
+
+    async def import_groups(self) -> dict:
+        groups = self.setup_importer(self.ImportGroup(self.motorclient.openaire_cris_orgs))
+        results = await groups.import_all()
+        await groups.add_part_of()
+        return results
+
+    async def import_funders(self) -> dict:
+        return await self.setup_importer(self.ImportFunder(self.motorclient.funders_openalex)).import_all()
+
+    async def import_sources(self) -> dict:
+        sources = self.ImportSource(self.motorclient.sources_openalex, detailed_topics=self.detailed_topics,
+                                    topics_dict=await self.get_topics_dict())
+        return await self.setup_importer(sources).import_all()
+
+    async def import_publishers(self) -> dict:
+        return await self.setup_importer(self.ImportPublisher(self.motorclient.publishers_openalex)).import_all()
+
+    async def import_organizations(self) -> dict:
+        organizations = self.ImportOrganization(self.motorclient.institutions_openalex,
+                                                detailed_topics=self.detailed_topics,
+                                                topics_dict=await self.get_topics_dict())
+        return await self.setup_importer(organizations).import_all()
+
+    async def import_authors(self) -> dict:
+        more_author_data = {
+            'repo_data':{
+                'collection': self.motorclient.openaire_cris_persons,
+                'unique_id_field': 'id',
+                'unique_id_value': 'id',
+                'projection': {}
+            },
+            'pure_data':{
+                'collection': self.motorclient.authors_pure,
+                'unique_id_field': 'id',
+                'unique_id_value': 'id',
+                'projection': {}
+            }
+        }
+        authors = self.ImportAuthor(self.motorclient.authors_openalex, topics_dict=await self.get_topics_dict(),
+                                    more_data=more_author_data, resolvers=self.resolvers)
+        return await self.setup_importer(authors).import_all()
+
+    async def import_works(self) -> dict:
+        works = self.ImportWork(self.motorclient.works_openalex, topics_dict=await self.get_topics_dict(),
+                                resolvers=self.resolvers, use_copy=self.use_copy)
+        self.setup_importer(works)
+        if self.incremental:
+            return await works.sync_changed()
+        return await works.import_all()
+
+    def import_stages(self) -> list[ImportStage]:
+        '''
+        the import stages with their dependencies; stages without a dependency between them can run at the same time
+        '''
+        return [
+            ImportStage('topics', self.import_topics),
+            ImportStage('groups', self.import_groups),
+            ImportStage('funders', self.import_funders),
+            ImportStage('publishers', self.import_publishers),
+            ImportStage('sources', self.import_sources, depends_on=('topics',)),
+            ImportStage('organizations', self.import_organizations, depends_on=('topics',)),
+            ImportStage('authors', self.import_authors, depends_on=('topics', 'groups', 'organizations')),
+            ImportStage('works', self.import_works,
+                        depends_on=('topics', 'funders', 'sources', 'organizations', 'authors')),
+        ]
+
+    async def add_all(self, stages: list[str] = None, run_id: str = None, max_concurrency: int = 3) -> dict:
         '''
         Adds all data from mongodb to the database
 
@@ -49,77 +189,36 @@ class CreateSQL:
         then adds the links between them
         then we add authors and affiliations
         we finish with works, grants, authorships, locations, and abstracts
-        '''
-        if False:
-            print('adding topics')
-            topics = self.ImportTopic(self.motorclient.topics_openalex)
-            topic_results = await topics.import_all()
-            print(topic_results)
-            topic_siblings_results = await topics.add_siblings(self.all_topics, self.topics_dict)
-            print(topic_siblings_results)
-            print('adding groups')
-            groups = self.ImportGroup(self.motorclient.openaire_cris_orgs)
-            group_results = await groups.import_all()
-            print(group_results)
-            group_part_of_results = await groups.add_part_of()
-            print(group_part_of_results)
-            print('adding funders')
-            funders = self.ImportFunder(self.motorclient.funders_openalex)
-            funder_results = await funders.import_all()
-            print(funder_results)
-            print('adding sources')
-            sources = self.ImportSource(self.motorclient.sources_openalex, detailed_topics=False, topics_dict=self.topics_dict)
-            source_results = await sources.import_all()
-            print(source_results)
-            print('adding publishers')
-            publishers = self.ImportPublisher(self.motorclient.publishers_openalex)
-            publisher_results = await publishers.import_all()
-            print(publisher_results)
-            print('adding organizations')
-            organizations = self.ImportOrganization(self.motorclient.institutions_openalex, detailed_topics=False, topics_dict=self.topics_dict)
-            organization_results = await organizations.import_all()
-            print(organization_results)
-            print('adding authors')
-            more_author_data = {
-                'repo_data':{
-                    'collection': self.motorclient.openaire_cris_persons,
-                    'unique_id_field': 'id',
-                    'unique_id_value': 'id',
-                    'projection': {}
-                },
-                'pure_data':{
-                    'collection': self.motorclient.authors_pure,
-                    'unique_id_field': 'id',
-                    'unique_id_value': 'id',
-                    'projection': {}
-                }
-            }
-            authors = self.ImportAuthor(self.motorclient.authors_openalex, topics_dict=self.topics_dict, more_data=more_author_data)
-            author_results = await authors.import_all()
-            print(author_results)
-        else:
-            print('adding works')
-            await self.load_topics()
-
-            works = self.ImportWork(self.motorclient.works_openalex, topics_dict=self.topics_dict)
-            #work_results = await works.import_all()
-            #print(work_results)
-            print('adding works m2m relations')
-            await works.add_m2m_relations([w async for w in Work.objects.all()])
 
+        The stages are run by a StageScheduler: independent stages run concurrently (max_concurrency at once).
+        stages: names of the stages to run, defaults to all; see import_stages()
+        run_id: pass the run_id of a previous run to resume it, skipping the stages that finished in that run
+        '''
+        import_stages = [stage for stage in self.import_stages() if not stages or stage.name in stages]
+        scheduler = StageScheduler(import_stages, max_concurrency=max_concurrency, run_id=run_id)
+        if self.db_workers:
+            self.db_pool = DBWorkerPool(workers=self.db_workers)
+        try:
+            return await scheduler.run()
+        finally:
+            if self.db_pool:
+                print(f'sql workers: {self.db_pool.results}')
+                await self.db_pool.close()
+                self.db_pool = None
 
     class ImportTopic(GenericSQLImport):
         def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> None:
-            super().__init__(collection, Topic)
+            super().__init__(collection, Topic, projection=make_projection(
+                'id', 'description', 'display_name', 'domain', 'field', 'subfield', 'works_count', 'keywords', 'ids'))
 
         async def add_item(self, raw_item: dict) -> None:
-            if await Topic.objects.filter(openalex_id=raw_item.get('id')).aexists():
-                return await Topic.objects.aget(openalex_id=raw_item.get('id'))
+            if self.exists(raw_item.get('id')):
+                return None
             field_type = None
             domain_type = None
-            for field in Topic.FieldTypes.values:
-                if field.lower() == raw_item.get('field').get('display_name').lower():
-                    field_type = field
+            for field_name in Topic.FieldTypes.values:
+                if field_name.lower() == raw_item.get('field').get('display_name').lower():
+                    field_type = field_name
                     break
             for domain in Topic.DomainTypes.values:
                 if domain.lower() == raw_item.get('domain').get('display_name').lower():
@@ -165,10 +264,14 @@ class CreateSQL:
 
     class ImportGroup(GenericSQLImport):
         def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> None:
-            super().__init__(collection, Group, 'internal_repository_id')
+            super().__init__(collection, Group, 'internal_repository_id', projection=make_projection(
+                'internal_repository_id', 'name', 'part_of', 'type', 'identifiers', 'acronym'))
+
+        def get_raw_id(self, raw_item: dict):
+            return raw_item.get('internal_repository_id')
 
         async def add_item(self, raw_item: dict) -> None:
-            if await Group.objects.filter(internal_repository_id=raw_item.get('internal_repository_id')).aexists():
+            if self.exists(raw_item.get('internal_repository_id')):
                 return True
 
             faculty = None
@@ -209,14 +312,14 @@ class CreateSQL:
     class ImportFunder(GenericSQLImport):
 
         def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> None:
-            super().__init__(collection, Funder)
+            super().__init__(collection, Funder, projection=make_projection(
+                'id', 'display_name', 'alternate_titles', 'country_code', 'counts_by_year', 'created_date',
+                'updated_date', 'grants_count', 'description', 'homepage_url', 'ids', 'image_thumbnail_url',
+                'image_url', 'summary_stats', 'works_count', 'cited_by_count'))
         
         async def add_item(self, raw_item: dict) -> None:
-            if await Funder.objects.filter(internal_repository_id=raw_item.get('openalex_id')).aexists():
-                return True
-
-            if await Funder.objects.filter(openalex_id=raw_item.get('id')).aexists():
-                return await Funder.objects.aget(openalex_id=raw_item.get('id'))
+            if self.exists(raw_item.get('id')):
+                return None
             funder_dict = {
                 'openalex_id'          : raw_item.get('id'),
                 'name'                 : raw_item.get('display_name'),
@@ -248,17 +351,23 @@ class CreateSQL:
         
     class ImportSource(GenericSQLImport):
         def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, detailed_topics: bool = False, topics_dict: dict[str:Topic] = None) -> None:
-            super().__init__(collection, Source)
+            super().__init__(collection, Source, projection=make_projection(
+                'id', 'created_date', 'updated_date', 'is_in_doaj', 'is_oa', 'country_code', 'type', 'display_name',
+                'alternate_titles', 'abbreviated_title', 'homepage_url', 'host_organization_name', 'issn_l', 'issn',
+                'ids', 'cited_by_count', 'counts_by_year', 'works_api_url', 'works_count', 'summary_stats',
+                'apc_prices', 'apc_usd'))
             self.detailed_topics = detailed_topics
             self.topics_dict: dict[str:Topic] = topics_dict
 
-        async def add_dealdata(self, source: Source) -> DealData:
-            dealdata_raw = await motorclient.deals_journalbrowser.find_one({'id': source.openalex_id})
-            if dealdata_raw:
-                if await DealData.objects.filter(openalex_id=dealdata_raw.get('id')).aexists():
-                    return await DealData.objects.aget(openalex_id=dealdata_raw.get('id'))
-
-                related_source = source
+        async def add_dealdata(self, sources: list[Source]) -> dict[str, int]:
+            '''
+            adds the journalbrowser deal data for sources and links it to the sources
+            the deals are retrieved with one $in query and added with abulk_get_or_create
+            returns {openalex_id: dealdata pk}
+            '''
+            sources_by_id: dict[str, Source] = {source.openalex_id: source for source in sources}
+            dealdata_items: list[DealData] = []
+            async for dealdata_raw in motorclient.deals_journalbrowser.find({'id': {'$in': list(sources_by_id)}}):
                 dealtype_raw = dealdata_raw.get('oa_type')
                 match dealtype_raw:
                     case '100% APC discount for UT authors':
@@ -280,7 +389,8 @@ class CreateSQL:
                     case _:
                         dealtype = DealData.DealType.UNKNOWN
 
-                dealdata_update_dict = {
+                dealdata_dict = {
+                    'openalex_id'          : dealdata_raw.get('id'),
                     'dealtype'             : dealtype,
                     'issns'                : dealdata_raw.get('issns'),
                     'keywords'             : dealdata_raw.get('keywords'),
@@ -291,24 +401,19 @@ class CreateSQL:
                     'openalex_type'        : dealdata_raw.get('oa_type'),
                     'jb_url'               : dealdata_raw.get('journal_browser_url'),
                     'openalex_issn'        : dealdata_raw.get('oa_issn'),
-
                 }
-                dealdata_unique_dict = {
-                    'openalex_id': dealdata_raw.get('id'),
-                }
-                dealdata, created = await DealData.objects.aget_or_create(**dealdata_unique_dict)
-                if created:
-                    for key, value in dealdata_update_dict.items():
-                        if key in dealdata.__dict__:
-                            setattr(dealdata, key, value)
-                    await dealdata.asave()
-                if related_source not in [source async for source in dealdata.related_sources.all()]:
-                    await dealdata.related_sources.aadd(related_source)
-                return dealdata
+                dealdata_items.append(DealData(**dealdata_dict))
+
+            dealdata_pks = await self.abulk_get_or_create(dealdata_items, key_field='openalex_id', model=DealData)
+            related_sources = [DealData.related_sources.through(dealdata_id=pk, source_id=sources_by_id[openalex_id].pk)
+                               for openalex_id, pk in dealdata_pks.items() if openalex_id in sources_by_id]
+            if related_sources:
+                await DealData.related_sources.through.objects.abulk_create(related_sources, ignore_conflicts=True)
+            return dealdata_pks
 
         async def add_item(self, raw_item: dict) -> None:
-            if await Source.objects.filter(openalex_id=raw_item.get('id')).aexists():
-                return await Source.objects.aget(openalex_id=raw_item.get('id'))
+            if self.exists(raw_item.get('id')):
+                return None
 
             raw_type = raw_item.get('type')
             match raw_type:
@@ -375,8 +480,6 @@ class CreateSQL:
                                 source_topic = SourceTopic(source=source, topic=topic, count=topic_raw.get('count'))
                                 self.results['added_m2m_relations'] += 1
                                 await source_topic.asave()
-                    await self.add_dealdata(source)
-                    self.results['added_m2m_relations'] += 1
                     self.performance.end_call()
 
                 except Exception as e:
@@ -384,14 +487,23 @@ class CreateSQL:
                     print(f'error {e} while adding m2m relations for {self.model.__name__}')
                     self.performance.end_call()
                     continue
+            try:
+                dealdata_pks = await self.add_dealdata(self.new_items)
+                self.results['added_m2m_relations'] += len(dealdata_pks)
+            except Exception as e:
+                self.results['errors'] += 1
+                print(f'error {e} while adding dealdata for {self.model.__name__}')
 
     class ImportPublisher(GenericSQLImport):
         def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> None:
-            super().__init__(collection, Publisher)
+            super().__init__(collection, Publisher, projection=make_projection(
+                'id', 'created_date', 'updated_date', 'display_name', 'alternate_titles', 'country_code',
+                'counts_by_year', 'hierarchy_level', 'ids', 'image_url', 'image_thumbnail_url', 'sources_api_url',
+                '2yr_mean_citedness', 'h_index', 'i10_index', 'works_count'))
 
         async def add_item(self, raw_item: dict) -> None:
-            if await Publisher.objects.filter(openalex_id=raw_item.get('id')).aexists():
-                return await Publisher.objects.aget(openalex_id=raw_item.get('id'))
+            if self.exists(raw_item.get('id')):
+                return None
             publisher_dict = {
                 'openalex_id'          : raw_item.get('id'),
                 'openalex_created_date': datetime.strptime(raw_item.get('created_date'), '%Y-%m-%d'),
@@ -421,13 +533,16 @@ class CreateSQL:
 
     class ImportOrganization(GenericSQLImport):
         def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, detailed_topics: bool = False, topics_dict: dict[str:Topic] = None) -> None:
-            super().__init__(collection, Organization)
+            super().__init__(collection, Organization, projection=make_projection(
+                'id', 'display_name', 'display_name_acronyms', 'display_name_alternatives', 'ids', 'created_date',
+                'updated_date', 'country_code', 'works_count', 'cited_by_count', '2yr_mean_citedness', 'h_index',
+                'i10_index', 'image_thumbnail_url', 'image_url'))
             self.detailed_topics = detailed_topics
             self.topics_dict: dict[str:Topic] = topics_dict
 
         async def add_item(self, raw_item: dict) -> None:
-            if await Organization.objects.filter(openalex_id=raw_item.get('id')).aexists():
-                return await Organization.objects.aget(openalex_id=raw_item.get('id'))
+            if self.exists(raw_item.get('id')):
+                return None
             organization_dict = {
                 'name'                 : raw_item.get('display_name'),
                 'name_acronyms'        : raw_item.get('display_name_acronyms'),
@@ -505,9 +620,12 @@ class CreateSQL:
             return changed_itemlist
 
     class ImportAuthor(GenericSQLImport):
-        def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, topics_dict: dict[str:Topic] = None, more_data: dict[str:dict] = None) -> None:
-            super().__init__(collection=collection, model=Author, more_data=more_data)
+        def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, topics_dict: dict[str:Topic] = None, more_data: dict[str:dict] = None,
+                     resolvers: dict[str, ForeignKeyResolver] = None) -> None:
+            super().__init__(collection=collection, model=Author, more_data=more_data, projection={'_id': 0},
+                             cursor_batch_size=500)
             self.topics_dict: dict[str:Topic] = topics_dict
+            self.resolvers: dict[str, ForeignKeyResolver] = resolvers if resolvers else make_fk_resolvers()
 
 
         async def add_item(self, raw_item: dict) -> None:
@@ -629,19 +747,20 @@ class CreateSQL:
 
         async def add_affiliation(self, affiliation_raw: dict, author: Author, author_raw: dict) -> Affiliation:
             # openalex data
-            organization = await Organization.objects.filter(
-                openalex_id=affiliation_raw.get('institution').get('id')).afirst()
+            organization_openalex_id = affiliation_raw.get('institution').get('id')
+            await self.resolvers['organization'].preload()
+            organization = await self.resolvers['organization'].resolve(organization_openalex_id)
             if not organization:
                 return None
             affiliation_dict = {
-                'years'       : affiliation_raw.get('years'),
-                'author'      : author,
-                'organization': organization,
+                'years'          : affiliation_raw.get('years'),
+                'author'         : author,
+                'organization_id': organization,
             }
             # institutional data
             groups = []
             if author_raw.get('affiliations'):
-                if organization.openalex_id == OPENALEX_INSTITUTE_ID:
+                if organization_openalex_id == OPENALEX_INSTITUTE_ID:
                     for item in author_raw.get('affiliations'):
                         try:
                             if item.get('internal_repository_id'):
@@ -656,7 +775,7 @@ class CreateSQL:
                     
 
             if author_raw.get('grouplist') and len(
-                author_raw.get('grouplist')) > 0 and organization.openalex_id == OPENALEX_INSTITUTE_ID:
+                author_raw.get('grouplist')) > 0 and organization_openalex_id == OPENALEX_INSTITUTE_ID:
                 for item in author_raw.get('grouplist'):
                     try:
                         if not item.get('section'):
@@ -686,9 +805,13 @@ class CreateSQL:
             return affiliation
 
     class ImportWork(GenericSQLImport):
-        def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, topics_dict: dict[str:Topic] = None) -> None:
-            super().__init__(collection, Work)
+        def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, topics_dict: dict[str:Topic] = None,
+                     resolvers: dict[str, ForeignKeyResolver] = None, use_copy: bool = False,
+                     db_pool: DBWorkerPool = None) -> None:
+            super().__init__(collection, Work, projection={'_id': 0}, cursor_batch_size=500, use_copy=use_copy,
+                             update_fields=WORK_UPDATE_FIELDS, db_pool=db_pool)
             self.topics_dict: dict[str:Topic] = topics_dict
+            self.resolvers: dict[str, ForeignKeyResolver] = resolvers if resolvers else make_fk_resolvers()
             self.missing_orgs: list[str] = []
             self.missing_funders: list[str] = []
             self.missing_authors: list[str] = []
@@ -782,7 +905,13 @@ class CreateSQL:
 
             self.raw_items.append(work)
 
-        async def add_m2m_relations(self, works: list[Work]) -> None:
+        async def add_m2m_relations(self, works: list[Work] = None, chunk_size: int = 500) -> None:
+            '''
+            adds abstracts, topics, authorships, grants and locations to works, chunk_size works at a time.
+            per chunk the raw works are retrieved with one $in query, all related objects are built in memory
+            (build_m2m_chunk) and written in bulk, including the rows for the m2m through tables (write_m2m_chunk).
+            with a db_pool the writes run in the background on the pool workers
+            '''
             if not works:
                 works = self.new_items
 
@@ -793,75 +922,175 @@ class CreateSQL:
             self.results['added_grants'] = 0
             self.results['added_locations'] = 0
             self.results['added_abstracts'] = 0
+            self.results['m2m_chunks'] = 0
+            for resolver in self.resolvers.values():
+                await resolver.preload()
             print(f'adding m2m relations for {len(works)} works')
-            for work in works:
+            # with a db_pool, the next chunk is built while the previous chunks are written by the pool workers
+            writes: dict[int, asyncio.Task] = {}
+            for i in range(0, len(works), chunk_size):
                 self.performance.start_call(self.add_m2m_relations)
-                raw_item = await self.collection.find_one({'id': work.openalex_id})
-                if not raw_item:
-                    continue
+                try:
+                    relations = await self.build_m2m_chunk(works[i:i + chunk_size])
+                    if self.db_pool:
+                        with self.performance.timer('wait_for_db_worker'):
+                            writes[i] = await self.db_pool.submit(self.write_m2m_chunk, relations)
+                    else:
+                        with self.performance.timer(self.write_m2m_chunk):
+                            await self.run_db(self.write_m2m_chunk, relations)
+                except Exception as e:
+                    self.results['errors'] += 1
+                    print(f'error {e} while adding m2m relations for works {i} to {i + chunk_size}')
+                self.results['m2m_chunks'] += 1
+                self.performance.end_call()
+            if writes:
+                with self.performance.timer(self.wait_for_writes):
+                    results = await asyncio.gather(*writes.values(), return_exceptions=True)
+                for i, result in zip(writes, results):
+                    if isinstance(result, Exception):
+                        self.results['errors'] += 1
+                        print(f'error {result} while adding m2m relations for works {i} to {i + chunk_size}')
+            self.results['elapsed_time'] = self.performance.elapsed_time()
+            self.results['average_time_per_call'] = self.performance.time_per_call()
+            self.results['total_measured_duration'] = self.performance.total_measured_duration()
+            self.results['fk_cache'] = {name: resolver.stats() for name, resolver in self.resolvers.items()}
+
+            print(self.results)
 
+        async def build_m2m_chunk(self, works: list[Work]) -> WorkRelations:
+            '''
+            retrieves the raw works with one $in query and builds all related objects of the works in memory
+            '''
+            works_by_id: dict[str, Work] = {work.openalex_id: work for work in works}
+            with self.performance.timer('find_raw_works'):
+                raw_items = [raw_item async for raw_item in self.collection.find({'id': {'$in': list(works_by_id)}})]
+            with self.performance.timer(self.resolve_references):
+                await self.resolve_references(raw_items)
+
+            relations = WorkRelations()
+            for raw_item in raw_items:
+                work = works_by_id.get(raw_item.get('id'))
+                if not work:
+                    continue
+                updated = False
                 if raw_item.get('abstract_inverted_index'):
                     self.results['added_abstracts'] += 1
-                    abstract = await self.add_abstract(raw_item.get('abstract'))
-                    if abstract:
-                        work.abstract = abstract
-                        self.results['added_m2m_relations'] += 1
-                        await work.asave()
+                    self.results['added_m2m_relations'] += 1
+                    relations.abstracts.append((work, await self.make_abstract(raw_item.get('abstract_inverted_index'))))
+                    updated = True
 
                 if raw_item.get('topics'):
                     self.results['added_topics'] += 1
-                    topiclist = []
-                    for topic_raw in raw_item.get('topics'):
-                        topic = self.topics_dict.get(topic_raw.get('id'))
+                    topics = await self.resolvers['topic'].resolve_many(t.get('id') for t in raw_item.get('topics'))
+                    for topic in topics.values():
                         if not topic:
                             continue
-                        topiclist.append(topic)
+                        relations.topic_rows.append(Work.topics.through(work_id=work.pk, topic_id=topic))
                         self.results['added_m2m_relations'] += 1
 
-                    await work.topics.aset(topiclist)
-
                 if raw_item.get('primary_topic'):
                     self.results['added_primary_topics'] += 1
-                    topic = self.topics_dict.get(raw_item.get('primary_topic').get('id'))
+                    topic = await self.resolvers['topic'].resolve(raw_item.get('primary_topic').get('id'))
                     if topic:
-                        work.primary_topic = topic
+                        work.primary_topic_id = topic
                         self.results['added_m2m_relations'] += 1
-                        await work.asave()
-
-                await self.add_authorships(raw_item.get('authorships'), work)
-
+                        updated = True
+                if updated:
+                    relations.updated_works.append(work)
+
+                if raw_item.get('authorships'):
+                    authorships = await self.make_authorships(raw_item.get('authorships'), work)
+                    relations.authorships.extend(authorships)
+                    self.results['added_authorships'] += len(authorships)
                 if raw_item.get('grants'):
-                    await self.add_grants(raw_item.get('grants'), work)
+                    relations.grants.extend(await self.make_grants(raw_item.get('grants'), work))
                     self.results['added_grants'] += 1
                 if raw_item.get('locations'):
-                    best_oa_location = raw_item.get('best_oa_location')
-                    primary_location = raw_item.get('primary_location')
-                    work = await self.add_locations(raw_item.get('locations'), work, best_oa_location, primary_location)
+                    new_locations = await self.make_locations(raw_item.get('locations'), raw_item.get('best_oa_location'),
+                                                              raw_item.get('primary_location'))
+                    relations.locations.extend((work, location) for location in new_locations)
+                    self.results['added_locations'] += len(new_locations)
+            return relations
 
-                self.performance.end_call()
-            self.results['elapsed_time'] = self.performance.elapsed_time()
-            self.results['average_time_per_call'] = self.performance.time_per_call()
-            self.results['total_measured_duration'] = self.performance.total_measured_duration()
-
-            print(self.results)
-
-
-        async def add_locations(self, locations_raw: dict, work: Work, best_oa_location: dict | None,
-                                primary_location: dict | None) -> Work:
-            async def make_location(location_raw: dict):
-                try:
-                    source = await Source.objects.aget(openalex_id=location_raw.get('source').get('id'))
-                    source_type = source.source_type
-                except Exception as e:
-                    source = None
-                    source_type = None
-
-                if not source:
+        def write_m2m_chunk(self, relations: WorkRelations) -> None:
+            '''
+            blocking write of the related objects of a chunk of works in one transaction
+            runs on a db_pool worker thread if set, see add_m2m_relations
+            '''
+            with transaction.atomic():
+                # abstracts & primary topics are stored on the work itself
+                if relations.abstracts:
+                    self.write_objects(Abstract, [abstract for _, abstract in relations.abstracts])
+                    for work, abstract in relations.abstracts:
+                        work.abstract_id = abstract.pk
+                if relations.updated_works:
+                    Work.objects.bulk_update(relations.updated_works, ['abstract', 'primary_topic'], batch_size=1000)
+
+                self.write_objects(Work.topics.through, relations.topic_rows, ignore_conflicts=True)
+
+                if relations.authorships:
+                    self.write_objects(Authorship, [authorship for authorship, _ in relations.authorships])
+                    affiliation_rows = [Authorship.affiliations.through(authorship_id=authorship.pk, organization_id=org)
+                                        for authorship, orgs in relations.authorships for org in orgs]
+                    self.write_objects(Authorship.affiliations.through, affiliation_rows, ignore_conflicts=True)
+
+                self.write_objects(Grant, relations.grants)
+
+                if relations.locations:
+                    self.write_objects(Location, [location for _, location in relations.locations])
+                    location_rows = [Work.locations.through(work_id=work.pk, location_id=location.pk)
+                                     for work, location in relations.locations]
+                    self.write_objects(Work.locations.through, location_rows, ignore_conflicts=True)
+
+        async def update_relations(self, works: list[Work]) -> None:
+            '''
+            removes the abstracts, topics, authorships, grants and locations of works updated by sync_changed and
+            adds them again from the current raw data
+            '''
+            pks = [work.pk for work in works]
+            abstract_pks = [pk async for pk in Work.objects.filter(pk__in=pks, abstract__isnull=False).values_list(
+                'abstract_id', flat=True)]
+            # unlink first: deleting an abstract would cascade to the work
+            await Work.objects.filter(pk__in=pks).aupdate(abstract=None, primary_topic=None)
+            await Abstract.objects.filter(pk__in=abstract_pks).adelete()
+            await Work.topics.through.objects.filter(work_id__in=pks).adelete()
+            await Location.objects.filter(works__in=pks).adelete()
+            await Authorship.objects.filter(work_id__in=pks).adelete()
+            await Grant.objects.filter(work_id__in=pks).adelete()
+            await self.add_m2m_relations(works)
+
+        async def resolve_references(self, raw_items: list[dict]) -> None:
+            '''
+            loads the pks of the authors, institutions, funders, sources and topics referenced by raw_items into the
+            resolver caches, with one query per model for the ids that are not cached yet
+            '''
+            authorships = [a for raw_item in raw_items for a in raw_item.get('authorships') or []]
+            await self.resolvers['author'].resolve_many(
+                a.get('author').get('id') for a in authorships if a.get('author'))
+            await self.resolvers['organization'].resolve_many(
+                inst.get('id') for a in authorships for inst in a.get('institutions') or [])
+            await self.resolvers['funder'].resolve_many(
+                g.get('funder') for raw_item in raw_items for g in raw_item.get('grants') or [])
+            await self.resolvers['source'].resolve_many(
+                loc.get('source').get('id') for raw_item in raw_items for loc in raw_item.get('locations') or []
+                if loc.get('source'))
+            await self.resolvers['topic'].resolve_many(
+                t.get('id') for raw_item in raw_items for t in raw_item.get('topics') or [])
+
+        async def make_locations(self, locations_raw: list[dict], best_oa_location: dict | None,
+                                 primary_location: dict | None) -> list[Location]:
+            locations: list[Location] = []
+            for location_raw in locations_raw:
+                source_openalex_id = location_raw.get('source').get('id') if location_raw.get('source') else None
+                resolved = await self.resolvers['source'].resolve(source_openalex_id)
+                if resolved:
+                    source, source_type = resolved
+                else:
                     source = None
                     source_type = Source.SourceType.UNKNOWN
 
                 location_dict = {
-                    'source'          : source,
+                    'source_id'       : source,
                     'source_type'     : source_type,
                     'is_oa'           : location_raw.get('is_oa') if isinstance(location_raw.get('is_oa'),bool) else False,
                     'landing_page_url': location_raw.get('landing_page_url'),
@@ -880,34 +1109,20 @@ class CreateSQL:
                     if primary_location.get('landing_page_url') == location_raw.get('landing_page_url'):
                         location_dict['is_primary'] = True
 
-                location = Location(**location_dict)
-                self.results['added_locations'] += 1
-                await location.asave()
-                return location
+                locations.append(Location(**location_dict))
+            return locations
 
-            location_tasks: list[asyncio.Task] = []
-            async with asyncio.TaskGroup() as tg:
-                for location in locations_raw:
-                    location_tasks.append(tg.create_task(make_location(location)))
+        async def make_abstract(self, abstract_raw: dict) -> Abstract:
+            return Abstract(text=reconstruct_abstract(abstract_raw))
 
-            locations: list[Location] = []
-            for task in location_tasks:
-                locations.append(task.result())
-            if locations:
-                await work.locations.aset(locations)
-            return work
-
-        async def add_abstract(self, abstract_raw: dict) -> Abstract:
-            abstract_text = await parse_reversed_abstract(abstract_raw)
-            abstract = Abstract(text=abstract_text)
-            await abstract.asave()
-            return abstract
-
-        async def add_authorships(self, authorships_raw: list[dict], work: Work) -> list[Authorship]:
+        async def make_authorships(self, authorships_raw: list[dict], work: Work) -> list[tuple[Authorship, list[int]]]:
+            '''
+            returns a list of (Authorship, [organization pks]) for work
+            '''
             authorships = []
             for authorship_raw in authorships_raw:
                 try:
-                    author = await Author.objects.filter(openalex_id=authorship_raw.get('author').get('id')).afirst()
+                    author = await self.resolvers['author'].resolve(authorship_raw.get('author').get('id'))
                 except Exception as e:
                     print(
                         f'{e} while retrieving author {authorship_raw.get("author")} for authorship {authorship_raw.get("id")}')
@@ -917,7 +1132,7 @@ class CreateSQL:
                     continue
 
                 authorship_dict = {
-                    'author'          : author,
+                    'author_id'       : author,
                     'work'            : work,
                     'is_corresponding': authorship_raw.get('is_corresponding'),
                 }
@@ -930,35 +1145,27 @@ class CreateSQL:
                         authorship_dict['position'] = Authorship.PositionTypes.LAST
                     case _:
                         authorship_dict['position'] = Authorship.PositionTypes.UNKNOWN
-                authorship = Authorship(**authorship_dict)
-                await authorship.asave()
 
+                institutions = []
                 if authorship_raw.get('institutions'):
-                    for inst in authorship_raw.get('institutions'):
-                        institution = await Organization.objects.filter(openalex_id=inst.get('id')).afirst()
-                        if institution:
-                            await authorship.affiliations.aadd(institution)
-                self.results['added_authorships'] += 1
-                authorships.append(authorship)
+                    institutions = await self.resolvers['organization'].resolve_many(
+                        inst.get('id') for inst in authorship_raw.get('institutions'))
+                    institutions = [pk for pk in institutions.values() if pk]
+                authorships.append((Authorship(**authorship_dict), institutions))
             return authorships
 
-        async def add_grants(self, grants_raw: list[dict], work: Work) -> Work:
+        async def make_grants(self, grants_raw: list[dict], work: Work) -> list[Grant]:
             grants = []
-            # work is a fk to the work object, so we can add grants to it directly
-
             for grant_raw in grants_raw:
-                funder = await Funder.objects.filter(openalex_id=grant_raw.get('funder')).afirst()
+                funder = await self.resolvers['funder'].resolve(grant_raw.get('funder'))
                 if not funder:
                     self.missing_funders.append(grant_raw.get('funder'))
                     continue
                 grant_dict = {
-                    'funder'     : funder,
+                    'funder_id'  : funder,
                     'award_id'   : grant_raw.get('award_id'),
                     'funder_name': grant_raw.get('funder_name'),
                     'work'       : work,
                 }
-                grant = Grant(**grant_dict)
-                await grant.asave()
-                grants.append(grant)
-
+                grants.append(Grant(**grant_dict))
             return grants
@@ -0,0 +1,108 @@
+'''
+Thread pool for running blocking django ORM writes of the mongodb -> sql importers concurrently.
+
+The django async ORM (abulk_create, asave, ...) runs every query through sync_to_async(thread_sensitive=True): all
+queries of a task end up in the same thread, one after the other, so batch writes never overlap and an importer
+waits for each write before it reads & transforms the next documents.
+
+DBWorkerPool runs sync functions on a fixed number of worker threads instead. Django connections are per thread, so
+each worker keeps its own persistent database connection for the lifetime of the pool. Writes submitted with
+submit() run in the background (max workers * queue_factor at once, submit() waits for a free slot), so the
+importer continues reading from mongodb while the previous batches are written.
+
+usage:
+    async with DBWorkerPool(workers=4) as pool:
+        task = await pool.submit(Work.objects.bulk_create, works)  # returns an asyncio.Task
+        ...
+        works = await task
+    # or wait for a result directly:
+    works = await pool.run(Work.objects.bulk_create, works)
+'''
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.db import connections
+from rich import print
+
+
+class DBWorkerPool:
+    def __init__(self, workers: int = 4, queue_factor: int = 2) -> None:
+        '''
+        workers: number of worker threads, each with its own database connection
+        queue_factor: max number of submitted writes per worker that are running or waiting to run
+        '''
+        self.workers: int = workers
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sql-worker')
+        self.max_pending: int = workers * queue_factor
+        self.slots: asyncio.Semaphore | None = None
+        self.threads: set[int] = set()
+        self.results: dict[str, int] = {'submitted': 0, 'finished': 0, 'errors': 0}
+
+    async def __aenter__(self) -> 'DBWorkerPool':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        # the connection opened by func stays open for the next call on this worker (it is only closed
+        # automatically at the end of a request, and workers don't handle requests), until close()
+        self.threads.add(threading.get_ident())
+        return func(*args, **kwargs)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        '''
+        runs func(*args, **kwargs) on a worker thread and returns the result
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.call, func, *args, **kwargs))
+
+    async def submit(self, func: Callable, *args, **kwargs) -> asyncio.Task:
+        '''
+        schedules func(*args, **kwargs) on a worker thread and returns the task without waiting for the result
+        waits for a free slot if max_pending writes are already submitted
+        '''
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        await self.slots.acquire()
+        self.results['submitted'] += 1
+
+        async def run_submitted() -> Any:
+            try:
+                result = await self.run(func, *args, **kwargs)
+                self.results['finished'] += 1
+                return result
+            except Exception:
+                self.results['errors'] += 1
+                raise
+            finally:
+                self.slots.release()
+
+        return asyncio.create_task(run_submitted())
+
+    def close_connections(self, barrier: threading.Barrier) -> None:
+        # every worker blocks on the barrier, so each one runs exactly one of these calls
+        try:
+            barrier.wait(timeout=10)
+        except threading.BrokenBarrierError:
+            pass
+        connections.close_all()
+
+    async def close(self) -> None:
+        '''
+        closes the database connections of the worker threads and shuts down the pool
+        '''
+        if self.threads:
+            loop = asyncio.get_running_loop()
+            barrier = threading.Barrier(len(self.threads))
+            try:
+                await asyncio.gather(*[loop.run_in_executor(self.executor, self.close_connections, barrier)
+                                       for _ in self.threads])
+            except Exception as e:
+                print(f'error {e} while closing the connections of the sql workers')
+        self.executor.shutdown(wait=True)
+        self.threads = set()
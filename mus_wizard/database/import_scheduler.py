@@ -0,0 +1,175 @@
+'''
+Dependency-aware scheduler for the mongodb -> sql import stages in CreateSQL.
+
+Each ImportStage declares the stages it depends on; a stage is started as soon as all its dependencies have finished,
+with at most max_concurrency stages running at once. Every stage runs in its own asgiref ThreadSensitiveContext, so
+the django async ORM calls of that stage are run in a separate thread with its own database connection.
+
+Finished stages are stored per run_id in mongodb (collection 'sql_import_runs'), so a failed or interrupted run can be
+resumed by passing the same run_id: stages that already finished are skipped.
+
+usage:
+    stages = [
+        ImportStage('topics', import_topics),
+        ImportStage('funders', import_funders),
+        ImportStage('works', import_works, depends_on=('topics', 'funders')),
+    ]
+    results = await StageScheduler(stages, max_concurrency=3, run_id='2024-06-01').run()
+'''
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable
+
+import motor.motor_asyncio
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.db import close_old_connections
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+from mus_wizard.constants import MONGOURL
+
+cons = Console(markup=True)
+
+
+@dataclass
+class ImportStage:
+    name: str
+    run: Callable[[], Awaitable[dict | None]]
+    depends_on: tuple[str, ...] = ()
+    status: str = 'pending'
+    duration: float = 0
+    result: dict | None = field(default=None, repr=False)
+
+
+class ImportRunLog:
+    '''
+    stores the finished stages of each import run as documents {run_id, stage, finished_at, duration}
+    '''
+
+    def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection = None):
+        if collection is None:
+            collection = motor.motor_asyncio.AsyncIOMotorClient(MONGOURL).metadata_unification_system['sql_import_runs']
+        self.collection: motor.motor_asyncio.AsyncIOMotorCollection = collection
+
+    async def finished_stages(self, run_id: str) -> set[str]:
+        return {doc['stage'] async for doc in self.collection.find({'run_id': run_id}, projection={'stage': 1})}
+
+    async def mark_finished(self, run_id: str, stage: ImportStage) -> None:
+        await self.collection.update_one({'run_id': run_id, 'stage': stage.name},
+                                         {'$set': {'finished_at': datetime.now(), 'duration': stage.duration}},
+                                         upsert=True)
+
+
+class StageScheduler:
+    '''
+    runs ImportStages concurrently in dependency order, see module docstring
+    stages: the stages to run; dependencies on stages that are not in this list are ignored
+    max_concurrency: max number of stages running at the same time
+    run_id: id of this run, used to skip finished stages when resuming. Defaults to the current time.
+    '''
+
+    def __init__(self, stages: list[ImportStage], max_concurrency: int = 3, run_id: str = None,
+                 run_log: ImportRunLog = None) -> None:
+        self.stages: dict[str, ImportStage] = {stage.name: stage for stage in stages}
+        self.max_concurrency: int = max_concurrency
+        self.run_id: str = run_id if run_id else datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        self.run_log: ImportRunLog = run_log if run_log else ImportRunLog()
+        self.check_stages()
+
+    def dependencies(self, stage: ImportStage) -> list[str]:
+        return [name for name in stage.depends_on if name in self.stages]
+
+    def check_stages(self) -> None:
+        '''
+        raises a ValueError if the stage dependencies contain a cycle
+        '''
+        visiting, done = set(), set()
+
+        def visit(name: str, path: list[str]) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f'cycle in import stages: {" -> ".join(path + [name])}')
+            visiting.add(name)
+            for dependency in self.dependencies(self.stages[name]):
+                visit(dependency, path + [name])
+            visiting.remove(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name, [])
+
+    async def run_stage(self, stage: ImportStage, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            cons.print(f'[cyan]starting stage {stage.name}')
+            stage.status = 'running'
+            start = time.perf_counter()
+            async with ThreadSensitiveContext():
+                try:
+                    stage.result = await stage.run()
+                    stage.status = 'finished'
+                except Exception as e:
+                    stage.status = 'failed'
+                    cons.print(f'[red]stage {stage.name} failed: {e}')
+                finally:
+                    # closes the db connection of the thread used by this stage
+                    await sync_to_async(close_old_connections)()
+            stage.duration = round(time.perf_counter() - start, 2)
+            if stage.status == 'finished':
+                await self.run_log.mark_finished(self.run_id, stage)
+                cons.print(f'[green]finished stage {stage.name} in {stage.duration} s')
+
+    async def run(self) -> dict[str, dict | None]:
+        '''
+        runs all stages; stages that depend on a failed stage are not run
+        returns {stage name: stage result}
+        '''
+        cons.print(f'import run {self.run_id}: {len(self.stages)} stages, max {self.max_concurrency} at once')
+        for name in await self.run_log.finished_stages(self.run_id):
+            if name in self.stages:
+                self.stages[name].status = 'skipped (already finished)'
+
+        def is_done(stage: ImportStage) -> bool:
+            return stage.status == 'finished' or stage.status.startswith('skipped')
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        running: dict[asyncio.Task, ImportStage] = {}
+        while True:
+            changed = True
+            while changed:
+                # a newly blocked stage can block other pending stages, so repeat until nothing changes
+                changed = False
+                for stage in self.stages.values():
+                    if stage.status != 'pending':
+                        continue
+                    dependencies = [self.stages[name] for name in self.dependencies(stage)]
+                    if any(dependency.status in ('failed', 'blocked') for dependency in dependencies):
+                        stage.status = 'blocked'
+                        changed = True
+                    elif all(is_done(dependency) for dependency in dependencies):
+                        stage.status = 'queued'
+                        running[asyncio.create_task(self.run_stage(stage, semaphore))] = stage
+            if not running:
+                break
+            finished, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                running.pop(task)
+
+        self.print_summary()
+        return {name: stage.result for name, stage in self.stages.items()}
+
+    def print_summary(self) -> None:
+        summary = Table(title=f'SQL import run {self.run_id}', box=box.SIMPLE_HEAD, title_style='bold magenta')
+        summary.add_column('stage', style='cyan')
+        summary.add_column('depends on')
+        summary.add_column('status')
+        summary.add_column('duration (s)', justify='right', style='orange1')
+        for stage in self.stages.values():
+            style = {'finished': 'green', 'failed': 'red', 'blocked': 'red'}.get(stage.status, 'dim')
+            summary.add_row(stage.name, ', '.join(stage.depends_on), f'[{style}]{stage.status}',
+                            str(stage.duration))
+        cons.print(summary)
@@ -1,19 +1,21 @@
 import datetime
+import re
+import time
+from typing import Iterable
 
 import motor.motor_asyncio
 import pandas as pd
-from polyfuzz import PolyFuzz
-from polyfuzz.models import TFIDF
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from mus_wizard.constants import MONGOURL
 from mus_wizard.database.mongo_client import MusMongoClient
+from mus_wizard.database.name_matching import NameIndex
 from mus_wizard.harvester.openalex import OpenAlexQuery
 from mus_wizard.utils import normalize_doi, remove_invalid_dois
 
-from typing import Self
 from rich.console import Console
 from rich.table import Table
-from dataclasses import dataclass
 
 console = Console()
 class AuthorMatcher():
@@ -31,7 +33,8 @@ class AuthorMatcher():
         self.orcids = {}
         self.scopusids = {}
         self.isnis = {}
-        self.results = {'orcid_matches': 0, 'repo_authors_checked': 0, 'scopus_id_matches': 0, 'isni_matches': 0, 'name_matches': 0}
+        self.results = {'orcid_matches': 0, 'repo_authors_checked': 0, 'scopus_id_matches': 0, 'isni_matches': 0, 'name_matches': 0,
+                        'pid_stats': {}}
 
     async def get_authors(self):
         print('getting data from mongodb for author matching')
@@ -77,336 +80,390 @@ class AuthorMatcher():
         print(f'len of self.authornames for authors without any pids: {len(self.names)}')
 
     async def match_pids(self):
-        await self.match_orcids()
-        print('skipping scopusid & isni matching')
-        #await self.match_scopusids()
-        #await self.match_isnis()
+        '''
+        matches repository persons to openalex authors by orcid, then the remaining persons by scopus id.
+        all lookups use chunked $in queries, all matches are written with a single bulk_write.
+        '''
+        start = time.perf_counter()
+        matches = {}
+        matches.update(await self.match_orcids())
+        matches.update(await self.match_scopusids(exclude=matches.keys()))
+        await self.write_matches(matches)
+        elapsed = time.perf_counter() - start
+        checked = len(self.orcids) + len(self.scopusids)
+        table = Table(title='Author pid matches')
+        for column in ['id type', 'persons', 'matched', 'fetched from api', 'match rate']:
+            table.add_column(column)
+        for id_type, stats in self.results['pid_stats'].items():
+            rate = stats['matched'] / stats['persons'] if stats['persons'] else 0
+            table.add_row(id_type, str(stats['persons']), str(stats['matched']), str(stats['fetched']), f'{rate:.1%}')
+        console.print(table)
+        console.print(f'matched {len(matches)} persons in {elapsed:.1f}s -- {checked / elapsed if elapsed else 0:.0f} ids/s')
+        print('isni matching is skipped: openalex does not have isnis to match.')
+
+    @staticmethod
+    def normalize_pid(id_type: str, value: str | None) -> str | None:
+        '''
+        returns the bare orcid (0000-0000-0000-000X) or scopus author id from a (url) value
+        '''
+        if not value:
+            return None
+        if id_type == 'orcid':
+            found = re.search(r'(\d{4}-\d{4}-\d{4}-\d{3}[\dX])', str(value).upper())
+        else:
+            found = re.search(r'authorID=(\d+)', str(value)) or re.search(r'(\d+)', str(value))
+        return found.group(1) if found else None
 
-    async def match_orcids(self):
+    async def find_openalex_authors(self, id_type: str, pids: dict[str, str],
+                                    chunk_size: int = 1000) -> dict[str, dict]:
+        '''
+        looks up the openalex authors for pids ({internal_repository_id: orcid or scopus id}) using chunked
+        $in queries on ids.orcid / ids.scopus, and joins the results in memory.
+        returns {internal_repository_id: openalex author}
+        '''
+        normalized = {repo_id: self.normalize_pid(id_type, pid) for repo_id, pid in pids.items()}
+        values = sorted({pid for pid in normalized.values() if pid})
+        if id_type == 'orcid':
+            query_values = [f'https://orcid.org/{pid}' for pid in values]
+        else:
+            query_values = [f'http://www.scopus.com/inward/authorDetails.url?authorID={pid}&partnerID=MN8TOARS'
+                            for pid in values]
+        found = {}
+        for i in range(0, len(query_values), chunk_size):
+            chunk = query_values[i:i + chunk_size]
+            async for author in self.motorclient.authors_openalex.find({f'ids.{id_type}': {'$in': chunk}},
+                                                                       projection={'id': 1, 'display_name': 1,
+                                                                                   f'ids.{id_type}': 1}):
+                pid = self.normalize_pid(id_type, author.get('ids', {}).get(id_type))
+                if pid:
+                    found[pid] = author
+        return {repo_id: found[pid] for repo_id, pid in normalized.items() if pid in found}
+
+    async def match_orcids(self) -> dict[str, dict]:
+        '''
+        returns {internal_repository_id: openalex author} for the persons matched by orcid;
+        orcids that are not in authors_openalex yet are retrieved from the openalex api in one batched query
+        '''
+        stats = {'persons': len(self.orcids), 'matched': 0, 'fetched': 0}
+        self.results['pid_stats']['orcid'] = stats
         if not self.orcids:
             print('no orcids to match')
-            return None
+            return {}
         print(f'matching {len(self.orcids)} orcids')
-        orcidsnotfound = {}
-        for internal_repository_id, orcid in self.orcids.items():
-            openalex = await self.motorclient.authors_openalex.find_one({'ids.orcid': orcid})
-            if not openalex:
-                orcidsnotfound[internal_repository_id] = orcid
-            if openalex:
-                await self.motorclient.openaire_cris_persons.update_one({'internal_repository_id': internal_repository_id}, {'$set': {'id':openalex.get('id'), 'openalex_match': {'name': openalex['display_name'], 'id': openalex['id']}}})
-                self.results['orcid_matches']+=1
+        matches = await self.find_openalex_authors('orcid', self.orcids)
+        orcidsnotfound = {repo_id: orcid for repo_id, orcid in self.orcids.items() if repo_id not in matches}
         if orcidsnotfound:
             query = OpenAlexQuery(MusMongoClient(), MusMongoClient().authors_openalex, 'authors')
-            query.add_query_by_orcid(orcidsnotfound.values())
+            query.add_query_by_orcid([self.normalize_pid('orcid', orcid) or orcid for orcid in orcidsnotfound.values()])
             await query.run()
-            for author in orcidsnotfound:
-                openalex = await self.motorclient.authors_openalex.find_one({'ids.orcid': orcid})
-                if openalex:
-                    await self.motorclient.openaire_cris_persons.update_one({'internal_repository_id': internal_repository_id}, {'$set': {'id':openalex.get('id'), 'openalex_match': {'name': openalex['display_name'], 'id': openalex['id']}}})
-                    self.results['orcid_matches']+=1
-        print(f'{self.results["orcid_matches"]} orcids matched')
-        print(f'{len(orcidsnotfound)} orcids not found in openalex')
-    async def match_scopusids(self):
-        if not self.scopusids:
+            fetched = await self.find_openalex_authors('orcid', orcidsnotfound)
+            stats['fetched'] = len(fetched)
+            matches.update(fetched)
+        stats['matched'] = len(matches)
+        self.results['orcid_matches'] += len(matches)
+        print(f'{len(matches)} orcids matched')
+        print(f'{len(self.orcids) - len(matches)} orcids not found in openalex')
+        return matches
+
+    async def match_scopusids(self, exclude: Iterable[str] = ()) -> dict[str, dict]:
+        '''
+        returns {internal_repository_id: openalex author} for the persons matched by scopus id
+        exclude: internal_repository_ids that are already matched
+        '''
+        exclude = set(exclude)
+        scopusids = {repo_id: scopusid for repo_id, scopusid in self.scopusids.items() if repo_id not in exclude}
+        stats = {'persons': len(scopusids), 'matched': 0, 'fetched': 0}
+        self.results['pid_stats']['scopus'] = stats
+        if not scopusids:
             print('no scopusids to match')
-            return None
-        print(f'matching {len(self.scopusids)} scopusids')
-        scopusidsnotfound = {}
-        for internal_repository_id, scopusid in self.scopusids.items():
-            openalex = await self.motorclient.authors_openalex.find_one({ 'ids.scopus': {'$in':[f'/{scopusid}/i']} })
-            if not openalex:
-                scopusidsnotfound[internal_repository_id] = scopusid
-            if openalex:
-                await self.motorclient.openaire_cris_persons.update_one({'internal_repository_id': internal_repository_id}, {'$set': {'id':openalex.get('id'), 'openalex_match': {'name': openalex['display_name'], 'id': openalex['id']}}})
-                self.results['scopus_id_matches']+=1
-        print(f'{self.results["scopus_id_matches"]} scopusids matched')
-        print(f'{len(scopusidsnotfound)} scopusids not found in openalex')
+            return {}
+        print(f'matching {len(scopusids)} scopusids')
+        matches = await self.find_openalex_authors('scopus', scopusids)
+        stats['matched'] = len(matches)
+        self.results['scopus_id_matches'] += len(matches)
+        print(f'{len(matches)} scopusids matched')
+        print(f'{len(scopusids) - len(matches)} scopusids not found in openalex')
+        return matches
+
+    async def write_matches(self, matches: dict[str, dict]) -> None:
+        '''
+        stores the openalex id of the matched authors in openaire_cris_persons using a single bulk_write
+        '''
+        operations = [UpdateOne({'internal_repository_id': internal_repository_id},
+                                {'$set': {'id': openalex.get('id'), 'openalex_match': {'name': openalex.get('display_name'),
+                                                                                       'id': openalex.get('id')}}})
+                      for internal_repository_id, openalex in matches.items()]
+        if not operations:
+            return
+        try:
+            await self.motorclient.openaire_cris_persons.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            print(f'Error adding author matches: {len(e.details.get("writeErrors", []))} write errors')
+
     async def match_isnis(self):
         if not self.isnis:
             print('no isnis to match')
             return None
         print('openalex does not have isnis to match.')
 
-    async def match_names(self):
+    async def match_names(self, score_cutoff: float = 90, workers: int = 4):
+        '''
+        fuzzy matches the names of persons without any pids to openalex author names, see name_matching.NameIndex.
+        names that match more than one openalex author are skipped.
+        '''
         if not self.names:
             print('no names to match')
             return None
 
         print(f'matching {len(self.names)} names')
-        reverse_names_dict = {v:k for k,v in self.names.items()}
-        to_list = [a['display_name'] async for a in
-                   self.motorclient.authors_openalex.find({}, projection={'display_name': 1},
-                                                          sort=[('display_name', 1)])]
-        tfidf = TFIDF(n_gram_range=(3, 3), clean_string=True, min_similarity=0.7)
-        model = PolyFuzz(tfidf)
-        try:
-            matchlist = model.match(list(self.names.values()), to_list)
-        except ValueError as e:
-            print(f'Error when matching names: {e}')
-            print('aborting.')
-            return
-        results: pd.DataFrame = matchlist.get_matches()
-        top_results = results[results['Similarity'] > 0.8]
-        top_results_list = zip(top_results['From'].to_list(), top_results['To'].to_list())
-        for from_name, to_name in top_results_list:
-            openalexid = await self.motorclient.authors_openalex.find_one({'display_name': to_name})
-            openalexid = openalexid['id']
-            await self.motorclient.openaire_cris_persons.update_one({'internal_repository_id': reverse_names_dict[from_name]}, {'$set': {'id':openalexid, 'openalex_match': {'name': to_name, 'id': openalexid}}})
-            self.results['name_matches']+=1
-
-        print(f'{self.results["name_matches"]} names matched')
+        start = time.perf_counter()
+        index = NameIndex()
+        async for author in self.motorclient.authors_openalex.find({}, projection={'id': 1, 'display_name': 1,
+                                                                                  'display_name_alternatives': 1}):
+            index.add(author.get('display_name'), author.get('id'))
+            for name in author.get('display_name_alternatives') or []:
+                index.add(name, author.get('id'))
+        name_matches = index.match(self.names.values(), score_cutoff=score_cutoff, workers=workers)
+        operations = []
+        ambiguous = 0
+        for internal_repository_id, name in self.names.items():
+            match = name_matches.get(name)
+            if not match:
+                continue
+            if len(match.ids) > 1:
+                ambiguous += 1
+                continue
+            openalexid = next(iter(match.ids))
+            operations.append(UpdateOne({'internal_repository_id': internal_repository_id},
+                                        {'$set': {'id': openalexid, 'openalex_match': {'name': match.matched_name,
+                                                                                        'id': openalexid}}}))
+        if operations:
+            try:
+                await self.motorclient.openaire_cris_persons.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                print(f'Error adding name matches: {len(e.details.get("writeErrors", []))} write errors')
+        self.results['name_matches'] += len(operations)
+        print(f'{self.results["name_matches"]} names matched, {ambiguous} names matched multiple authors and were '
+              f'skipped ({len(index)} openalex names indexed in {len(index.blocks)} blocks, '
+              f'{time.perf_counter() - start:.1f}s)')
+
     async def run(self):
         print('running author matcher')
         await self.get_authors()
 
         await self.match_pids()
-        #await self.match_names()
+        await self.match_names()
         return self.results
 
-@dataclass
-class Work:
-    '''
-    A class to store a Work object for matching works
-    -- not to be confused with the django MUS model Work.
+# key types used to match works, in order of preference
+# pmid & isbn are not used: openalex works have a pmid but no isbn, and the cerif works have an isbn but no pmid
+WORK_MATCH_KEYS = ['doi', 'title_year']
 
-    Will return an equality if any of the id, doi, or isbn fields are equal.
-    '''
-    id: str | None = None
-    doi: str | None = None
-    fulldict: dict[str,str] = None
-    has_match: bool = False
-    internal_repo_id: str | None = None
-
-    def __post_init__(self) -> None:
-        self.fulldict = {'id': self.id, 'doi': self.doi, 'internal_repo_id': self.internal_repo_id}
-
-    def __eq__(self, value: object) -> bool:
-        if value.__class__ is not self.__class__:
-            return False
-        if self.id:
-            if self.id == value.id:
-                return True
-        elif self.doi:
-            if self.doi == value.doi:
-                return True
-        elif self.internal_repo_id:
-            if self.internal_repo_id == value.internal_repo_id:
-                return True
-        return False
-
-    def is_match(self) -> Self:
-        self.has_match = True
-        return self
-
-class WorkList:
+
+class WorkKeyTable:
     '''
-    A class to store and manage a list of Work objects for matching works.
+    Columnar table of (work id, key type, raw value, year) rows used for matching works.
+    normalise() turns the raw values into matching keys using vectorised pandas string operations:
+        doi: lowercase 10.xxx/yyy part of the doi
+        pmid: the numeric pubmed id
+        isbn: isbn-13 (isbn-10 values are converted)
+        title_year: ascii lowercase alphanumeric title + '|' + publication year
     '''
-    works_by_id: dict[str, Work] = None
-    works_by_doi: dict[str, Work] = None
-    works_by_internal_repo_id: dict[str, Work] = None
-    works_as_list: list[Work] = None
-    unmatched_works: list[Work] = None
-    matched_works: list[Work] = None
 
     def __init__(self) -> None:
-        self.works_by_id = {}
-        self.works_by_doi = {}
-        self.works_as_list = []
-        self.unmatched_works = []
-        self.works_by_internal_repo_id = {}
-        self.matched_works = []
-
-    def __str__(self) -> str:
-        self.update()
-        return f'WorkList with:\n {len(self.works_by_id)} works by id\n {len(self.works_by_doi)} works by doi\n {len(self.works_as_list)} works as list\n {len(self.unmatched_works)} unmatched works\n {len(self.works_by_internal_repo_id)} works by internal repo id\n {len(self.matched_works)} matched works'
-
-    def get_all(self, param: str | None = None) -> list[Work] | dict[str, Work]:
-        '''
-        Returns a list of all works in the list.
-        '''
-        self.update()
-        if param:
-            if param == 'id':
-                return self.works_by_id
-            if param == 'doi':
-                return self.works_by_doi
-            if param == 'internal_repo_id':
-                return self.works_by_internal_repo_id
-            if param == 'unmatched':
-                return self.unmatched_works
-            if param == 'matched':
-                return self.matched_works
-        return self.works_as_list
-
-    def add_work(self, work: Work) -> None:
-        '''
-        Parameters:
-            work (Work): A Work object to add to this WorkList.
-        '''
-        self.works_as_list.append(work)
+        self.work_ids: list[str] = []
+        self.key_types: list[str] = []
+        self.values: list[str] = []
+        self.years: list[int | None] = []
 
-    def add_works(self, works: list[Work]) -> None:
-        '''
-        Parameters:
-            works (list[Work]): A list of Work objects to add to this WorkList.
-        '''
-        for work in works:
-            self.add_work(work)
-        self.update()
+    def __len__(self) -> int:
+        return len(self.work_ids)
 
-    def remove_works_without_doi(self) -> None:
+    def add(self, work_id: str, key_type: str, value: str | list | None, year: int | None = None) -> None:
         '''
-        Removes all works from this WorkList that do not have a DOI.
+        adds a raw key value for a work; lists add a row per value, empty values are skipped
         '''
-        startlen = len(self.works_as_list)
-        self.works_as_list = [work for work in self.works_as_list if work.doi]
-        self.update()
-        print(f'removed works without dois, from {startlen} works to {len(self.works_as_list)} works')
-
-    def update(self) -> None:
+        if not value:
+            return
+        if isinstance(value, list):
+            for v in value:
+                self.add(work_id, key_type, v, year)
+            return
+        self.work_ids.append(work_id)
+        self.key_types.append(key_type)
+        self.values.append(str(value))
+        self.years.append(year)
+
+    @staticmethod
+    def isbn10_to_13(isbn: str) -> str:
+        digits = '978' + isbn[:9]
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+        return f'{digits}{check}'
+
+    def normalise(self, min_title_length: int = 15) -> pd.DataFrame:
         '''
-        Updates the list & dict attributes with the current state of the works in works_as_list
+        returns a dataframe with columns work_id, key_type, key -- one row per unique normalised key of a work
+        min_title_length: shorter normalised titles ('editorial', 'introduction', ...) are not used as key
         '''
-        self.works_by_id = {work.id: work for work in self.works_as_list if work.id}
-        self.works_by_doi = {work.doi: work for work in self.works_as_list if work.doi}
-        self.works_by_internal_repo_id = {work.internal_repo_id: work for work in self.works_as_list if work.internal_repo_id}
+        raw = pd.DataFrame({'work_id': self.work_ids, 'key_type': self.key_types, 'value': self.values,
+                            'year': pd.array(self.years, dtype='Int64')})
+        keys = pd.Series(pd.NA, index=raw.index, dtype='object')
 
-    def get_unmatched_works(self) -> list[Work]:
-        '''
-        Returns a list of all works in the list that have not been matched yet.
-        '''
-        dois = {work.doi:'' for work in self.matched_works if work.doi}
-        self.unmatched_works = [work for work in self.works_as_list if work.doi not in dois]
-        print(f'returning {len(self.unmatched_works)} unmatched works')
-        return self.unmatched_works
+        mask = raw['key_type'] == 'doi'
+        keys[mask] = raw.loc[mask, 'value'].str.strip().str.lower().str.extract(r'(10\.\S+)', expand=False)
 
-    def match_one(self, work: Work, return_match_param=False) -> tuple[Work, str] | Work | None:
-        '''
-        Finds a matching for the work in the list based on id, doi, or isbn.
-        If return_match_param is True, returns a tuple of the matching Work and the matching parameter (id, doi, or isbn).
-        Otherwise, returns the matching Work.
-        Returns None if no match is found.
+        mask = raw['key_type'] == 'pmid'
+        keys[mask] = raw.loc[mask, 'value'].str.extract(r'(\d+)\s*$', expand=False)
 
-        Parameters:
-            work (Work): The work to match.
-            return_match_param (bool, optional): Whether to return the matching parameter (id, doi, or isbn). Defaults to False.
+        mask = raw['key_type'] == 'isbn'
+        isbns = raw.loc[mask, 'value'].str.upper().str.replace(r'[^0-9X]', '', regex=True)
+        # only well-formed values are used: 13 digits, or 9 digits + a check digit / X (converted to isbn-13)
+        isbn10 = isbns.str.fullmatch(r'\d{9}[\dX]')
+        isbns = isbns.where(~isbn10, isbns[isbn10].map(self.isbn10_to_13))
+        keys[mask] = isbns.where(isbns.str.fullmatch(r'\d{13}'))
 
-        Returns:
-            tuple[Work, str] | Work | None: The matching Work (with the matching parameter if return_match_param is True), or None if no match is found.
-        '''
-        val = None
-        param = None
-
-        if work.doi in self.works_by_doi:
-            val = self.works_by_doi[work.doi]
-            param = work.doi
-            self.matched_works.append(val.is_match())
-        if return_match_param:
-            return val, param
-        else:
-            return val
+        mask = (raw['key_type'] == 'title_year') & raw['year'].notna()
+        titles = (raw.loc[mask, 'value'].str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+                  .str.lower().str.replace(r'[^a-z0-9]', '', regex=True))
+        titles = titles.where(titles.str.len() >= min_title_length)
+        keys[mask] = titles + '|' + raw.loc[mask, 'year'].astype(str)
 
-    def match_multiple(self, works: list[Work]) -> dict[str, dict[str,Work]] | dict:
-        '''
-        Parameters:
-            works (list[Work]): A list of Work objects to match.
-        Returns:
-            dict[str, dict[str,Work]]: A dict with matching id/doi as keys, and a dict with the Work objects 'found_work' and 'search_param' as values.
-        '''
-        matches = {}
-        self.update()
-        for work in works:
-            match, val = self.match_one(work, True)
-            if match:
-                matches[val] = {'found_work': match, 'search_param': work}
-        self.update()
-        return matches
+        raw['key'] = keys
+        return raw[['work_id', 'key_type', 'key']].dropna().drop_duplicates()
+
+
+def match_work_keys(source: pd.DataFrame, target: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, dict[str, int]]]:
+    '''
+    hash-joins the normalised keys of the source works (e.g. OpenAlex) and the target works (e.g. the repository)
+    for all key types in a single merge, and picks the best match for each target work using WORK_MATCH_KEYS order.
+    keys that belong to more than one source work are ambiguous and not used.
+
+    returns:
+        a dataframe with columns target_id, source_id, key_type -- one row per matched target work
+        counts per key type: {'candidates': .., 'ambiguous': .., 'matches': ..} and the number of conflicts
+        (target works with candidates pointing to different source works)
+    '''
+    source = source.rename(columns={'work_id': 'source_id'})
+    target = target.rename(columns={'work_id': 'target_id'})
+    ambiguous = source.duplicated(['key_type', 'key'], keep=False)
+    ambiguous_counts = source[ambiguous].drop_duplicates(['key_type', 'key'])['key_type'].value_counts()
+    source = source[~ambiguous]
+
+    candidates = target.merge(source, on=['key_type', 'key'], how='inner')
+    candidates = candidates.drop_duplicates(['target_id', 'source_id', 'key_type'])
+    candidates['priority'] = candidates['key_type'].map({key: i for i, key in enumerate(WORK_MATCH_KEYS)})
+    best = candidates.sort_values(['target_id', 'priority']).drop_duplicates('target_id')
+    conflicts = int((candidates.groupby('target_id')['source_id'].nunique() > 1).sum())
+
+    candidate_counts = candidates['key_type'].value_counts()
+    match_counts = best['key_type'].value_counts()
+    counts = {key: {'candidates': int(candidate_counts.get(key, 0)),
+                    'ambiguous' : int(ambiguous_counts.get(key, 0)),
+                    'matches'   : int(match_counts.get(key, 0))} for key in WORK_MATCH_KEYS}
+    counts['conflicts'] = conflicts
+    return best[['target_id', 'source_id', 'key_type']].reset_index(drop=True), counts
 
 
 class WorkMatcher():
     # match OpenAlex works to Pure works
     # OpenAlex works are already linked to the other sources (datacite, crossref, openaire)
-    # start with matching DOIs and ISBNs
-    # then maybe by using other data if much is missing
+    # matches on doi and a title+year fingerprint, in that order of preference
 
     motorclient: motor.motor_asyncio.AsyncIOMotorDatabase = motor.motor_asyncio.AsyncIOMotorClient(
         MONGOURL).metadata_unification_system
 
-    def __init__(self):
-        self.results = {'total': 0, 'works': []}
-        self.missing_dois : WorkList | None = None
-        self.worklist : WorkList = WorkList()
-        self.unmatched_works : WorkList= WorkList()
-
+    def __init__(self, write_batch_size: int = 1000):
+        self.results = {'total': 0, 'works': [], 'keys': {}, 'written': 0}
+        self.write_batch_size: int = write_batch_size
+        self.openalex_keys: WorkKeyTable = WorkKeyTable()
+        self.repository_keys: WorkKeyTable = WorkKeyTable()
+        self.current_ids: dict[str, str | None] = {}
+        self.repository_dois: dict[str, str] = {}
+        self.unmatched_dois: list[str] = []
 
     async def run(self):
         await self.get_works()
-        print(f'got {len(self.worklist.works_as_list)} openalex works ready to match')
-        await self.match_dois()
+        print(f'got {len(self.openalex_keys)} openalex keys & {len(self.repository_keys)} repository keys ready to match')
+        await self.match_works()
         return self.results
 
     async def get_works(self):
-        async def process_works(data):
-            for work in data:
-                try:
-                    doi = await normalize_doi(work.get('doi')) if work.get('doi') else None
-                except ValueError as e:
-                    print(f'{work.get("id")} has invalid DOI: {work.get("doi")} - got error: {e}')
-                    doi = None
-                work = Work(id=work.get('id'), doi=doi)
-                self.worklist.add_work(work)
-        async def process_unmatched_works(data):
-            for pure_item in data:
-                doi = None
-                if pure_item.get('doi'):
-                    doi = await normalize_doi(pure_item['doi'])
-                work = Work(id=pure_item.get('id'), doi=doi, internal_repo_id=pure_item.get('internal_repository_id'))
-                self.unmatched_works.add_work(work)
-
-        data = []
-        batchlen = 1000
-        async for work in self.motorclient.works_openalex.find({}, projection={'id': 1, 'doi': 1}):
-            data.append(work)
-            if len(data) == batchlen:
-                await process_works(data)
-                data = []
-        await process_works(data)
-        data = []
-        async for pure_item in self.motorclient['openaire_cris_publications'].find({}, projection={'id': 1, 'doi': 1, 'internal_repository_id': 1}):
-            data.append(pure_item)
-            if len(data) == batchlen:
-                await process_unmatched_works(data)
-                data = []
-        await process_unmatched_works(data)
-
-    async def match_dois(self):
-
-        console.print(f'OpenAlex works: {len(self.worklist.get_all('doi').keys())} with dois | {len(self.worklist.get_all('id').keys())} with ids')
-        console.print(f'Repository works: {len(self.unmatched_works.get_all('doi').keys())} with dois | {len(self.unmatched_works.get_all('id').keys())} with ids')
-        self.matches = self.unmatched_works.match_multiple(self.worklist.get_all())
-        print(f'found {len(self.matches.keys())} matches.')
-        for pid, work_dict in self.matches.items():
+        '''
+        loads the matching fields of the openalex & repository works into WorkKeyTables
+        '''
+        start = time.perf_counter()
+        async for work in self.motorclient.works_openalex.find({}, projection={'id': 1, 'doi': 1, 'title': 1,
+                                                                              'publication_year': 1},
+                                                               batch_size=5000):
+            work_id = work.get('id')
+            if not work_id:
+                continue
+            self.openalex_keys.add(work_id, 'doi', work.get('doi'))
+            self.openalex_keys.add(work_id, 'title_year', work.get('title'), work.get('publication_year'))
+
+        async for pure_item in self.motorclient['openaire_cris_publications'].find({}, projection={
+            'id': 1, 'doi': 1, 'title': 1, 'publication_date': 1, 'internal_repository_id': 1},
+                                                                                   batch_size=5000):
+            repo_id = pure_item.get('internal_repository_id')
+            if not repo_id:
+                continue
+            self.current_ids[repo_id] = pure_item.get('id')
+            if pure_item.get('doi'):
+                self.repository_dois[repo_id] = pure_item['doi']
+            year = str(pure_item.get('publication_date') or '')[:4]
+            year = int(year) if year.isdigit() else None
+            self.repository_keys.add(repo_id, 'doi', pure_item.get('doi'))
+            self.repository_keys.add(repo_id, 'title_year', pure_item.get('title'), year)
+        console.print(f'loaded matching keys in {time.perf_counter() - start:.1f}s')
+
+    async def match_works(self):
+        '''
+        matches all repository works against the openalex works and stores the openalex id in the 'id' field of
+        the repository items, using bulk writes. only changed matches are written.
+        '''
+        start = time.perf_counter()
+        matches, counts = match_work_keys(self.openalex_keys.normalise(), self.repository_keys.normalise())
+        match_time = time.perf_counter() - start
+
+        table = Table(title='Work matches per key')
+        for column in ['key', 'candidates', 'ambiguous', 'matches']:
+            table.add_column(column)
+        for key in WORK_MATCH_KEYS:
+            table.add_row(key, *[str(counts[key][c]) for c in ['candidates', 'ambiguous', 'matches']])
+        console.print(table)
+        console.print(f'matched {len(matches)} of {len(self.current_ids)} repository works in {match_time:.2f}s '
+                      f'({counts["conflicts"]} with conflicting candidates, resolved by key preference)')
+
+        operations = []
+        for repo_id, openalex_id in zip(matches['target_id'], matches['source_id']):
+            if self.current_ids.get(repo_id) == openalex_id:
+                continue
+            operations.append(UpdateOne({'internal_repository_id': repo_id}, {'$set': {'id': openalex_id}}))
+        for i in range(0, len(operations), self.write_batch_size):
             try:
-                found_work = work_dict['found_work']
-                search_work = work_dict['search_param']
-                result = await self.motorclient.openaire_cris_publications.update_one({'internal_repository_id': found_work.internal_repo_id}, {'$set': {'id': search_work.id}})
-            except Exception as e:
-                print(f'Error adding match:\n     repo item {search_work} <|> found work {found_work}:\n        {e}')
-
-        print('unmatched_works contents before filtering out matches & non-doi works:')
-        print(self.unmatched_works)
-        self.unmatched_works.remove_works_without_doi()
-        self.unmatched_works.get_unmatched_works()
-
-        print('unmatched_works contents after filtering out matches & non-doi works:')
-        print(self.unmatched_works)
-        console.print(f'{len(self.unmatched_works.get_unmatched_works())} publications with DOIs in the repository currently unmatched with OpenAlex works.\n Disabled retrieving missing DOIs from OpenAlex API.')
+                result = await self.motorclient.openaire_cris_publications.bulk_write(
+                    operations[i:i + self.write_batch_size], ordered=False)
+                self.results['written'] += result.modified_count
+            except BulkWriteError as e:
+                print(f'Error adding matches: {len(e.details.get("writeErrors", []))} write errors')
+
+        matched = set(matches['target_id'])
+        self.unmatched_dois = [doi for repo_id, doi in self.repository_dois.items() if repo_id not in matched]
+        self.results['total'] = len(matches)
+        self.results['keys'] = counts
+        console.print(f'{self.results["written"]} new or changed matches written. '
+                      f'{len(self.unmatched_dois)} publications with DOIs in the repository currently unmatched '
+                      f'with OpenAlex works.\n Disabled retrieving missing DOIs from OpenAlex API.')
         #await self.get_missing_dois()
 
     async def get_missing_dois(self):
-        dois = [work.doi for work in self.unmatched_works.get_unmatched_works()]
-        dois = await remove_invalid_dois(dois)
+        dois = []
+        for doi in self.unmatched_dois:
+            try:
+                dois.append(await normalize_doi(doi))
+            except ValueError as e:
+                print(f'invalid DOI {doi}: {e}')
+        dois = await remove_invalid_dois([doi for doi in dois if doi])
         if dois:
             console.print(f'getting OpenAlex works for {len(dois)} dois')
             query = OpenAlexQuery(mongoclient=MusMongoClient(), mongocollection=MusMongoClient().works_openalex, pyalextype='works', item_ids=dois, id_type='doi')
@@ -415,8 +472,7 @@ class WorkMatcher():
             console.print(f'added {len(results["results"])} works to works_openalex collection using missing dois.')
             console.print(f'full results: {results}')
             if len(results["results"])>0:
-                console.print('Advice: re-run WorkMatcher().match_dois() for possible new matches.')
+                console.print('Advice: re-run WorkMatcher().match_works() for possible new matches.')
 
         else:
             console.print('no missing dois!')
-
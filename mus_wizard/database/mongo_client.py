@@ -1,9 +1,56 @@
+from datetime import datetime
+
 import motor.motor_asyncio
 from pymongo import IndexModel
 
 from mus_wizard.constants import MONGOURL
 
 
+class HarvestWatermarks:
+    '''
+    persistent per-source high-water-marks for incremental (delta) harvesting
+    each watermark is stored as a document {source, set, last_harvest} in the given collection
+    (normally the 'harvest_watermarks' collection)
+
+    usage:
+        watermarks = HarvestWatermarks(db['harvest_watermarks'])
+        since = await watermarks.get('openalex', 'works:2024')  # None if never harvested
+        started = datetime.now(timezone.utc)
+        ... harvest all records changed since `since` ...
+        await watermarks.set('openalex', 'works:2024', started)
+    '''
+
+    def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection):
+        self.collection: motor.motor_asyncio.AsyncIOMotorCollection = collection
+
+    async def get(self, source: str, set_name: str) -> datetime | None:
+        '''
+        returns the last_harvest datetime for this source and set, or None if there is none
+        '''
+        watermark = await self.collection.find_one({'source': source, 'set': set_name},
+                                                   projection={'last_harvest': 1})
+        if watermark:
+            return watermark.get('last_harvest')
+        return None
+
+    async def set(self, source: str, set_name: str, last_harvest: datetime) -> None:
+        '''
+        stores last_harvest for this source and set
+        only call this after a harvest has finished successfully; use the time the harvest started
+        '''
+        await self.collection.update_one({'source': source, 'set': set_name},
+                                         {'$set': {'last_harvest': last_harvest}}, upsert=True)
+
+    async def reset(self, source: str, set_name: str = None) -> None:
+        '''
+        removes the watermark(s) for a source, forcing a full harvest next time
+        '''
+        query = {'source': source}
+        if set_name:
+            query['set'] = set_name
+        await self.collection.delete_many(query)
+
+
 class MusMongoClient:
     '''
     creates connections to mongodb using asyncio motor client
@@ -45,6 +92,8 @@ class MusMongoClient:
         self.deals_journalbrowser: motor.motor_asyncio.AsyncIOMotorCollection = self.mongoclient['deals_journalbrowser']
         self.employees_peoplepage: motor.motor_asyncio.AsyncIOMotorCollection = self.mongoclient['employees_peoplepage']
 
+        self.harvest_watermarks: motor.motor_asyncio.AsyncIOMotorCollection = self.mongoclient['harvest_watermarks']
+
 
     async def add_indexes(self):
         # works_openalex:
@@ -81,6 +130,8 @@ class MusMongoClient:
             IndexModel('affiliations.institution.display_name'),
             IndexModel('topics.id'),
             IndexModel('ids'),
+            IndexModel('ids.orcid'),
+            IndexModel('ids.scopus'),
             IndexModel('orcid'),
         ])
         # authors_pure:
@@ -197,3 +248,8 @@ class MusMongoClient:
             IndexModel('authors'),
         ])
 
+        # harvest_watermarks:
+        # source + set
+        await self.harvest_watermarks.create_indexes([
+            IndexModel([('source', 1), ('set', 1)], unique=True),
+        ])
@@ -0,0 +1,163 @@
+'''
+Blocked fuzzy name matching, used to match author names from different sources (e.g. repository persons vs OpenAlex
+authors, or Pure entry contributors vs Author objects).
+
+Instead of scoring every name against every other name, names are grouped into blocks on their normalised surname +
+first initial ('van der Berg, J.' and 'Jan van der Berg' both end up in block 'berg|j'). Only names within the same
+block are scored, using rapidfuzz.process.cdist; blocks can be spread over worker processes. The index keeps the
+ids for each name, so a match directly returns the matching ids without any follow-up queries.
+
+Usage:
+    index = NameIndex()
+    for author in authors:
+        index.add(author['display_name'], author['id'])
+    matches = index.match(names, workers=4)  # {name: NameMatch(name, matched_name, score, ids)}
+    match = index.match_one('Smith, J.')
+'''
+
+import re
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from rapidfuzz import fuzz, process
+
+# lowercase particles that can follow the first names in 'Last, First particle' names
+NAME_PARTICLES = {'van', 'der', 'den', 'de', 'het', 'ter', 'ten', 'te', 'von', 'zu', 'du', 'la', 'le', 'da', 'di',
+                  'del', 'dos', 'das', 'in'}
+
+
+def normalize_name_part(value: str) -> str:
+    '''
+    ascii, lowercase, only letters & single spaces
+    '''
+    value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(re.sub(r'[^a-z]+', ' ', value).split())
+
+
+def split_name(name: str) -> tuple[str, str]:
+    '''
+    returns the normalised (first names, surname) of a name in 'Last, First' or 'First Last' format
+    '''
+    if ',' in name:
+        last, first = name.split(',', 1)
+    else:
+        parts = name.split()
+        if not parts:
+            return '', ''
+        last, first = parts[-1], ' '.join(parts[:-1])
+    first = normalize_name_part(first)
+    last = normalize_name_part(last)
+    # particles written after the first names ('Berg, J. van der') belong to the surname
+    if ',' in name and first:
+        tokens = first.split()
+        while len(tokens) > 1 and tokens[-1] in NAME_PARTICLES:
+            last = f'{tokens.pop()} {last}'
+        first = ' '.join(tokens)
+    return first, last
+
+
+def name_key(name: str) -> tuple[str | None, str]:
+    '''
+    returns the (block key, normalised full name) of a name; the block key is None if the name has no surname
+    '''
+    first, last = split_name(name)
+    if not last:
+        return None, ''
+    block = f'{last.split()[-1]}|{first[:1]}'
+    return block, f'{first} {last}'.strip()
+
+
+@dataclass
+class NameMatch:
+    name: str
+    matched_name: str
+    score: float
+    ids: set
+
+
+def score_blocks(blocks: list[tuple[list[str], list[str]]], scorer: Callable,
+                 score_cutoff: float) -> list[list[tuple[int, float] | None]]:
+    '''
+    scores the queries against the choices of each (queries, choices) block using rapidfuzz.process.cdist
+    returns per block, per query the (index of the best choice, score), or None if no choice reaches score_cutoff
+    module-level function, so it can be used in a ProcessPoolExecutor
+    '''
+    results = []
+    for queries, choices in blocks:
+        scores = process.cdist(queries, choices, scorer=scorer, score_cutoff=score_cutoff, dtype='float32')
+        block_result = []
+        for row in scores:
+            best = int(row.argmax())
+            block_result.append((best, float(row[best])) if row[best] > 0 else None)
+        results.append(block_result)
+    return results
+
+
+class NameIndex():
+    '''
+    Index of names -> ids, grouped in surname + first initial blocks for fuzzy matching
+    '''
+
+    def __init__(self) -> None:
+        self.ids: dict[str, set] = defaultdict(set)
+        self.names: dict[str, str] = {}
+        self.blocks: dict[str, list[str]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str | None, id) -> None:
+        '''
+        adds a name for id; a normalised name can belong to multiple ids
+        '''
+        if not name or not isinstance(name, str):
+            return
+        block, normalized = name_key(name)
+        if not block:
+            return
+        if normalized not in self.names:
+            self.names[normalized] = name
+            self.blocks[block].append(normalized)
+        self.ids[normalized].add(id)
+
+    def match(self, names: Iterable[str], scorer: Callable = fuzz.QRatio, score_cutoff: float = 90,
+              workers: int = 0, chunk_size: int = 2000) -> dict[str, NameMatch]:
+        '''
+        matches names against the index, only scoring names within the same block
+        workers: number of processes to score the blocks in, 0 scores them in this process
+        chunk_size: number of blocks per process pool task
+        returns {name: NameMatch} for the names with a match
+        '''
+        queries = defaultdict(list)
+        for name in set(names):
+            if not name or not isinstance(name, str):
+                continue
+            block, normalized = name_key(name)
+            if block in self.blocks:
+                queries[block].append((name, normalized))
+
+        block_keys = list(queries.keys())
+        blocks = [([normalized for _, normalized in queries[key]], self.blocks[key]) for key in block_keys]
+        chunks = [blocks[i:i + chunk_size] for i in range(0, len(blocks), chunk_size)]
+        if workers and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                scored = [result for chunk in executor.map(score_blocks, chunks, [scorer] * len(chunks),
+                                                           [score_cutoff] * len(chunks)) for result in chunk]
+        else:
+            scored = [result for chunk in chunks for result in score_blocks(chunk, scorer, score_cutoff)]
+
+        matches = {}
+        for key, block_scores in zip(block_keys, scored):
+            choices = self.blocks[key]
+            for (name, _), best in zip(queries[key], block_scores):
+                if best is None:
+                    continue
+                matched = choices[best[0]]
+                matches[name] = NameMatch(name, self.names[matched], best[1], self.ids[matched])
+        return matches
+
+    def match_one(self, name: str, scorer: Callable = fuzz.QRatio, score_cutoff: float = 90) -> NameMatch | None:
+        return self.match([name], scorer=scorer, score_cutoff=score_cutoff).get(name)
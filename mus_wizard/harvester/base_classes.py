@@ -1,14 +1,25 @@
+import asyncio
 import functools
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional, Type
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional, Type
 
 import aiometer
+from asgiref.sync import sync_to_async
+from django.db.models import Max
 import httpx
 import motor.motor_asyncio
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from rich import print
 
 from mus_wizard.constants import MONGOURL
+from mus_wizard.database.copy_writer import CopyWriter
+from mus_wizard.database.db_pool import DBWorkerPool
 from mus_wizard.models import MusModel
 
 class GenericScraper:
@@ -81,6 +92,143 @@ class GenericScraper:
         return result
 
 
+class BulkUpsertWriter:
+    '''
+    Buffered writer stage for a mongodb collection.
+    Items are put into a bounded queue; a single consumer task turns them into UpdateOne(..., upsert=True) operations
+    and sends them to the collection as unordered bulk_write batches.
+    A batch is flushed when it reaches batch_size items, or when flush_interval seconds have passed since the last flush.
+    Items are deduplicated on id_field using a set of seen ids.
+
+    Usage:
+        writer = BulkUpsertWriter(collection, id_field='id')
+        writer.start()
+        await writer.put(item)  # returns False if the item was skipped (duplicate or missing id)
+        ...
+        stats = await writer.close()  # flushes remaining items, returns the stats dict
+
+    Stats:
+        batches: number of bulk_write calls
+        written: number of operations sent to mongodb
+        upserted / modified / matched: totals as reported by mongodb
+        duplicates: number of items skipped because their id was already seen
+        errors: number of failed write operations
+        batch_latency: summary of the bulk_write durations (count, mean/min/max/percentiles in ms, see StageStats)
+        elapsed: seconds between start() and close()
+        items_per_second: written / elapsed
+    '''
+
+    _STOP = object()
+
+    def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, id_field: str = 'id',
+                 batch_size: int = 500, flush_interval: float = 5.0, queue_size: int = 2000) -> None:
+        self.collection: motor.motor_asyncio.AsyncIOMotorCollection = collection
+        self.id_field: str = id_field
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.seen_ids: set = set()
+        self.stats: dict = {
+            'batches'         : 0,
+            'written'         : 0,
+            'upserted'        : 0,
+            'modified'        : 0,
+            'matched'         : 0,
+            'duplicates'      : 0,
+            'errors'          : 0,
+            'batch_latency'   : {},
+            'elapsed'         : 0,
+            'items_per_second': 0,
+        }
+        self._task: asyncio.Task | None = None
+        self._start: float = 0
+        # streaming aggregates: memory use doesn't grow with the number of batches
+        self.latencies: StageStats = StageStats()
+
+    def start(self) -> None:
+        '''
+        Starts the consumer task. Must be called from within a running event loop.
+        '''
+        self._start = time.perf_counter()
+        self._task = asyncio.create_task(self._consume())
+
+    async def put(self, item: dict) -> bool:
+        '''
+        Adds an item to the write queue; waits if the queue is full.
+        Returns True if the item was queued, False if it was skipped.
+        '''
+        item_id = item.get(self.id_field)
+        if item_id is None:
+            return False
+        if item_id in self.seen_ids:
+            self.stats['duplicates'] += 1
+            return False
+        self.seen_ids.add(item_id)
+        await self.queue.put(item)
+        return True
+
+    async def close(self) -> dict:
+        '''
+        Flushes all remaining items, stops the consumer task and returns the stats dict
+        '''
+        if self._task:
+            await self.queue.put(self._STOP)
+            await self._task
+            self._task = None
+        self.stats['batch_latency'] = self.latencies.summary()
+        self.stats['elapsed'] = round(time.perf_counter() - self._start, 2)
+        if self.stats['elapsed']:
+            self.stats['items_per_second'] = round(self.stats['written'] / self.stats['elapsed'], 2)
+        return self.stats
+
+    async def _consume(self) -> None:
+        batch = []
+        last_flush = time.perf_counter()
+        while True:
+            timeout = max(self.flush_interval - (time.perf_counter() - last_flush), 0)
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is self._STOP:
+                await self._flush(batch)
+                return
+            if item is not None:
+                batch.append(UpdateOne({self.id_field: item[self.id_field]}, {'$set': item}, upsert=True))
+            if len(batch) >= self.batch_size or (batch and time.perf_counter() - last_flush >= self.flush_interval):
+                await self._flush(batch)
+                batch = []
+                last_flush = time.perf_counter()
+            elif not batch:
+                last_flush = time.perf_counter()
+
+    async def _flush(self, batch: list[UpdateOne]) -> None:
+        if not batch:
+            return
+        start = time.perf_counter_ns()
+        try:
+            result = await self.collection.bulk_write(batch, ordered=False)
+            self.stats['upserted'] += result.upserted_count
+            self.stats['modified'] += result.modified_count
+            self.stats['matched'] += result.matched_count
+        except BulkWriteError as e:
+            self.stats['upserted'] += e.details.get('nUpserted', 0)
+            self.stats['modified'] += e.details.get('nModified', 0)
+            self.stats['matched'] += e.details.get('nMatched', 0)
+            self.stats['errors'] += len(e.details.get('writeErrors', []))
+            print(f'{len(e.details.get("writeErrors", []))} errors while writing batch to {self.collection.name}')
+        except Exception as e:
+            self.stats['errors'] += len(batch)
+            print(f'error {e} while writing batch of {len(batch)} items to {self.collection.name}')
+        duration_ns = time.perf_counter_ns() - start
+        self.latencies.add(duration_ns)
+        latency = round(duration_ns / 1e9, 3)
+        self.stats['batches'] += 1
+        self.stats['written'] += len(batch)
+        print(
+            f'[red]{self.stats["written"]}[/red] items written to {self.collection.name} ([cyan]+{len(batch)}[/cyan] in {latency}s)')
+
+
 class GenericAPI():
     '''
     Generic API class, with default methods
@@ -127,11 +275,15 @@ class GenericAPI():
             'headers'       : {},
             'tokens'        : {},
             'max_at_once'   : 1,
-            'max_per_second': 1
+            'max_per_second': 1,
+            'write_batch_size'    : 500,
+            'write_flush_interval': 5.0,
+            'write_queue_size'    : 2000,
         }
 
     def set_api_settings(self, url: str = None, headers: dict = None, tokens: dict = None, max_at_once: int = None,
-                         max_per_second: int = None) -> None:
+                         max_per_second: int = None, write_batch_size: int = None, write_flush_interval: float = None,
+                         write_queue_size: int = None) -> None:
         if url:
             self.api_settings['url'] = url
         if headers:
@@ -142,6 +294,12 @@ class GenericAPI():
             self.api_settings['max_at_once'] = max_at_once
         if max_per_second:
             self.api_settings['max_per_second'] = max_per_second
+        if write_batch_size:
+            self.api_settings['write_batch_size'] = write_batch_size
+        if write_flush_interval:
+            self.api_settings['write_flush_interval'] = write_flush_interval
+        if write_queue_size:
+            self.api_settings['write_queue_size'] = write_queue_size
 
     async def run(self) -> dict:
         '''
@@ -164,36 +322,31 @@ class GenericAPI():
     async def get_item_results(self) -> None:
         '''
         uses call_api() to get the result for each item in itemlist and puts them in the mongodb collection
+        responses are passed on to a BulkUpsertWriter, which writes them in batches;
+        the write stats are stored in self.results['bulk_write']
         '''
-        insertlist = []
-        apiresponses = []
-        i = 0
-        async with aiometer.amap(functools.partial(self.call_api), self.itemlist,
-                                 max_at_once=self.api_settings['max_at_once'],
-                                 max_per_second=self.api_settings['max_per_second']) as responses:
-            async for response in responses:
-                apiresponses.append(response)
-                i = i + 1
-                if i >= 100 or len(apiresponses) == len(self.itemlist):
-                    newlist = [x for x in apiresponses if x not in insertlist]
-                    insertlist.extend(newlist)
-                    for item in newlist:
-                        if isinstance(item, list):
-                            for subitem in item:
-                                await self.collection.find_one_and_update({"id": subitem['id']}, {'$set': subitem},
-                                                                          upsert=True)
-                                self.results['ids'].append(subitem['id'])
-                                self.results['total'] = self.results['total'] + 1
-                        elif isinstance(item, dict):
-                            await self.collection.find_one_and_update({"id": item['id']}, {'$set': item}, upsert=True)
+        writer = BulkUpsertWriter(self.collection, id_field='id',
+                                  batch_size=self.api_settings['write_batch_size'],
+                                  flush_interval=self.api_settings['write_flush_interval'],
+                                  queue_size=self.api_settings['write_queue_size'])
+        writer.start()
+        try:
+            async with aiometer.amap(functools.partial(self.call_api), self.itemlist,
+                                     max_at_once=self.api_settings['max_at_once'],
+                                     max_per_second=self.api_settings['max_per_second']) as responses:
+                async for response in responses:
+                    items = response if isinstance(response, list) else [response]
+                    for item in items:
+                        if not isinstance(item, dict):
+                            print(f'received unexpected type {type(item)}')
+                            continue
+                        if await writer.put(item):
                             self.results['ids'].append(item['id'])
                             self.results['total'] = self.results['total'] + 1
-                        else:
-                            print(f'received unexpected type {type(item)}')
-                    print(
-                        f'[red]{len(insertlist)}[/red] {self.item_id_type}s added to {self.collectionname} ([cyan]+{len(newlist)}[/cyan])')
-
-                    i = 0
+        finally:
+            self.results['bulk_write'] = await writer.close()
+        print(
+            f'[red]{self.results["total"]}[/red] {self.item_id_type}s added to {self.collectionname} in {self.results["bulk_write"]["batches"]} batches ({self.results["bulk_write"]["items_per_second"]} items/s)')
 
     async def call_api(self, item) -> dict:
         '''
@@ -204,120 +357,328 @@ class GenericAPI():
         return result
 
 
-@dataclass
-class FunctionCallsStats:
+class StageStats:
     '''
-    class that stores time-related stats for a function call of a certain method.
-    Meant to used as part of a Performance object to get insight into the performance.
-    Attributes:
-        duration: float
-            the duration of the function call in seconds with max 2 decimals
-        start: datetime
-            date+time when the function was called
-        end: datetime
-            date+time when the function returned
-
+    streaming aggregates for the durations (in ns) of one stage: count, sum, min, max and a log-linear (HDR-style)
+    histogram for percentiles. Memory use is independent of the number of calls: the histogram has at most
+    2**(SUB_BUCKET_BITS-1) buckets per power of two; percentiles are reported as bucket midpoints (max ~3% off).
     '''
-    duration: float
-    start: datetime
-    end: datetime 
-    method: callable
+    SUB_BUCKET_BITS = 5
+    __slots__ = ('count', 'total_ns', 'min_ns', 'max_ns', 'buckets')
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.total_ns: int = 0
+        self.min_ns: int | None = None
+        self.max_ns: int = 0
+        self.buckets: dict[int, int] = {}
+
+    @classmethod
+    def bucket_index(cls, value: int) -> int:
+        shift = max(value.bit_length() - cls.SUB_BUCKET_BITS, 0)
+        return (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
 
-    def __init__(self, method: callable):
+    @classmethod
+    def bucket_value(cls, index: int) -> int:
         '''
-        Parameters:
-        method: callable
-            the function that was called
+        returns the midpoint of the range of values in the bucket
         '''
-        self.method = method
-        self.start = datetime.now()
-        self.end = None
+        shift = index >> cls.SUB_BUCKET_BITS
+        lowest = (index & ((1 << cls.SUB_BUCKET_BITS) - 1)) << shift
+        return lowest + ((1 << shift) >> 1)
 
-    def set_end(self) -> None:
+    def add(self, duration_ns: int) -> None:
+        self.count += 1
+        self.total_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        index = self.bucket_index(duration_ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, q: float) -> int:
         '''
-        Sets the end time of the function call
+        returns the (approximate) q-th percentile (0-100) of the durations in ns
         '''
-        self.end = datetime.now()
-        self.duration = round((self.end - self.start).total_seconds(), 2)
+        if not self.count:
+            return 0
+        rank = max(1, round(q / 100 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(max(self.bucket_value(index), self.min_ns), self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> dict[str, int | float]:
+        def ms(value_ns: int) -> float:
+            return round(value_ns / 1e6, 3)
+
+        return {
+            'count'  : self.count,
+            'total_s': round(self.total_ns / 1e9, 3),
+            'mean_ms': ms(self.total_ns / self.count) if self.count else 0,
+            'min_ms' : ms(self.min_ns or 0),
+            'max_ms' : ms(self.max_ns),
+            'p50_ms' : ms(self.percentile(50)),
+            'p90_ms' : ms(self.percentile(90)),
+            'p99_ms' : ms(self.percentile(99)),
+        }
 
 
-@dataclass
 class Performance:
     '''
-    class that stores the results of all function class of a certain method.
-    Meant to be used for a continuous series of function calls in order to get insight into the performance
-    Advice: use a separate instance for each batch of sql additions, e.g. work_performance, source_performance, etc
+    low-overhead timing of the function calls/stages of an importer, using perf_counter_ns and per-stage
+    streaming aggregates (StageStats) instead of storing each call.
+    Advice: use a separate instance for each importer, e.g. work_performance, source_performance, etc
+    If enabled is False all calls are no-ops, so the instrumentation can stay in place.
 
     Usage:
     - Init a Performance object for each batch of method calls
         perf = Performance()
-    - Call start_call(method) for each inidividual method call
+    - Call start_call(method) for each individual method call (the stage name is the method name, or pass a str)
         perf.start_call(add_items)
-    - end_call() once the method ends
+    - end_call() once the method ends; calls can be nested
         perf.end_call()
+    - or use the timer context manager
+        with perf.timer('write_batch'):
+            ...
 
     Then view results using:
-        perf.total_counted_duration()
+        perf.total_measured_duration()
         perf.elapsed_time()
         perf.time_per_call()
-
+        perf.summary()  # per stage: count, total, mean/min/max & p50/p90/p99
+        perf.to_json('metrics.json')
     '''
 
-    calls: list[FunctionCallsStats]
-
-    def __init__(self) -> None:
-        self.calls = []
+    def __init__(self, enabled: bool = True, name: str = '') -> None:
+        self.enabled: bool = enabled
+        self.name: str = name
+        self.stages: dict[str, StageStats] = {}
+        self.running: list[tuple[str, int]] = []
+        self.created_ns: int = time.perf_counter_ns()
+        self.first_start_ns: int | None = None
+        self.last_end_ns: int | None = None
 
     def __str__(self) -> str:
-        return f'{len(self.calls)} calls in {self.total_measured_duration()} s - {self.time_per_call()} s/call'
+        calls = sum(stats.count for stats in self.stages.values())
+        return f'{calls} calls in {self.total_measured_duration()} s - {self.time_per_call()} s/call'
 
-    def start_call(self, method: callable) -> None:
+    @staticmethod
+    def stage_name(method: Callable | str) -> str:
+        if isinstance(method, str):
+            return method
+        return getattr(method, '__qualname__', repr(method))
+
+    def start_call(self, method: Callable | str) -> None:
         '''
         Records the start time of a new function call of method
         '''
-        self.calls.append(FunctionCallsStats(method))
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        if self.first_start_ns is None:
+            self.first_start_ns = now
+        self.running.append((self.stage_name(method), now))
 
     def end_call(self) -> None:
         '''
-        Records the end time of the function call
+        Records the end time of the last started function call
         '''
-        self.calls[-1].set_end()
+        if not self.enabled or not self.running:
+            return
+        now = time.perf_counter_ns()
+        name, start = self.running.pop()
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        stats.add(now - start)
+        self.last_end_ns = now
+
+    @contextmanager
+    def timer(self, method: Callable | str):
+        self.start_call(method)
+        try:
+            yield
+        finally:
+            self.end_call()
 
-    def total_measured_duration(self, method: Optional[callable] = None) -> int:
+    def selected_stages(self, method: Optional[Callable | str] = None) -> list[StageStats]:
+        if method:
+            stats = self.stages.get(self.stage_name(method))
+            return [stats] if stats else []
+        return list(self.stages.values())
+
+    def total_measured_duration(self, method: Optional[Callable | str] = None) -> float:
         '''
-        Returns the sum of all function call durations in seconds (int)
-        if method is passed, only the duration of instances of that method is returned
+        Returns the sum of all function call durations in seconds (max 2 decimals)
+        if method is passed, only the duration of calls of that method is returned
         '''
-        if not self.calls:
-            return 0
-        if method:
-            return sum([funcstat.duration for funcstat in self.calls if funcstat.method == method])
-        else:
-            return sum([funcstat.duration for funcstat in self.calls])
+        return round(sum(stats.total_ns for stats in self.selected_stages(method)) / 1e9, 2)
 
     def elapsed_time(self) -> int:
         '''
-        Returns the time between the first start and last end of all calls in the list in seconds (int)
+        Returns the time between the first start and last end of all calls in seconds (int)
+        if disabled, the time since this object was created
         '''
-        if not self.calls:
+        if not self.enabled:
+            return int((time.perf_counter_ns() - self.created_ns) / 1e9)
+        if self.first_start_ns is None or self.last_end_ns is None:
             return 0
-        self.calls.sort(key=lambda funcstat: funcstat.start)
-        first = self.calls[0].start
-        self.calls.sort(key=lambda funcstat: funcstat.end)
-        last = self.calls[-1].end
-        return int((last - first).total_seconds())
+        return int((self.last_end_ns - self.first_start_ns) / 1e9)
 
-    def time_per_call(self, method: Optional[callable] = None) -> float:
+    def time_per_call(self, method: Optional[Callable | str] = None) -> float:
         '''
-        Returns the average time per item in seconds (with max 2 decimals)
+        Returns the average time per call in seconds (with max 2 decimals)
         '''
-        if not self.calls:
+        stages = self.selected_stages(method)
+        calls = sum(stats.count for stats in stages)
+        if not calls:
             return 0
-        if not method:
-            return round((self.total_measured_duration() / len(self.calls)), 2)
-        else:
-            calls = [funcstat for funcstat in self.calls if funcstat.method == method]
-            return round((self.total_measured_duration() / len(calls)), 2)
+        return round(sum(stats.total_ns for stats in stages) / calls / 1e9, 2)
+
+    def summary(self) -> dict[str, dict]:
+        return {name: stats.summary() for name, stats in self.stages.items()}
+
+    def to_json(self, path: str = None) -> str:
+        '''
+        returns the metrics as json; if path is passed the json is also written to that file
+        '''
+        metrics = json.dumps({
+            'name'        : self.name,
+            'exported_at' : datetime.now().isoformat(),
+            'elapsed_time': self.elapsed_time(),
+            'stages'      : self.summary(),
+        }, indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(metrics)
+        return metrics
+
+
+class ForeignKeyResolver():
+    '''
+    LRU cache of unique id (e.g. openalex_id) -> pk for a model, shared between the SQL importers so foreign keys
+    can be resolved without a query per reference.
+
+    - preload(): bulk-loads up to max_size entries with values_list(key_field, 'pk', *fields)
+    - resolve() / resolve_many(): ids that are not in the cache are retrieved with chunked __in queries;
+      ids that are not in the db are cached as None
+    - add(): registers a newly created object
+    - stats(): hit/miss/query counters, e.g. to add to the import results
+
+    fields: extra fields to cache; if passed, the cached value is a tuple (pk, *fields) instead of the pk
+    '''
+
+    def __init__(self, model: Type[MusModel], key_field: str = 'openalex_id', fields: tuple[str, ...] = (),
+                 max_size: int = 500_000, chunk_size: int = 1000) -> None:
+        self.model: Type[MusModel] = model
+        self.key_field: str = key_field
+        self.fields: tuple[str, ...] = fields
+        self.max_size: int = max_size
+        self.chunk_size: int = chunk_size
+        self.cache: OrderedDict[str, int | tuple | None] = OrderedDict()
+        self.preloaded: bool = False
+        self.counters: dict[str, int] = {'hits': 0, 'misses': 0, 'queries': 0, 'not_found': 0, 'evicted': 0,
+                                         'preloaded': 0}
+
+    def value(self, row: tuple) -> int | tuple:
+        return row[1] if not self.fields else tuple(row[1:])
+
+    def put(self, key: str, value: int | tuple | None) -> None:
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.counters['evicted'] += 1
+
+    def add(self, key: str, value: int | tuple) -> None:
+        self.put(key, value)
+
+    async def preload(self) -> None:
+        '''
+        fills the cache with (up to max_size) rows of the model; only runs once
+        '''
+        if self.preloaded:
+            return
+        self.preloaded = True
+        rows = self.model.objects.values_list(self.key_field, 'pk', *self.fields)[:self.max_size]
+        async for row in rows:
+            self.put(row[0], self.value(row))
+            self.counters['preloaded'] += 1
+
+    async def resolve_many(self, keys: Iterable[str]) -> dict[str, int | tuple | None]:
+        '''
+        returns {key: pk (or (pk, *fields)) | None} for keys
+        '''
+        result = {}
+        missing = []
+        for key in dict.fromkeys(key for key in keys if key):
+            if key in self.cache:
+                self.counters['hits'] += 1
+                self.cache.move_to_end(key)
+                result[key] = self.cache[key]
+            else:
+                missing.append(key)
+        if not missing:
+            return result
+        self.counters['misses'] += len(missing)
+        found = {}
+        for i in range(0, len(missing), self.chunk_size):
+            chunk = missing[i:i + self.chunk_size]
+            self.counters['queries'] += 1
+            rows = self.model.objects.filter(**{f'{self.key_field}__in': chunk}).values_list(self.key_field, 'pk',
+                                                                                              *self.fields)
+            async for row in rows:
+                found[row[0]] = self.value(row)
+        for key in missing:
+            value = found.get(key)
+            if value is None:
+                self.counters['not_found'] += 1
+            self.put(key, value)
+            result[key] = value
+        return result
+
+    async def resolve(self, key: str | None) -> int | tuple | None:
+        if not key:
+            return None
+        if key in self.cache:
+            self.counters['hits'] += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        return (await self.resolve_many([key])).get(key)
+
+    def stats(self) -> dict[str, int | float | str]:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            'model'   : self.model.__name__,
+            'size'    : len(self.cache),
+            **self.counters,
+            'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else 0,
+        }
+
+
+def make_projection(*fields: str) -> dict:
+    '''
+    returns a mongodb projection that only retrieves fields (and not _id)
+    '''
+    return {'_id': 0} | {field: 1 for field in fields}
+
+
+def parse_updated_date(value: str | datetime | None) -> datetime | None:
+    '''
+    parses an openalex updated_date (e.g. '2024-05-01T12:34:56.123456') into an aware datetime (utc if no tz is given)
+    '''
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
 
 
 class GenericSQLImport():
@@ -326,8 +687,13 @@ class GenericSQLImport():
     '''
 
     def __init__(self, collection: motor.motor_asyncio.AsyncIOMotorCollection, model: MusModel,
-                 unique_id_field: str = 'openalex_id', more_data: dict[str, motor.motor_asyncio.AsyncIOMotorCollection] = None) -> None:
-        self.performance: Performance = Performance()
+                 unique_id_field: str = 'openalex_id', more_data: dict[str, motor.motor_asyncio.AsyncIOMotorCollection] = None,
+                 projection: dict = None, cursor_batch_size: int = 1000, use_copy: bool = False,
+                 update_fields: list[str] = None, metrics: bool = False, metrics_dir: str = None,
+                 db_pool: DBWorkerPool = None) -> None:
+        # timing metrics per stage, opt-in; exported as json to metrics_dir after import_all if set
+        self.performance: Performance = Performance(enabled=metrics, name=model.__name__)
+        self.metrics_dir: str | None = metrics_dir
         self.collection: motor.motor_asyncio.AsyncIOMotorCollection = collection
         self.model: Type[MusModel] = model
         self.results: dict = {
@@ -345,46 +711,364 @@ class GenericSQLImport():
         self.batch_size: int = 50
         self.new_items: list = []
         self.more_data: dict[str, dict] = more_data if more_data else {}
+        self.existing_ids: set = set()
+        # projection for the documents in collection, None retrieves the full documents
+        self.projection: dict | None = projection
+        # number of documents per cursor batch; more_data is also retrieved per batch
+        self.cursor_batch_size: int = cursor_batch_size
+        # write new items with postgresql COPY instead of abulk_create, see mus_wizard.database.copy_writer
+        self.use_copy: bool = use_copy
+        self.copy_writer: CopyWriter | None = CopyWriter(model, key_field=unique_id_field) if use_copy else None
+        # run batch writes in the background on the worker threads of db_pool, see mus_wizard.database.db_pool
+        self.db_pool: DBWorkerPool | None = db_pool
+        self.pending_writes: list[asyncio.Task] = []
+        # incremental sync (see sync_changed): the fields that are updated for changed items, None disables updates
+        self.update_fields: list[str] | None = update_fields
+        self.sync_updates: bool = False
+        self.existing_rows: dict = {}
+        self.changed_ids: set = set()
+        self.updated_items: list = []
 
-    async def import_all(self) -> dict:
-
-        models_in_db = self.model.objects.all().values_list(self.unique_id_field, flat=True)
-        models_in_db = {model async for model in models_in_db}
-        async for item in self.collection.find({}):
-            if len(self.more_data) > 0:
-                item = await self.add_more_data(item)
-            self.results['raw_items'] += 1
-            if item.get('id') not in models_in_db:
-                self.performance.start_call(self.add_item)
-                try:
-                    await self.add_item(item)
-                except Exception as e:
-                    self.results['errors'] += 1
-                    print(f'error {e} while adding {self.model.__name__}')
-                    self.performance.end_call()
-                    continue
-                self.performance.end_call()
-                self.results['added_to_sql'] += 1
+    async def load_existing_ids(self) -> set:
+        '''
+        loads the unique ids of all items of self.model already in the sql db into self.existing_ids
+        '''
+        if self.sync_updates:
+            # also keep the pk and openalex_updated_date of each item to detect & update changed items
+            rows = self.model.objects.all().values_list(self.unique_id_field, 'pk', 'openalex_updated_date')
+            self.existing_rows = {item_id: (pk, updated_date) async for item_id, pk, updated_date in rows}
+            self.existing_ids = set(self.existing_rows)
+            return self.existing_ids
+        self.existing_ids = {item_id async for item_id in
+                             self.model.objects.all().values_list(self.unique_id_field, flat=True)}
+        return self.existing_ids
 
-            else:
-                self.results['already_in_sql'] += 1
-            if len(self.raw_items) >= self.batch_size:
-                self.new_items.append(await self.model.objects.abulk_create(self.raw_items))
-                self.raw_items = []
+    def exists(self, item_id) -> bool:
+        '''
+        checks if an item with unique id item_id is already in the sql db (or queued for adding to it)
+        items that are being updated (self.changed_ids) don't count as existing
+        '''
+        return item_id in self.existing_ids and item_id not in self.changed_ids
 
-        if self.raw_items:
-            self.new_items.extend(await self.model.objects.abulk_create(self.raw_items))
-            self.raw_items = []
+    def is_changed(self, raw_item: dict) -> bool:
+        '''
+        checks if the updated_date of raw_item is newer than the openalex_updated_date of the item in the sql db
+        '''
+        row = self.existing_rows.get(self.get_raw_id(raw_item))
+        updated_date = parse_updated_date(raw_item.get('updated_date'))
+        if not row or not updated_date:
+            return False
+        return row[1] is None or updated_date > row[1]
+
+    def get_raw_id(self, raw_item: dict):
+        '''
+        returns the value in raw_item that matches self.unique_id_field
+        '''
+        return raw_item.get('id')
+
+    async def import_all(self, query: dict = None) -> dict:
+        '''
+        adds all items in self.collection (matching query, if given) that are not in the sql db yet
+        if self.sync_updates is set, items that changed in mongodb are updated as well, see sync_changed
+        '''
+        await self.load_existing_ids()
+        chunk = []
+        async for item in self.collection.find(query if query else {}, projection=self.projection,
+                                               batch_size=self.cursor_batch_size):
+            chunk.append(item)
+            if len(chunk) >= self.cursor_batch_size:
+                await self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            await self.import_chunk(chunk)
+
+        await self.flush_raw_items()
+        await self.wait_for_writes()
 
         print(len(self.new_items), self.model.__name__, "added to sql.")
         if self.new_items:
             await self.add_m2m_relations()
+        if self.updated_items:
+            print(len(self.updated_items), self.model.__name__, "updated in sql.")
+            await self.update_relations(self.updated_items)
 
         self.results['elapsed_time'] = self.performance.elapsed_time()
         self.results['average_time_per_call'] = self.performance.time_per_call()
         self.results['total_measured_duration'] = self.performance.total_measured_duration()
+        self.export_metrics()
         return self.results
 
+    def enable_metrics(self, metrics_dir: str = None) -> None:
+        self.performance.enabled = True
+        if metrics_dir:
+            self.metrics_dir = metrics_dir
+
+    def export_metrics(self) -> None:
+        '''
+        adds the per-stage metrics to self.results and writes them to metrics_dir/<model>_<timestamp>.json
+        '''
+        if not self.performance.enabled:
+            return
+        self.results['metrics'] = self.performance.summary()
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            path = os.path.join(self.metrics_dir,
+                                f'{self.model.__name__}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+            self.performance.to_json(path)
+            print(f'metrics for {self.model.__name__} written to {path}')
+
+    async def import_chunk(self, items: list[dict]) -> None:
+        '''
+        adds the items that are not yet in the sql db, more_data is retrieved for these items in one query per collection
+        '''
+        self.results['raw_items'] += len(items)
+        new_items = [item for item in items if not self.exists(self.get_raw_id(item))]
+        changed_items = []
+        if self.sync_updates:
+            changed_items = [item for item in items if self.exists(self.get_raw_id(item)) and self.is_changed(item)]
+        self.results['already_in_sql'] += len(items) - len(new_items) - len(changed_items)
+        if len(self.more_data) > 0 and (new_items or changed_items):
+            with self.performance.timer(self.add_more_data_batch):
+                new_items = await self.add_more_data_batch(new_items)
+                changed_items = await self.add_more_data_batch(changed_items)
+        if changed_items:
+            await self.update_changed(changed_items)
+        for item in new_items:
+            if self.exists(self.get_raw_id(item)):
+                self.results['already_in_sql'] += 1
+                continue
+            self.performance.start_call(self.add_item)
+            try:
+                await self.add_item(item)
+            except Exception as e:
+                self.results['errors'] += 1
+                print(f'error {e} while adding {self.model.__name__}')
+                self.performance.end_call()
+                continue
+            self.performance.end_call()
+            self.existing_ids.add(self.get_raw_id(item))
+            self.results['added_to_sql'] += 1
+
+            if len(self.raw_items) >= (self.copy_writer.batch_size if self.copy_writer else self.batch_size):
+                await self.flush_raw_items()
+
+    async def sync_changed(self, since: datetime | str = None) -> dict:
+        '''
+        incremental sync: only retrieves the documents with an updated_date newer than since (default: the newest
+        openalex_updated_date in the sql db). New items are added; existing items with a newer updated_date than their
+        openalex_updated_date are updated (self.update_fields) and their relations are rebuilt with update_relations.
+        Documents that are new in mongodb but have an older updated_date are only picked up by import_all.
+        '''
+        self.sync_updates = bool(self.update_fields)
+        if not self.sync_updates:
+            print(f'no update_fields set for {self.model.__name__}, only adding new items')
+        if since is None:
+            since = (await self.model.objects.aaggregate(since=Max('openalex_updated_date'))).get('since')
+        query = {}
+        if since:
+            if isinstance(since, datetime):
+                since = since.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')
+            query = {'updated_date': {'$gt': since}}
+            print(f'syncing {self.model.__name__} items updated since {since}')
+        return await self.import_all(query)
+
+    async def update_changed(self, raw_items: list[dict]) -> None:
+        '''
+        rebuilds the items for raw_items with add_item and writes the fields in self.update_fields that differ from
+        the current rows with abulk_update
+        '''
+        raw_ids = {self.get_raw_id(raw_item) for raw_item in raw_items}
+        self.changed_ids.update(raw_ids)
+        items = []
+        for raw_item in raw_items:
+            queued = len(self.raw_items)
+            try:
+                await self.add_item(raw_item)
+            except Exception as e:
+                self.results['errors'] += 1
+                print(f'error {e} while updating {self.model.__name__}')
+                continue
+            if len(self.raw_items) > queued:
+                item = self.raw_items.pop()
+                item.pk = self.existing_rows[self.get_raw_id(raw_item)][0]
+                items.append(item)
+        self.changed_ids.difference_update(raw_ids)
+        if not items:
+            return
+
+        fields = [self.model._meta.get_field(name) for name in self.update_fields]
+        current = self.model.objects.filter(pk__in=[item.pk for item in items]).values('pk', *[f.attname for f in fields])
+        current = {row['pk']: row async for row in current}
+        changed, changed_fields = [], set()
+        for item in items:
+            row = current.get(item.pk)
+            if not row:
+                continue
+            diff = {field.name for field in fields if field.to_python(getattr(item, field.attname)) != row[field.attname]}
+            if diff:
+                changed.append(item)
+                changed_fields.update(diff)
+        if changed:
+            await self.model.objects.abulk_update(changed, list(changed_fields), batch_size=self.batch_size)
+        self.updated_items.extend(items)
+        self.results['updated_in_sql'] = self.results.get('updated_in_sql', 0) + len(changed)
+
+    async def update_relations(self, items: list[MusModel]) -> None:
+        '''
+        called after items have been updated by sync_changed; overload in subclass to rebuild the relations of items
+        '''
+        pass
+
+    async def copy_raw_items(self) -> None:
+        with self.performance.timer(self.copy_raw_items):
+            self.new_items.extend(await self.copy_writer.awrite(self.raw_items))
+        self.raw_items = []
+        self.results['copy'] = self.copy_writer.results
+
+    async def flush_raw_items(self) -> None:
+        '''
+        writes the queued self.raw_items to the sql db (COPY or abulk_create)
+        with a db_pool the write is submitted to a worker thread and runs in the background, call wait_for_writes
+        before using self.new_items
+        '''
+        if not self.raw_items:
+            return
+        if not self.db_pool:
+            if self.copy_writer:
+                await self.copy_raw_items()
+            else:
+                with self.performance.timer('abulk_create'):
+                    self.new_items.extend(await self.model.objects.abulk_create(self.raw_items))
+                self.raw_items = []
+            return
+        items, self.raw_items = self.raw_items, []
+        with self.performance.timer('wait_for_db_worker'):
+            self.pending_writes.append(await self.db_pool.submit(self.write_raw_items, items))
+
+    def write_raw_items(self, items: list[MusModel]) -> list[MusModel]:
+        '''
+        blocking write of items, runs on a db_pool worker thread
+        '''
+        if self.copy_writer:
+            return self.copy_writer.write(items)
+        return self.model.objects.bulk_create(items)
+
+    async def wait_for_writes(self) -> None:
+        '''
+        waits for the writes submitted to the db_pool and adds the written items to self.new_items
+        '''
+        if not self.pending_writes:
+            return
+        with self.performance.timer(self.wait_for_writes):
+            results = await asyncio.gather(*self.pending_writes, return_exceptions=True)
+        self.pending_writes = []
+        for result in results:
+            if isinstance(result, Exception):
+                self.results['errors'] += 1
+                print(f'error {result} while writing {self.model.__name__} items')
+            else:
+                self.new_items.extend(result)
+        if self.copy_writer:
+            self.results['copy'] = self.copy_writer.results
+
+    async def run_db(self, func: Callable, *args, **kwargs):
+        '''
+        runs the blocking function func on a db_pool worker thread if set, with sync_to_async otherwise
+        '''
+        if self.db_pool:
+            return await self.db_pool.run(func, *args, **kwargs)
+        return await sync_to_async(func)(*args, **kwargs)
+
+    def write_objects(self, model: Type[MusModel], items: list[MusModel], ignore_conflicts: bool = False,
+                      batch_size: int = 1000) -> list[MusModel]:
+        '''
+        blocking version of bulk_write
+        '''
+        if not items:
+            return items
+        if self.use_copy:
+            return CopyWriter(model, ignore_conflicts=ignore_conflicts).write(items)
+        return model.objects.bulk_create(items, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+
+    async def bulk_write(self, model: Type[MusModel], items: list[MusModel], ignore_conflicts: bool = False,
+                         batch_size: int = 1000) -> list[MusModel]:
+        '''
+        writes items of any model (e.g. related objects or through table rows) with COPY if self.use_copy is set,
+        with abulk_create otherwise. The items have their pks set afterwards (except with ignore_conflicts).
+        with a db_pool the write runs on one of its worker threads
+        '''
+        if not items:
+            return items
+        if self.db_pool:
+            return await self.db_pool.run(self.write_objects, model, items, ignore_conflicts, batch_size)
+        if self.use_copy:
+            return await CopyWriter(model, ignore_conflicts=ignore_conflicts).awrite(items)
+        return await model.objects.abulk_create(items, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+
+    async def abulk_get_or_create(self, items: list[MusModel], key_field: str = None, model: Type[MusModel] = None,
+                                  update_fields: list[str] = None, batch_size: int = 1000) -> dict:
+        '''
+        bulk version of get_or_create: items are unsaved instances of model, identified by key_field
+        per batch the existing keys are retrieved with one __in query and the missing items are added with
+        abulk_create; if update_fields is set, existing rows are updated with update_conflicts (key_field has to be unique).
+        returns {key: pk} for all items
+        '''
+        model = model if model else self.model
+        key_field = key_field if key_field else self.unique_id_field
+        unique = model._meta.get_field(key_field).unique
+        if update_fields and not unique:
+            raise ValueError(f'update_fields requires a unique key_field, {model.__name__}.{key_field} is not unique')
+
+        pks = {}
+        for i in range(0, len(items), batch_size):
+            batch = {getattr(item, key_field): item for item in items[i:i + batch_size]}
+            batch.pop(None, None)
+            if update_fields:
+                await model.objects.abulk_create(list(batch.values()), update_conflicts=True,
+                                                 unique_fields=[key_field], update_fields=update_fields)
+                missing = list(batch)
+            else:
+                existing = model.objects.filter(**{f'{key_field}__in': list(batch)}).values_list(key_field, 'pk')
+                pks.update({key: pk async for key, pk in existing})
+                new_items = [item for key, item in batch.items() if key not in pks]
+                if not new_items:
+                    continue
+                # with ignore_conflicts the pks are not set on the items, so they are retrieved afterwards
+                await model.objects.abulk_create(new_items, ignore_conflicts=unique)
+                if not unique:
+                    pks.update({getattr(item, key_field): item.pk for item in new_items})
+                    continue
+                missing = [getattr(item, key_field) for item in new_items]
+            if missing:
+                retrieved = model.objects.filter(**{f'{key_field}__in': missing}).values_list(key_field, 'pk')
+                pks.update({key: pk async for key, pk in retrieved})
+        return pks
+
+    async def add_more_data_batch(self, items: list[dict]) -> list[dict]:
+        '''
+        batched version of add_more_data: retrieves the data for all items with one $in query per collection in
+        self.more_data and merges it into the items in memory
+        '''
+        for collection_name, collection_details in self.more_data.items():
+            collection: motor.motor_asyncio.AsyncIOMotorCollection = collection_details.get('collection')
+            unique_id_field: str = collection_details.get('unique_id_field')
+            unique_id_value: str = collection_details.get('unique_id_value')
+            projection: dict = collection_details.get('projection')
+
+            if any([collection is None, not unique_id_field, not unique_id_value]):
+                continue
+            if projection and any(projection.values()) and unique_id_field not in projection:
+                projection = projection | {unique_id_field: 1}
+            values = list({item.get(unique_id_value) for item in items if item.get(unique_id_value) is not None})
+            if not values:
+                continue
+            found = {}
+            async for more_data in collection.find({unique_id_field: {'$in': values}}, projection=projection or None):
+                found.setdefault(more_data.get(unique_id_field), more_data)
+            items = [item | found[item.get(unique_id_value)] if item.get(unique_id_value) in found else item
+                     for item in items]
+        return items
+
     async def add_more_data(self, item: dict) -> None:
         '''
         Adds data from other collections to the item
@@ -0,0 +1,328 @@
+'''
+lxml based parser backend for OAI-PMH ListRecords pages (oai_cerif_openaire & oai_dc)
+
+The parsers in this module stream the records of a page (or of a full export file) using lxml.etree.iterparse,
+and convert them into the exact same dicts xmltodict.parse() would produce -- so the CERIF mapping in
+OAI_PMH.process_cerif and the oai_dc handling in PureAPI can be used unchanged.
+
+Speedups compared to xmltodict:
+- parsing is done by libxml2 instead of expat + a python SAX handler
+- element.nsmap is only read until all namespace declarations of a record have been seen (counted using start-ns
+  events); the rest of the record uses cached tag names & attribute keys
+- processed records are cleared from the tree while iterating, so memory stays bounded by a single record
+- per CERIF item type, only the child elements that are used in the key mapping are converted;
+  other children are kept as keys with a None value, so check_keys() still reports them
+
+Known difference: a redundant namespace declaration (re-declaring a prefix with the uri it already has) is not
+reported as an xmlns attribute, as lxml does not keep those.
+
+Usage:
+    parser = ListRecordsParser(item_keys={'cerif:Publication': {'cerif:Title', ...}})
+    page = parser.parse_page(response.text)  # same as xmltodict.parse(text)['OAI-PMH']['ListRecords']
+
+    for record in parser.iter_records('cerif_export.xml'):
+        ...
+
+    benchmark_parsers('sample_page.xml', parser)
+'''
+
+import io
+import time
+from typing import IO, Iterator
+
+import httpx
+import xmltodict
+from lxml import etree
+from rich.console import Console
+
+cons = Console(markup=True)
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+OAI_RECORD = f'{{{OAI_NAMESPACE}}}record'
+OAI_RESUMPTION_TOKEN = f'{{{OAI_NAMESPACE}}}resumptionToken'
+OAI_ERROR = f'{{{OAI_NAMESPACE}}}error'
+
+METADATA_ITEMS = etree.XPath('oai:metadata/*', namespaces={'oai': OAI_NAMESPACE})
+
+
+class ElementConverter():
+    '''
+    Converts lxml elements into dicts, following the same rules as xmltodict.parse():
+    - elements without attributes or children become their (stripped) text, or None if empty
+    - attributes are prefixed with attr_prefix, text of elements with attributes/children is stored under cdata_key
+    - repeated child elements become lists
+    - comments and processing instructions are skipped
+
+    process_namespaces & namespaces work as in xmltodict: if process_namespaces is False, names are kept as they
+    appear in the document (prefix:name) and namespace declarations are added as xmlns attributes; if True,
+    namespace uris are replaced using the namespaces dict (None -> no prefix), and declarations are stored in an
+    'xmlns' dict.
+
+    pending_declarations: the number of namespace declarations (start-ns events) that can still occur in the
+    elements that are converted next, in document order. Reading element.nsmap is the most expensive part of the
+    conversion, so it is only done until all declarations have been found; after that every element shares the
+    nsmap of its parent, and tag names & attribute keys are looked up in a cache per nsmap.
+    Set it before each convert() call; the default (None) means 'unknown', and checks every element.
+    '''
+
+    def __init__(self, process_namespaces: bool = False, namespaces: dict[str, str | None] = None,
+                 attr_prefix: str = '@', cdata_key: str = '#text') -> None:
+        self.process_namespaces: bool = process_namespaces
+        self.namespaces: dict[str, str | None] = namespaces if namespaces else {}
+        self.attr_prefix: str = attr_prefix
+        self.cdata_key: str = cdata_key
+        self.pending_declarations: int | None = None
+        self.names: dict[tuple, tuple[dict[str, str], dict[str, str]] | None] = {}
+
+    def qualify(self, name: str, nsmap: dict[str | None, str], prefix: str | None = None) -> str:
+        '''
+        turns a lxml name ({uri}local) into the name xmltodict would use
+        '''
+        if name[0] != '{':
+            return name
+        uri, _, local = name[1:].partition('}')
+        if self.process_namespaces:
+            if uri in self.namespaces:
+                mapped = self.namespaces[uri]
+                return f'{mapped}:{local}' if mapped else local
+            return f'{uri}:{local}'
+        if prefix is None:
+            if uri == XML_NAMESPACE:
+                prefix = 'xml'
+            else:
+                for nsprefix, nsuri in nsmap.items():
+                    if nsuri == uri and nsprefix:
+                        prefix = nsprefix
+                        break
+        return f'{prefix}:{local}' if prefix else local
+
+    def name(self, element: etree._Element, nsmap: dict[str | None, str]) -> str:
+        if self.process_namespaces:
+            return self.qualify(element.tag, nsmap)
+        # for element tags the prefix in the document is known; an element in the default namespace has no prefix
+        if element.tag[0] != '{':
+            return element.tag
+        return self.qualify(element.tag, nsmap, prefix=element.prefix or '')
+
+    def names_for(self, nsmap: dict[str | None, str]) -> tuple[dict[str, str], dict[str, str]] | None:
+        '''
+        returns the (tag names, attribute keys) caches for elements with this nsmap
+        returns None if a namespace uri is bound to more than one prefix: the name of an element then depends on
+        the prefix used in the document, and can't be cached by tag
+        '''
+        key = tuple(sorted(nsmap.items(), key=lambda item: item[0] or ''))
+        if key not in self.names:
+            uris = list(nsmap.values())
+            self.names[key] = ({}, {}) if len(uris) == len(set(uris)) else None
+        return self.names[key]
+
+    def convert(self, element: etree._Element, parent_nsmap: dict[str | None, str] = None,
+                keep: set[str] = None, skip: set[str] = None,
+                names: tuple[dict[str, str], dict[str, str]] | None = None) -> dict | str | None:
+        '''
+        converts element and its children
+        keep: if passed, only the children with these names are converted, others get a None value
+        skip: children with these names get a None value
+        names: the cached names for parent_nsmap, passed down once all namespace declarations have been found
+        '''
+        if parent_nsmap is None:
+            parent_nsmap = {}
+        result = {}
+        if self.pending_declarations is None or self.pending_declarations > 0 or names is None:
+            nsmap = element.nsmap
+            if nsmap != parent_nsmap:
+                declarations = {prefix: uri for prefix, uri in nsmap.items() if parent_nsmap.get(prefix) != uri}
+                if self.pending_declarations is not None:
+                    self.pending_declarations -= len(declarations)
+                if self.process_namespaces:
+                    result['xmlns'] = {prefix or '': uri for prefix, uri in declarations.items()}
+                else:
+                    for prefix, uri in declarations.items():
+                        result[f'{self.attr_prefix}xmlns:{prefix}' if prefix else f'{self.attr_prefix}xmlns'] = uri
+                names = None
+            if self.pending_declarations is not None and self.pending_declarations <= 0 and names is None:
+                names = self.names_for(nsmap)
+        else:
+            nsmap = parent_nsmap
+        shared = names is not None and self.pending_declarations is not None and self.pending_declarations <= 0
+        tag_names, attr_keys = names if shared else ({}, {})
+
+        for key, value in element.attrib.items():
+            attr_key = attr_keys.get(key) if shared else None
+            if attr_key is None:
+                attr_key = f'{self.attr_prefix}{self.qualify(key, nsmap)}'
+                if shared:
+                    attr_keys[key] = attr_key
+            result[attr_key] = value
+
+        text = [element.text] if element.text else []
+        repeated = set()
+        for child in element:
+            if child.tail:
+                text.append(child.tail)
+            tag = child.tag
+            if not isinstance(tag, str):
+                continue
+            # checked per child: the budget can run out while converting a previous child
+            shared = names is not None and self.pending_declarations is not None and self.pending_declarations <= 0
+            childname = tag_names.get(tag) if shared else None
+            if childname is None:
+                childname = self.name(child, nsmap)
+                if shared:
+                    tag_names[tag] = childname
+            if (keep is not None and childname not in keep) or (skip and childname in skip):
+                value = None
+            elif shared and not len(child) and not child.attrib:
+                value = child.text
+                value = (value.strip() or None) if value else None
+            else:
+                value = self.convert(child, nsmap, names=names if shared else None)
+            if childname in repeated:
+                result[childname].append(value)
+            elif childname in result:
+                result[childname] = [result[childname], value]
+                repeated.add(childname)
+            else:
+                result[childname] = value
+
+        text = ''.join(text).strip() if text else ''
+        if not result:
+            return text if text else None
+        if text:
+            result[self.cdata_key] = text
+        return result
+
+
+class ListRecordsParser():
+    '''
+    Parses OAI-PMH ListRecords responses using lxml.etree.iterparse
+
+    process_namespaces, namespaces, attr_prefix, cdata_key: see ElementConverter; use the same values as the
+        xmltodict.parse() call this parser replaces
+    item_keys: optional dict of {item name: set of child names}, e.g. {'cerif:Publication': {'cerif:Title', ...}}
+        if passed, only these children of the metadata items are converted
+
+    A parser (and its converter) keeps state while parsing, so don't share a single instance between threads.
+    '''
+
+    def __init__(self, process_namespaces: bool = False, namespaces: dict[str, str | None] = None,
+                 attr_prefix: str = '@', cdata_key: str = '#text', item_keys: dict[str, set[str]] = None) -> None:
+        self.converter: ElementConverter = ElementConverter(process_namespaces, namespaces, attr_prefix, cdata_key)
+        self.item_keys: dict[str, set[str]] = item_keys if item_keys else {}
+
+    def convert_record(self, record: etree._Element) -> dict:
+        converter = self.converter
+        parent = record.getparent()
+        parent_nsmap = parent.nsmap if parent is not None else {}
+        items = METADATA_ITEMS(record) if self.item_keys else None
+        if not items:
+            return converter.convert(record, parent_nsmap)
+        # convert the record without its metadata, then add the metadata items using their key sets
+        metadata = items[0].getparent()
+        nsmap = record.nsmap
+        metadata_name = converter.name(metadata, nsmap)
+        result = converter.convert(record, parent_nsmap, skip={metadata_name})
+        metadata_value = converter.convert(metadata, nsmap, keep=set())
+        if not isinstance(metadata_value, dict):
+            metadata_value = {}
+        metadata_nsmap = metadata.nsmap
+        for item in items:
+            name = converter.name(item, metadata_nsmap)
+            metadata_value[name] = converter.convert(item, metadata_nsmap, keep=self.item_keys.get(name))
+        result[metadata_name] = metadata_value
+        return result
+
+    def iter_elements(self, source: IO | str) -> Iterator[tuple[str, dict]]:
+        '''
+        yields ('record', dict), ('resumptionToken', dict|str) and ('error', dict|str) tuples from source
+        source: a filename or a file-like object
+        '''
+        # start-ns events are reported for all elements, the tag filter only applies to start/end events.
+        # the declarations counted since the previous record are those of the next record (or its ancestors)
+        context = etree.iterparse(source, events=('start-ns', 'end'),
+                                  tag=(OAI_RECORD, OAI_RESUMPTION_TOKEN, OAI_ERROR), remove_comments=True)
+        declarations = 0
+        for event, element in context:
+            if event == 'start-ns':
+                declarations += 1
+                continue
+            if element.tag == OAI_RECORD:
+                self.converter.pending_declarations = declarations
+                yield 'record', self.convert_record(element)
+            else:
+                self.converter.pending_declarations = None
+                parent_nsmap = element.getparent().nsmap if element.getparent() is not None else {}
+                yield etree.QName(element).localname, self.converter.convert(element, parent_nsmap)
+            declarations = 0
+            # free the memory used by processed elements
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+        self.converter.pending_declarations = None
+        del context
+
+    def parse_page(self, text: str | bytes) -> dict:
+        '''
+        parses a single ListRecords response
+        returns the same dict as xmltodict.parse(text)['OAI-PMH']['ListRecords'], or {} for a noRecordsMatch error
+        '''
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        page = {}
+        records = []
+        for kind, value in self.iter_elements(io.BytesIO(text)):
+            if kind == 'record':
+                records.append(value)
+            elif kind == 'resumptionToken':
+                page['resumptionToken'] = value
+            elif kind == 'error':
+                code = value.get(f'{self.converter.attr_prefix}code') if isinstance(value, dict) else None
+                if code == 'noRecordsMatch':
+                    return {}
+                raise ValueError(f'OAI-PMH error: {value}')
+        if records:
+            page['record'] = records if len(records) > 1 else records[0]
+        return page
+
+    def iter_records(self, source: IO | str) -> Iterator[dict]:
+        '''
+        yields the converted records from a file (e.g. a full CERIF export) one at a time
+        '''
+        for kind, value in self.iter_elements(source):
+            if kind == 'record':
+                yield value
+
+
+def save_sample_page(url: str, path: str) -> None:
+    '''
+    downloads a single ListRecords page (e.g. the first page of a set) to use with benchmark_parsers
+    '''
+    r = httpx.get(url, timeout=60)
+    with open(path, 'wb') as f:
+        f.write(r.content)
+
+
+def benchmark_parsers(path: str, parser: ListRecordsParser, repeat: int = 5, **xmltodict_kwargs) -> dict[str, float]:
+    '''
+    compares the records/sec of parser.parse_page with xmltodict.parse on a saved ListRecords page
+    xmltodict_kwargs: the keyword arguments for xmltodict.parse, should match the settings of parser
+    '''
+    with open(path, 'rb') as f:
+        text = f.read()
+
+    def count(page: dict) -> int:
+        records = page.get('record', [])
+        return len(records) if isinstance(records, list) else 1
+
+    results = {}
+    for name, parse in [('xmltodict', lambda: xmltodict.parse(text, **xmltodict_kwargs)['OAI-PMH']['ListRecords']),
+                        ('lxml', lambda: parser.parse_page(text))]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            num_records = count(parse())
+        elapsed = time.perf_counter() - start
+        results[name] = round(num_records * repeat / elapsed, 1)
+        cons.print(f'{name}: {num_records} records x {repeat} in {elapsed:.3f} s -- {results[name]} records/s')
+    cons.print(f'speedup: {results["lxml"] / results["xmltodict"]:.2f}x')
+    return results
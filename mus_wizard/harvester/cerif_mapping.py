@@ -0,0 +1,778 @@
+'''
+CERIF mapping functions, used by OAI_PMH to turn raw cerif records (as returned by xmltodict or cerif_lxml) into the
+dicts that are stored in mongodb.
+
+All functions are plain (sync) functions without shared state, so a page of records can be mapped in a
+ProcessPoolExecutor using map_page(); the async harvester then only has to do the I/O.
+'''
+
+from collections import defaultdict
+
+from rich import print
+
+
+# --------------------------------------------------------
+#                 CERIF MAPPING FUNCTIONS
+# --------------------------------------------------------
+#                      PERSONS
+# --------------------------------------------------------
+def get_person_affiliations(values: list) -> tuple[str, list[dict]]:
+    affiliations = []
+    if isinstance(values, list):
+        for v in values:
+            tmp = v.get('cerif:OrgUnit')
+            org = {
+                'internal_repository_id': tmp.get('@id'),
+                'name'                  : tmp.get('cerif:Name').get('#text'),
+            }
+            affiliations.append(org)
+    elif isinstance(values, str):
+        return values
+    return 'affiliations', affiliations
+
+
+# --------------------------------------------------------
+#                 CERIF MAPPING FUNCTIONS
+# --------------------------------------------------------
+#                      ORGANIZATIONS
+# --------------------------------------------------------
+def get_org_identifiers(values: list) -> tuple[str, dict[list]]:
+    identifiers = defaultdict(list)
+    if isinstance(values, list):
+        for v in values:
+            identifiers[v.get('@type')].append(v.get('#text'))
+    return 'identifiers', identifiers
+
+
+def get_org_part_of(value: dict | list) -> tuple[str, dict] | tuple[str, list[dict]]:
+    try:
+        if isinstance(value, dict):
+            part_of = {
+                'internal_repository_id': value.get('cerif:OrgUnit').get('@id'),
+                'name'                  : value.get('cerif:OrgUnit').get('cerif:Name').get('#text'),
+            }
+        elif isinstance(value, list):
+            part_of = []
+            for v in value:
+                part_of.append({
+                    'internal_repository_id': v.get('cerif:OrgUnit').get('@id'),
+                    'name'                  : v.get('cerif:OrgUnit').get('cerif:Name').get('#text'),
+                })
+    except Exception as e:
+        print(f'error parsing {value}: {e}')
+        part_of = None
+    return 'part_of', part_of
+
+
+# --------------------------------------------------------
+#                 CERIF MAPPING FUNCTIONS
+# --------------------------------------------------------
+#                      WORKS
+# --------------------------------------------------------
+def get_work_file_locations(cerif_medium: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {
+            'type'     : value.get('cerif:Type').get('#text') if value.get('cerif:Type') else None,
+            'title'    : value.get('cerif:Title').get('#text') if value.get('cerif:Title') else None,
+            'uri'      : value.get('cerif:URI'),
+            'mime_type': value.get('cerif:MimeType'),
+            'size'     : value.get('cerif:Size'),
+            'access'   : value.get('ar:Access'),
+        }
+        return result
+
+    if not isinstance(cerif_medium, dict):
+        return 'file_locations', None
+    value = cerif_medium.get('cerif:Medium')
+    if isinstance(value, dict):
+        return 'file_locations', [map_values(value)]
+    elif isinstance(value, list):
+        return 'file_locations', [map_values(v) for v in value]
+    else:
+        return 'file_locations', None
+
+
+def get_work_published_in(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        title = value.get('cerif:Title')
+        if title:
+            if isinstance(title, dict):
+                title = title.get('#text')
+            if isinstance(title, list):
+                title = [i.get('#text') for i in title]
+
+        result = {
+            'internal_repository_id': value.get('@id'),
+            'type'                  : value.get('pubt:Type'),
+            'title'                 : title,
+        }
+        return result
+
+    fieldname = 'published_in'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif.get('cerif:Publication'))]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v.get('cerif:Publication')) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_isbn(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    fieldname = 'isbn'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [{'medium': cerif.get('@medium'), 'value': cerif.get('#text')}]
+    elif isinstance(cerif, list):
+        return fieldname, [{'medium': c.get('@medium'), 'value': c.get('#text')} for c in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_references(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        title = value.get('cerif:Title')
+        if title:
+            if isinstance(title, dict):
+                title = title.get('#text')
+            if isinstance(title, list):
+                title = [i.get('#text') for i in title]
+        result = {
+            'internal_repository_id': value.get('@id'),
+            'peer_reviewed'         : value.get('pubt:Type').get('@pure:peerReviewed') if value.get(
+                'pubt:Type') else None,
+            'publication_category'  : value.get('pubt:Type').get('@pure:publicationCategory') if value.get(
+                'pubt:Type') else None,
+            'type'                  : value.get('pubt:Type').get('#text') if value.get('pubt:Type') else None,
+            'title'                 : title,
+        }
+        return result
+
+    fieldname = 'references'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif.get('cerif:Publication'))]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v.get('cerif:Publication')) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_originates_from(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_project_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {
+            'internal_repository_id': value.get('@id'),
+            'title'                 : value.get('cerif:Title').get('#text'),
+        }
+        return result
+
+    fieldname = 'originates_from'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        if cerif.get('cerif:Funding'):
+            return fieldname, [cerif.get('cerif:Funding').get('cerif:Description').get('#text')]
+        elif cerif.get('cerif:Project'):
+            return fieldname, [map_project_values(cerif.get('cerif:Project'))]
+    elif isinstance(cerif, list):
+        results = []
+        for c in cerif:
+            if c.get('cerif:Funding'):
+                results.append(c.get('cerif:Funding').get('cerif:Description').get('#text'))
+            elif c.get('cerif:Project'):
+                results.append(map_project_values(c.get('cerif:Project')))
+        return fieldname, results
+    return fieldname, None
+
+
+def get_work_publishers(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return 'publishers', None
+    fieldname = 'publishers'
+    try:
+        if isinstance(cerif, dict):
+            return fieldname, [cerif.get('cerif:Publisher').get('cerif:OrgUnit').get('cerif:Name').get('#text')]
+        elif isinstance(cerif, list):
+            return fieldname, [c.get('cerif:Publisher').get('cerif:OrgUnit').get('cerif:Name').get('#text') for c in
+                               cerif]
+    except Exception as e:
+        print(f'error parsing {cerif}: {e}')
+        return fieldname, None
+
+
+def get_work_presented_at(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {
+            'acronym'   : value.get('cerif:Acronym'),
+            'name'      : value.get('cerif:Name').get('#text') if value.get('cerif:Name') else None,
+            'start_date': value.get('cerif:StartDate'),
+            'end_date'  : value.get('cerif:EndDate'),
+            'place'     : value.get('cerif:Place'),
+            'country'   : value.get('cerif:Country'),
+
+        }
+        return result
+
+    fieldname = 'presented_at'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif.get('cerif:Event'))]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v.get('cerif:Event')) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_authors(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {}
+        affiliations = value.get('cerif:Affiliation')
+        if affiliations:
+            if isinstance(affiliations, dict):
+                affiliations = [affiliations]
+            affils = []
+            for affil in affiliations:
+                affils.append({
+                    'internal_repository_id': affil.get('cerif:OrgUnit').get('@id') if affil.get(
+                        'cerif:OrgUnit') else None,
+                    'name'                  : affil.get('cerif:OrgUnit').get('cerif:Name').get(
+                        '#text') if affil.get('cerif:OrgUnit') else None,
+                    'acronym'               : affil.get('cerif:OrgUnit').get('cerif:Acronym') if affil.get(
+                        'cerif:OrgUnit') else None,
+                })
+            result['affiliations'] = affils
+        person = value.get('cerif:Person')
+        if person:
+            result['internal_repository_id'] = person.get('@id')
+            result['family_names'] = person.get('cerif:PersonName').get('cerif:FamilyNames') if person.get(
+                'cerif:PersonName') else None
+            result['first_names'] = person.get('cerif:PersonName').get('cerif:FirstNames') if person.get(
+                'cerif:PersonName') else None
+        return result
+
+    fieldname = 'authors'
+    cerif = cerif.get('cerif:Author')
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif)]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_editors(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {}
+        affiliations = value.get('cerif:Affiliation')
+        if affiliations:
+            if isinstance(affiliations, dict):
+                affiliations = [affiliations]
+            affils = []
+            for affil in affiliations:
+                affils.append({
+                    'internal_repository_id': affil.get('@id'),
+                    'name'                  : affil.get('cerif:Name').get('#text') if affil.get(
+                        'cerif:Name') else None,
+                    'acronym'               : affil.get('cerif:Acronym'),
+                })
+            result['affiliations'] = affils
+        person = value.get('cerif:Person')
+        if person:
+            result['internal_repository_id'] = person.get('@id')
+            result['family_names'] = person.get('cerif:FamilyNames')
+            result['first_names'] = person.get('cerif:FirstNames')
+        return result
+
+    fieldname = 'editors'
+    cerif = cerif.get('cerif:Editor')
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif)]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_issn(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    fieldname = 'issn'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        medium = cerif.get('@medium').split('#')[1]
+        return fieldname, [{medium: cerif.get('#text')}]
+    elif isinstance(cerif, list):
+        return fieldname, [{v.get('@medium').split('#')[1]: v.get('#text')} for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_work_keywords(cerif: dict[list] | dict[dict]) -> tuple[str, list[str] | None]:
+    fieldname = 'keywords'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [cerif.get('#text')]
+    elif isinstance(cerif, list):
+        return fieldname, [v.get('#text') for v in cerif]
+    else:
+        return fieldname, None
+
+
+# --------------------------------------------------------
+#                 CERIF MAPPING FUNCTIONS
+# --------------------------------------------------------
+#                      DATASETS
+# --------------------------------------------------------
+def get_dataset_file_locations(cerif_medium: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {
+            'type'     : value.get('cerif:Type').get('#text') if value.get('cerif:Type') else None,
+            'title'    : value.get('cerif:Title').get('#text') if value.get('cerif:Title') else None,
+            'uri'      : value.get('cerif:URI'),
+            'mime_type': value.get('cerif:MimeType'),
+            'size'     : value.get('cerif:Size'),
+            'access'   : value.get('ar:Access'),
+            'license'  : value.get('cerif:License').get('#text') if value.get('cerif:License') else None,
+        }
+        return result
+
+    if not isinstance(cerif_medium, dict):
+        return 'file_locations', None
+    value = cerif_medium.get('cerif:Medium')
+    if isinstance(value, dict):
+        return 'file_locations', [map_values(value)]
+    elif isinstance(value, list):
+        return 'file_locations', [map_values(v) for v in value]
+    else:
+        return 'file_locations', None
+
+
+def get_dataset_references(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        title = value.get('cerif:Title')
+        if title:
+            if isinstance(title, dict):
+                title = title.get('#text')
+            if isinstance(title, list):
+                title = [i.get('#text') for i in title]
+        result = {
+            'internal_repository_id': value.get('@id'),
+            'peer_reviewed'         : value.get('pubt:Type').get('@pure:peerReviewed') if value.get(
+                'pubt:Type') else None,
+            'publication_category'  : value.get('pubt:Type').get('@pure:publicationCategory') if value.get(
+                'pubt:Type') else None,
+            'type'                  : value.get('pubt:Type').get('#text') if value.get('pubt:Type') else None,
+            'title'                 : title,
+        }
+        return result
+
+    fieldname = 'references'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif.get('cerif:Publication'))]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v.get('cerif:Publication')) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_dataset_dates(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | dict | None]:
+
+    fieldname = 'dates'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        result = None
+    elif isinstance(cerif, dict):
+        result = {}
+        for date, vals in cerif.items():
+            result[str(date).split(':')[1].lower()] = {'start': vals.get('@startDate'), 'end': vals.get('@endDate')}
+        result = [result]
+    elif isinstance(cerif, list):
+        result = []
+        for i in cerif:
+            res = {}
+            for date, vals in i.items():
+                res[str(date).split(':')[1].lower()] = {'start': vals.get('@startDate'),
+                                                        'end'  : vals.get('@endDate')}
+            result.append(res)
+    return fieldname, result
+
+
+def get_dataset_creators(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        if not isinstance(value, dict):
+            return None
+        result = {}
+        affiliations = value.get('cerif:Affiliation')
+        if affiliations:
+            if isinstance(affiliations, dict):
+                affiliations = [affiliations]
+            affils = []
+            for affil in affiliations:
+                affils.append({
+                    'internal_repository_id': affil.get('cerif:OrgUnit').get('@id') if affil.get(
+                        'cerif:OrgUnit') else None,
+                    'name'                  : affil.get('cerif:OrgUnit').get('cerif:Name').get(
+                        '#text') if affil.get('cerif:OrgUnit') else None,
+                    'acronym'               : affil.get('cerif:OrgUnit').get('cerif:Acronym') if affil.get(
+                        'cerif:OrgUnit') else None,
+                })
+            result['affiliations'] = affils
+        person = value.get('cerif:Person')
+        if person:
+            result['internal_repository_id'] = person.get('@id')
+            result['family_names'] = person.get('cerif:PersonName').get('cerif:FamilyNames') if person.get(
+                'cerif:PersonName') else None
+            result['first_names'] = person.get('cerif:PersonName').get('cerif:FirstNames') if person.get(
+                'cerif:PersonName') else None
+        return result
+
+    fieldname = 'authors'
+    if 'cerif:Creator' in cerif:
+        cerif = cerif.get('cerif:Creator')
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        return fieldname, None
+    if isinstance(cerif, dict):
+        return fieldname, [map_values(cerif)]
+    elif isinstance(cerif, list):
+        return fieldname, [map_values(v) for v in cerif]
+    else:
+        return fieldname, None
+
+
+def get_dataset_generated_by(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    fieldname = 'generated_by'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        result = None
+    elif isinstance(cerif, dict):
+        result = [{
+            'internal_repository_id': cerif.get('cerif:Equipment').get('@id') if cerif.get(
+                'cerif:Equipment') else None,
+            'name'                  : cerif.get('cerif:Equipment').get('cerif:Name').get('#text') if cerif.get(
+                'cerif:Equipment') else None,
+        }]
+    elif isinstance(cerif, list):
+        result = []
+        for i in cerif:
+            result.append({
+                'internal_repository_id': i.get('cerif:Equipment').get('@id') if i.get('cerif:Equipment') else None,
+                'name'                  : i.get('cerif:Equipment').get('cerif:Name').get('#text') if i.get(
+                    'cerif:Equipment') else None,
+            })
+    return fieldname, result
+
+
+def get_dataset_publishers(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    fieldname = 'publishers'
+    cerif = cerif.get('cerif:Publisher')
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        result = None
+    elif isinstance(cerif, dict):
+        result = [{
+            'internal_repository_id': cerif.get('cerif:OrgUnit').get('@id') if cerif.get('cerif:OrgUnit') else None,
+            'name'                  : cerif.get('cerif:DisplayName'),
+            'org_unit_name'         : cerif.get('cerif:OrgUnit').get('cerif:Name').get('#text') if cerif.get(
+                'cerif:OrgUnit') else None,
+        }]
+    elif isinstance(cerif, list):
+        result = []
+        for i in cerif:
+            result.append({
+                'internal_repository_id': i.get('cerif:OrgUnit').get('@id') if i.get('cerif:OrgUnit') else None,
+                'name'                  : i.get('cerif:DisplayName'),
+                'org_unit_name'         : i.get('cerif:OrgUnit').get('cerif:Name').get('#text') if i.get(
+                    'cerif:OrgUnit') else None,
+            })
+    return fieldname, result
+
+
+def get_dataset_originates_from(cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
+    def map_values(value: dict) -> dict:
+        funder = None
+        funderdict = value.get('cerif:Funder')
+
+        if funderdict:
+            funder = {
+                'internal_repository_id': funderdict.get('cerif:OrgUnit').get('@id') if funderdict.get(
+                    'cerif:OrgUnit') else None,
+                'acronym'               : funderdict.get('cerif:OrgUnit').get('cerif:Acronym') if funderdict.get(
+                    'cerif:OrgUnit') else None,
+                'name'                  : funderdict.get('cerif:OrgUnit').get('cerif:Name').get(
+                    '#text') if funderdict.get('cerif:OrgUnit') else None,
+            }
+        return {
+            'internal_repository_id': value.get('cerif:Equipment').get('@id') if value.get(
+                'cerif:Equipment') else None,
+            'funder'                : funder,
+            'identifier'            : value.get('cerif:Identifier').get('#text') if value.get(
+                'cerif:Identifier') else None,
+            'identifier_type'       :
+                value.get('cerif:Identifier').get('@type').split('/dk/atira/funding/fundingdetails/')[
+                    -1] if value.get('cerif:Identifier') else None,
+            'type'                  : value.get('funt:Type').split('#')[-1] if value.get('funt:Type') else None,
+        }
+
+    fieldname = 'originates_from'
+    if not isinstance(cerif, dict) and not isinstance(cerif, list):
+        result = None
+    elif isinstance(cerif, dict):
+        result = [map_values(cerif)]
+    elif isinstance(cerif, list):
+        result = []
+        for i in cerif:
+            result.append(map_values(i))
+    return fieldname, result
+
+
+# Check keys for missing values in cerif mapping
+def check_keys(item, keylist) -> list[str]:
+    missing_keys = []
+    for k in item.keys():
+        if k.startswith('cerif:') and k not in keylist:
+            missing_keys.append(k)
+    return missing_keys
+
+
+# mus internal type name : cerif type name
+CERIF_ITEM_MAPPING = {
+    'persons' : 'cerif:Person',
+    'orgs'    : 'cerif:OrgUnit',
+    'works'   : 'cerif:Publication',
+    'products': 'cerif:Product',
+    'patents' : 'cerif:Patent',
+    'datasets': 'cerif:Product',
+    'projects': 'cerif:Project',
+    'funding' : 'cerif:Funding',
+}
+
+# this indicates how a cerif result is mapped to the stored mongodb item
+CERIF_RESULT_KEY_MAPPING = {
+    'persons'            : {
+        'internal_repository_id': '@id',
+        'cerif:PersonName'      : {'family_names': 'cerif:FamilyNames', 'first_names': 'cerif:FirstNames'},
+        'orcid'                 : 'cerif:ORCID',
+        'scopus_id'             : 'cerif:ScopusAuthorID',
+        'scopus_affil_id'       : 'cerif:ScopusAffiliationID',
+        'cerif:Affiliation'     : get_person_affiliations,
+        'researcher_id'         : 'cerif:ResearcherID',
+        'isni'                  : 'cerif:ISNI',
+        'cris-id'               : 'cerif:CRIS-ID',
+        'uuid'                  : 'cerif:UUID',
+        'uri'                   : 'cerif:URI',
+        'url'                   : 'cerif:URL',
+    },
+    'orgs'               : {
+        'internal_repository_id': '@id',
+        'cerif:Identifier'      : get_org_identifiers,
+        'cerif:Type'            : {'type': '#text'},
+        'cerif:PartOf'          : get_org_part_of,
+        'cerif:Name'            : {'name': '#text'},
+        'acronym'               : 'cerif:Acronym',
+        'url'                   : 'cerif:ElectronicAddress'
+    },
+    'datasets'           : {
+        'internal_repository_id': '@id',
+        'cerif:FileLocations'   : get_dataset_file_locations,
+        'cerif:Name'            : {'name': '#text'},
+        'cerif:Description'     : {'description': '#text'},
+        'cerif:References'      : get_dataset_references,
+        'cerif:Dates'           : get_dataset_dates,
+        'url'                   : 'cerif:URL',
+        'cerif:Creators'        : get_dataset_creators,
+        'cerif:GeneratedBy'     : get_dataset_generated_by,
+        'doi'                   : 'cerif:DOI',
+        'cerif:License'         : {'license': '#text'},
+        'cerif:Publishers'      : get_dataset_publishers,
+        'cerif:OriginatesFrom'  : get_dataset_originates_from,
+    },
+
+    # possible fields to add:  ['cerif:PublishedIn']
+    'works'              : {
+        'cerif:Subtitle'        : {'subtitle': '#text'},
+        'cerif:FileLocations'   : get_work_file_locations,
+        'cerif:Publication'     : get_work_published_in,
+        'cerif:ISBN'            : get_work_isbn,
+        'volume'                : 'cerif:Volume',
+        'language'              : 'cerif:Language',
+        'number'                : 'cerif:Number',
+        'cerif:References'      : get_work_references,
+        'cerif:OriginatesFrom'  : get_work_originates_from,
+        'start_page'            : 'cerif:StartPage',
+        'edition'               : 'cerif:Edition',
+        'cerif:Status'          : {'status': '#text'},
+        'cerif:License'         : {'license': '#text'},
+        'cerif:Title'           : {'title': '#text'},
+        'issue'                 : 'cerif:Issue',
+        'cerif:Publishers'      : get_work_publishers,
+        'cerif:Abstract'        : {'abstract': '#text'},
+        'isi'                   : 'cerif:ISI-Number',
+        'cerif:PresentedAt'     : get_work_presented_at,
+        'publication_date'      : 'cerif:PublicationDate',
+        'cerif:Authors'         : get_work_authors,
+        'scp_number'            : 'cerif:SCP-Number',
+        'part_of'               : 'cerif:PartOf',
+        'endpage'               : 'cerif:EndPage',
+        'url'                   : 'cerif:URL',
+        'doi'                   : 'cerif:DOI',
+        'cerif:Editors'         : get_work_editors,
+        'cerif:ISSN'            : get_work_issn,
+        'cerif:Keyword'         : get_work_keywords,
+        'internal_repository_id': '@id',
+    },
+    'products'           : {
+        'internal_repository_id': '@id',
+        'presented_at'          : 'cerif:PresentedAt',
+        'keywords'              : 'cerif:Keyword',
+        'filelocations'         : 'cerif:FileLocations',
+        'name'                  : 'cerif:Name',
+        'description'           : 'cerif:Description',
+        'references'            : 'cerif:References',
+        'dates'                 : 'cerif:Dates',
+        'url'                   : 'cerif:URL',
+        'creators'              : 'cerif:Creators',
+        'generated_by'          : 'cerif:GeneratedBy',
+        'doi'                   : 'cerif:DOI',
+        'license'               : 'cerif:License',
+        'publishers'            : 'cerif:Publishers',
+        'originates_from'       : 'cerif:OriginatesFrom',
+    },
+    'patents'            : {
+        'internal_repository_id': '@id',
+        'subject'               : 'cerif:Subject',
+        'keywords'              : 'cerif:Keyword',
+        'references'            : 'cerif:References',
+        'abstract'              : 'cerif:Abstract',
+        'issuer'                : 'cerif:Issuer',
+        'approval_date'         : 'cerif:ApprovalDate',
+        'title'                 : 'cerif:Title',
+        'countrycode'           : 'cerif:CountryCode',
+        'patentnumber'          : 'cerif:PatentNumber',
+        'inventors'             : 'cerif:Inventors'
+    },
+    'projects'           : {
+        'internal_repository_id': '@id',
+        'enddate'               : 'cerif:EndDate',
+        'consortium'            : 'cerif:Consortium',
+        'startdate'             : 'cerif:StartDate',
+        'keywords'              : 'cerif:Keyword',
+        'title'                 : 'cerif:Title',
+        'acronym'               : 'cerif:Acronym',
+        'abstract'              : 'cerif:Abstract',
+        'identifier'            : 'cerif:Identifier',
+        'team'                  : 'cerif:Team',
+    },
+    'funding'            : {
+        'internal_repository_id': '@id',
+        'name'                  : 'cerif:Name',
+        'description'           : 'cerif:Description',
+        'funder'                : 'cerif:Funder',
+        'acronym'               : 'cerif:Acronym',
+    },
+    'ec_funded_resources': {},
+}
+
+# a list of cerif fields that are processed -- might be incomplete, check later.
+# this list is used to check if a field is in the item but not in the mapping
+CERIF_RESULT_KEYLIST = {
+    'persons'            : ['@id', 'cerif:PersonName', 'cerif:Affiliation', 'cerif:PersonName', 'cerif:Affiliation',
+                            'cerif:ORCID', 'cerif:ScopusAuthorID', 'cerif:ScopusAffiliationID',
+                            'cerif:ResearcherID', 'cerif:ISNI', 'cerif:CRIS-ID', 'cerif:UUID', 'cerif:URI',
+                            'cerif:URL'],
+    'orgs'               : ['cerif:Identifier', 'cerif:Type', 'cerif:PartOf', 'cerif:Name', 'cerif:Acronym'],
+    'works'              : ['cerif:Keyword', 'cerif:Editors', 'cerif:Subtitle', 'cerif:Publishers', 'cerif:Authors',
+                            'cerif:DOI', 'cerif:ISBN', 'cerif:URL', 'cerif:SCP-Number', 'cerif:Title',
+                            'cerif:Status', 'cerif:FileLocations', 'cerif:PresentedAt', 'cerif:References',
+                            'cerif:Abstract', 'cerif:Language', 'cerif:PublicationDate'],
+    'datasets'           : ['cerif:Creators', 'cerif:Name', 'cerif:GeneratedBy', 'cerif:FileLocations',
+                            'cerif:Dates', 'cerif:OriginatesFrom', 'cerif:DOI', 'cerif:URL', 'cerif:References',
+                            'cerif:Publishers', 'cerif:License', 'cerif:Description'],
+    'products'           : [],
+    'patents'            : [],
+    'projects'           : [],
+    'funding'            : [],
+    'ec_funded_resources': [],
+}
+
+
+def process_cerif(type: str, data: list[dict]) -> tuple[list[dict], set[str]]:
+    '''
+    maps the raw records in data to dicts using CERIF_RESULT_KEY_MAPPING[type]
+    returns the mapped dicts and the cerif keys that were found in the records but are not in CERIF_RESULT_KEYLIST
+    '''
+    keys_missing = set()
+    results = []
+    mapping = CERIF_RESULT_KEY_MAPPING[type]
+    keylist = CERIF_RESULT_KEYLIST[type]
+    for i in data:
+        try:
+            item = i['metadata'].get(CERIF_ITEM_MAPPING[type])
+        except Exception as e:
+            print(f'error processing cerif data for {type}: {e}')
+            continue
+        result = {}
+        if not item:
+            continue
+        for key, value in mapping.items():
+            try:
+                if isinstance(value, str):
+                    result[key] = item.get(value)
+                elif isinstance(value, dict):
+                    temp = item.get(key)
+
+                    if temp:
+                        if isinstance(temp, list):
+                            for k, v in value.items():
+                                result[k] = []
+                                for u in temp:
+                                    try:
+                                        result[k].append(u.get(v))
+                                    except Exception:
+                                        ...
+                        elif isinstance(temp, dict):
+                            for k, v in value.items():
+                                result[k] = temp.get(v)
+                elif callable(value):
+                    item_result = item.get(key)
+                    if item_result:
+                        keyname, fullvalue = value(item_result)
+                        result[keyname] = fullvalue
+            except Exception as e:
+                print(f'error {e} processing {key, value} for {type}. Full item: {item}')
+        missing = check_keys(item, keylist)
+        if missing:
+            keys_missing.update(missing)
+        results.append(result)
+    return results, keys_missing
+
+
+def map_page(type: str, records: list[dict]) -> tuple[list[dict], set[str]]:
+    '''
+    entry point for the process pool: a page of raw records in, the mapped dicts (+ missing keys) out
+    '''
+    return process_cerif(type, records)
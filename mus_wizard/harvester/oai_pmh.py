@@ -1,28 +1,133 @@
+import asyncio
 import functools
+import os
+import random
 import time
 from collections import defaultdict
-from datetime import datetime
-from typing import Any
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable
 
 import aiocsv
 import aiofiles
 import aiometer
+import httpx
 import motor.motor_asyncio
 import xmltodict
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from rich import print
 from rich.console import Console
 
 from mus_wizard.constants import OAI_PMH_URL
-from mus_wizard.database.mongo_client import MusMongoClient
+from mus_wizard.database.mongo_client import HarvestWatermarks, MusMongoClient
+from mus_wizard.harvester import cerif_mapping
 from mus_wizard.harvester.base_classes import GenericAPI
+from mus_wizard.harvester.cerif_lxml import ListRecordsParser
 
 cons = Console(markup=True)
 
 
+class OAIFetchError(Exception):
+    '''
+    raised by OAIFetcher when a page could not be retrieved within the retry budget, or when the circuit breaker is open
+    '''
+
+
+class OAIFetcher():
+    '''
+    Non-blocking fetch layer for OAI-PMH pages.
+
+    - failed requests (network errors, bad status codes, unparseable xml) are retried with exponential backoff
+      and full jitter, waiting with asyncio.sleep so other tasks keep running
+    - each fetch has a budget of max_retries retries, after which OAIFetchError is raised
+    - a circuit breaker is shared by all fetches of this instance: after failure_threshold consecutive failures
+      the circuit opens, and all fetches fail fast for reset_timeout seconds. After that a single probe
+      request is let through while the other fetches keep failing fast; if it succeeds the circuit closes again,
+      otherwise it re-opens.
+
+    Usage:
+        fetcher = OAIFetcher(httpxclient)
+        page = await fetcher.fetch(url, parse)  # parse: callable that turns the response text into the page dict
+    '''
+
+    def __init__(self, httpxclient: httpx.AsyncClient, max_retries: int = 6, base_delay: float = 1.0,
+                 max_delay: float = 60.0, failure_threshold: int = 10, reset_timeout: float = 120.0) -> None:
+        self.httpxclient: httpx.AsyncClient = httpxclient
+        self.max_retries: int = max_retries
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.consecutive_failures: int = 0
+        self.opened_at: float | None = None
+        self.probing: bool = False
+
+    def check_circuit(self, url: str) -> bool:
+        '''
+        raises OAIFetchError if the circuit is open
+        returns True if this request is the probe of the half-open circuit
+        '''
+        if self.opened_at is None:
+            return False
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            raise OAIFetchError(f'circuit open after {self.consecutive_failures} consecutive failures, not fetching {url}')
+        # half-open: only this request is let through, until record_success/record_failure settles the state
+        self.probing = True
+        return True
+
+    def record_failure(self, probe: bool = False) -> None:
+        self.consecutive_failures += 1
+        if probe:
+            # the probe failed: re-open the circuit
+            self.probing = False
+            self.opened_at = time.monotonic()
+        elif not self.probing and self.consecutive_failures >= self.failure_threshold:
+            # (failures of requests started before the probe don't settle the half-open state)
+            self.opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    async def fetch(self, url: str, parse: Callable[[str], dict]) -> dict:
+        for attempt in range(self.max_retries + 1):
+            probe = self.check_circuit(url)
+            try:
+                r = await self.httpxclient.get(url)
+                r.raise_for_status()
+                page = parse(r.text)
+            except asyncio.CancelledError:
+                if probe:
+                    # let the next request probe instead
+                    self.probing = False
+                raise
+            except Exception as e:
+                self.record_failure(probe)
+                if attempt == self.max_retries:
+                    raise OAIFetchError(f'giving up on {url} after {attempt + 1} attempts: {e}') from e
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                cons.print(f'error fetching {url}: {e} -- retrying in {delay:.1f}s')
+                await asyncio.sleep(delay)
+                continue
+            self.record_success()
+            return page
+
+
 class PureAPI(GenericAPI):
     # ! Note: check documentation for the correct namespaces and keys to use -- maybe switch to openaire cerif style??
-    def __init__(self, years: list[int] = None):
+    def __init__(self, years: list[int] = None, incremental: bool = True, parser: str = 'xmltodict'):
+        '''
+        years: harvest the publications:year<year> sets for these years
+        incremental: only request records changed since the last successful harvest of each set (OAI-PMH from=)
+        parser: 'xmltodict' or 'lxml' -- the lxml backend (see cerif_lxml.py) returns the same dicts, but faster
+        '''
         super().__init__('items_pure_oaipmh', 'doi', itemlist=None)
+        self.incremental: bool = incremental
+        self.fetcher: OAIFetcher = OAIFetcher(self.httpxclient)
+        self.watermarks: HarvestWatermarks = HarvestWatermarks(self.motorclient['harvest_watermarks'])
         if years:
             self.years: list[int] = years
         else:
@@ -43,6 +148,11 @@ class PureAPI(GenericAPI):
             'subject'    : ['value'],
             'description': 'value',
         }
+        self.parser: str = parser
+        if parser == 'lxml':
+            self.lxml_parser: ListRecordsParser = ListRecordsParser(process_namespaces=True,
+                                                                    namespaces=self.NAMESPACES, attr_prefix='',
+                                                                    cdata_key='value')
 
     async def run(self):
         await self.get_item_results()
@@ -63,8 +173,8 @@ class PureAPI(GenericAPI):
     async def call_api(self, year) -> list[dict]:
         cons.print(f"gathering Pure Data for year {year}")
 
-        async def fetch_response(url):
-            async def remove_lang_fields(json):
+        def parse_page(text: str) -> dict:
+            def remove_lang_fields(json):
                 for key, value in json.items():
                     if key in self.KEYS_TO_FIX:
                         mapping = self.KEYS_TO_FIX[key]
@@ -77,15 +187,15 @@ class PureAPI(GenericAPI):
                         json[key] = tmp
                 return json
 
-            try:
-                r = await self.httpxclient.get(url)
-                parsed = xmltodict.parse(r.text, process_namespaces=True, namespaces=self.NAMESPACES, attr_prefix="",
-                                         cdata_key='value')
-                parsed = await remove_lang_fields(parsed)
-                return parsed['OAI-PMH']['ListRecords']
-            except Exception as e:
-                cons.print(f'error fetching {url}: {e}')
-                return None
+            if self.parser == 'lxml':
+                return self.lxml_parser.parse_page(text)
+            parsed = xmltodict.parse(text, process_namespaces=True, namespaces=self.NAMESPACES, attr_prefix="",
+                                     cdata_key='value')
+            parsed = remove_lang_fields(parsed)
+            error = parsed['OAI-PMH'].get('error')
+            if isinstance(error, dict) and error.get('code') == 'noRecordsMatch':
+                return {}
+            return parsed['OAI-PMH']['ListRecords']
 
         base_url = OAI_PMH_URL
         metadata_prefix = "oai_dc"
@@ -93,36 +203,57 @@ class PureAPI(GenericAPI):
         url = (
             f"{base_url}?verb=ListRecords&metadataPrefix={metadata_prefix}&set={set_name}"
         )
-        while True:
-            response = await fetch_response(url)
-            if not response:
-                time.sleep(5)
-                continue
-            results = []
-            items = response.get('record')
-            if not isinstance(items, list):
-                items = [items]
-            for result in items:
-                del result['metadata']['dc']['xmlns']
-                del result['metadata']['dc']['schemaLocation']
-                temp = result['metadata']['dc']
-                temp['pure_identifier'] = result['header']['identifier']
-                temp['pure_datestamp'] = result['header']['datestamp']
-                results.append(temp)
-
-            if results:
-                for result in results:
-                    await self.collection.find_one_and_update({"pure_identifier": result['pure_identifier']},
-                                                              {'$set': result}, upsert=True)
-                    self.results['ids'].append(result['pure_identifier'])
-                    self.results['total'] += 1
-            if response.get('resumptionToken'):
-                resumetoken = response.get('resumptionToken').get('value')
-                url = f"{base_url}?verb=ListRecords&resumptionToken={resumetoken}"
-                continue
-            else:
-                cons.print(f'no more pure results for year {year}')
-                return True
+        since = await self.watermarks.get('pure_oai_dc', set_name) if self.incremental else None
+        started = datetime.now(timezone.utc)
+        if since:
+            url = f"{url}&from={since.strftime('%Y-%m-%d')}"
+        # the next page is fetched while the current one is being stored
+        next_page = asyncio.create_task(self.fetcher.fetch(url, parse_page))
+        try:
+            while next_page:
+                try:
+                    response = await next_page
+                except OAIFetchError as e:
+                    cons.print(f'stopped gathering Pure Data for year {year}: {e}')
+                    return False
+                next_page = None
+                resumetoken = response.get('resumptionToken')
+                if isinstance(resumetoken, dict):
+                    resumetoken = resumetoken.get('value')
+                if resumetoken:
+                    url = f"{base_url}?verb=ListRecords&resumptionToken={resumetoken}"
+                    next_page = asyncio.create_task(self.fetcher.fetch(url, parse_page))
+                results = []
+                deleted = []
+                items = response.get('record', [])
+                if not isinstance(items, list):
+                    items = [items]
+                for result in items:
+                    if result['header'].get('status') == 'deleted':
+                        deleted.append(result['header']['identifier'])
+                        continue
+                    del result['metadata']['dc']['xmlns']
+                    del result['metadata']['dc']['schemaLocation']
+                    temp = result['metadata']['dc']
+                    temp['pure_identifier'] = result['header']['identifier']
+                    temp['pure_datestamp'] = result['header']['datestamp']
+                    results.append(temp)
+
+                if results:
+                    for result in results:
+                        await self.collection.find_one_and_update({"pure_identifier": result['pure_identifier']},
+                                                                  {'$set': result}, upsert=True)
+                        self.results['ids'].append(result['pure_identifier'])
+                        self.results['total'] += 1
+                if deleted:
+                    await self.collection.delete_many({'pure_identifier': {'$in': deleted}})
+                    self.results['deleted'] = self.results.get('deleted', 0) + len(deleted)
+        finally:
+            if next_page:
+                next_page.cancel()
+        cons.print(f'no more pure results for year {year}')
+        await self.watermarks.set('pure_oai_dc', set_name, started)
+        return True
 
 
 class OAI_PMH(GenericAPI):
@@ -133,13 +264,41 @@ class OAI_PMH(GenericAPI):
         'identify': 'Identify',
     }
 
-    def __init__(self, baseurl: str = None, motorclient = None) -> None:
+    def __init__(self, baseurl: str = None, motorclient = None, incremental: bool = True,
+                 parser: str = 'xmltodict', workers: int = None) -> None:
+        '''
+        baseurl: the OAI-PMH endpoint to harvest
+        motorclient: optional motor database or MusMongoClient to store the results in
+        incremental: only request records changed since the last successful harvest of each set (OAI-PMH from=),
+            records with a deleted header are removed from the collection
+        parser: 'xmltodict' or 'lxml' -- the lxml backend (see cerif_lxml.py) returns the same dicts, but faster,
+            and only converts the cerif fields that are used in CERIF_RESULT_KEY_MAPPING
+        workers: number of processes used to map the cerif records, 0 maps the records in the event loop thread.
+            default: os.cpu_count() - 1 on machines with 4+ cores, otherwise 0 -- sending the records to a worker
+            costs about 3x the mapping itself, so the pool only pays off with multiple cores
+        '''
         collection = ''
         item_id_type = 'internal_repository_id'
         itemlist = None
         super().__init__(collection, item_id_type, itemlist, motorclient)
         if not baseurl:
             baseurl = 'https://ris.utwente.nl/ws/oai'
+        self.incremental: bool = incremental
+        self.fetcher: OAIFetcher = OAIFetcher(self.httpxclient)
+        # motorclient is either a MusMongoClient or a motor database
+        if isinstance(self.motorclient, MusMongoClient):
+            self.database: motor.motor_asyncio.AsyncIOMotorDatabase = self.motorclient.mongoclient
+        else:
+            self.database: motor.motor_asyncio.AsyncIOMotorDatabase = self.motorclient
+        self.watermarks: HarvestWatermarks = HarvestWatermarks(self.database['harvest_watermarks'])
+        self.parser: str = parser
+        if parser == 'lxml':
+            self.lxml_parser: ListRecordsParser = ListRecordsParser(item_keys=self.get_item_keys())
+        if workers is None:
+            cpus = os.cpu_count() or 1
+            workers = cpus - 1 if cpus >= 4 else 0
+        self.workers: int = workers
+        self.executor: ProcessPoolExecutor | None = None
 
         self.set_api_settings(
             url=baseurl,
@@ -147,625 +306,142 @@ class OAI_PMH(GenericAPI):
             max_per_second=10,
         )
 
-    # --------------------------------------------------------
-    #                 CERIF MAPPING FUNCTIONS
-    # --------------------------------------------------------
-    #                      PERSONS
-    # --------------------------------------------------------
-    async def get_person_affiliations(self, values: list) -> tuple[str, list[dict]]:
-        affiliations = []
-        if isinstance(values, list):
-            for v in values:
-                tmp = v.get('cerif:OrgUnit')
-                org = {
-                    'internal_repository_id': tmp.get('@id'),
-                    'name'                  : tmp.get('cerif:Name').get('#text'),
-                }
-                affiliations.append(org)
-        elif isinstance(values, str):
-            return values
-        return 'affiliations', affiliations
-
-    # --------------------------------------------------------
-    #                 CERIF MAPPING FUNCTIONS
-    # --------------------------------------------------------
-    #                      ORGANIZATIONS
-    # --------------------------------------------------------
-    async def get_org_identifiers(self, values: list) -> tuple[str, dict[list]]:
-        identifiers = defaultdict(list)
-        if isinstance(values, list):
-            for v in values:
-                identifiers[v.get('@type')].append(v.get('#text'))
-        return 'identifiers', identifiers
-
-    async def get_org_part_of(self, value: dict | list) -> tuple[str, dict] | tuple[str, list[dict]]:
-        try:
-            if isinstance(value, dict):
-                part_of = {
-                    'internal_repository_id': value.get('cerif:OrgUnit').get('@id'),
-                    'name'                  : value.get('cerif:OrgUnit').get('cerif:Name').get('#text'),
-                }
-            elif isinstance(value, list):
-                part_of = []
-                for v in value:
-                    part_of.append({
-                        'internal_repository_id': v.get('cerif:OrgUnit').get('@id'),
-                        'name'                  : v.get('cerif:OrgUnit').get('cerif:Name').get('#text'),
-                    })
-        except Exception as e:
-            print(f'error parsing {value}: {e}')
-            part_of = None
-        return 'part_of', part_of
-
-    # --------------------------------------------------------
-    #                 CERIF MAPPING FUNCTIONS
-    # --------------------------------------------------------
-    #                      WORKS
-    # --------------------------------------------------------
-    async def get_work_file_locations(self, cerif_medium: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {
-                'type'     : value.get('cerif:Type').get('#text') if value.get('cerif:Type') else None,
-                'title'    : value.get('cerif:Title').get('#text') if value.get('cerif:Title') else None,
-                'uri'      : value.get('cerif:URI'),
-                'mime_type': value.get('cerif:MimeType'),
-                'size'     : value.get('cerif:Size'),
-                'access'   : value.get('ar:Access'),
-            }
-            return result
-
-        if not isinstance(cerif_medium, dict):
-            return 'file_locations', None
-        value = cerif_medium.get('cerif:Medium')
-        if isinstance(value, dict):
-            return 'file_locations', [await map_values(value)]
-        elif isinstance(value, list):
-            return 'file_locations', [await map_values(v) for v in value]
-        else:
-            return 'file_locations', None
-
-    async def get_work_published_in(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            title = value.get('cerif:Title')
-            if title:
-                if isinstance(title, dict):
-                    title = title.get('#text')
-                if isinstance(title, list):
-                    title = [i.get('#text') for i in title]
-
-            result = {
-                'internal_repository_id': value.get('@id'),
-                'type'                  : value.get('pubt:Type'),
-                'title'                 : title,
-            }
-            return result
-
-        fieldname = 'published_in'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif.get('cerif:Publication'))]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v.get('cerif:Publication')) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_isbn(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        fieldname = 'isbn'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [{'medium': cerif.get('@medium'), 'value': cerif.get('#text')}]
-        elif isinstance(cerif, list):
-            return fieldname, [{'medium': c.get('@medium'), 'value': c.get('#text')} for c in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_references(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            title = value.get('cerif:Title')
-            if title:
-                if isinstance(title, dict):
-                    title = title.get('#text')
-                if isinstance(title, list):
-                    title = [i.get('#text') for i in title]
-            result = {
-                'internal_repository_id': value.get('@id'),
-                'peer_reviewed'         : value.get('pubt:Type').get('@pure:peerReviewed') if value.get(
-                    'pubt:Type') else None,
-                'publication_category'  : value.get('pubt:Type').get('@pure:publicationCategory') if value.get(
-                    'pubt:Type') else None,
-                'type'                  : value.get('pubt:Type').get('#text') if value.get('pubt:Type') else None,
-                'title'                 : title,
-            }
-            return result
-
-        fieldname = 'references'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif.get('cerif:Publication'))]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v.get('cerif:Publication')) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_originates_from(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_project_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {
-                'internal_repository_id': value.get('@id'),
-                'title'                 : value.get('cerif:Title').get('#text'),
-            }
-            return result
-
-        fieldname = 'originates_from'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            if cerif.get('cerif:Funding'):
-                return fieldname, [cerif.get('cerif:Funding').get('cerif:Description').get('#text')]
-            elif cerif.get('cerif:Project'):
-                return fieldname, [await map_project_values(cerif.get('cerif:Project'))]
-        elif isinstance(cerif, list):
-            results = []
-            for c in cerif:
-                if c.get('cerif:Funding'):
-                    results.append(c.get('cerif:Funding').get('cerif:Description').get('#text'))
-                elif c.get('cerif:Project'):
-                    results.append(await map_project_values(c.get('cerif:Project')))
-            return fieldname, results
-        return fieldname, None
-
-    async def get_work_publishers(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return 'publishers', None
-        fieldname = 'publishers'
-        try:
-            if isinstance(cerif, dict):
-                return fieldname, [cerif.get('cerif:Publisher').get('cerif:OrgUnit').get('cerif:Name').get('#text')]
-            elif isinstance(cerif, list):
-                return fieldname, [c.get('cerif:Publisher').get('cerif:OrgUnit').get('cerif:Name').get('#text') for c in
-                                   cerif]
-        except Exception as e:
-            print(f'error parsing {cerif}: {e}')
-            return fieldname, None
-
-    async def get_work_presented_at(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {
-                'acronym'   : value.get('cerif:Acronym'),
-                'name'      : value.get('cerif:Name').get('#text') if value.get('cerif:Name') else None,
-                'start_date': value.get('cerif:StartDate'),
-                'end_date'  : value.get('cerif:EndDate'),
-                'place'     : value.get('cerif:Place'),
-                'country'   : value.get('cerif:Country'),
-
-            }
-            return result
-
-        fieldname = 'presented_at'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif.get('cerif:Event'))]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v.get('cerif:Event')) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_authors(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {}
-            affiliations = value.get('cerif:Affiliation')
-            if affiliations:
-                if isinstance(affiliations, dict):
-                    affiliations = [affiliations]
-                affils = []
-                for affil in affiliations:
-                    affils.append({
-                        'internal_repository_id': affil.get('cerif:OrgUnit').get('@id') if affil.get(
-                            'cerif:OrgUnit') else None,
-                        'name'                  : affil.get('cerif:OrgUnit').get('cerif:Name').get(
-                            '#text') if affil.get('cerif:OrgUnit') else None,
-                        'acronym'               : affil.get('cerif:OrgUnit').get('cerif:Acronym') if affil.get(
-                            'cerif:OrgUnit') else None,
-                    })
-                result['affiliations'] = affils
-            person = value.get('cerif:Person')
-            if person:
-                result['internal_repository_id'] = person.get('@id')
-                result['family_names'] = person.get('cerif:PersonName').get('cerif:FamilyNames') if person.get(
-                    'cerif:PersonName') else None
-                result['first_names'] = person.get('cerif:PersonName').get('cerif:FirstNames') if person.get(
-                    'cerif:PersonName') else None
-            return result
-
-        fieldname = 'authors'
-        cerif = cerif.get('cerif:Author')
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif)]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_editors(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {}
-            affiliations = value.get('cerif:Affiliation')
-            if affiliations:
-                if isinstance(affiliations, dict):
-                    affiliations = [affiliations]
-                affils = []
-                for affil in affiliations:
-                    affils.append({
-                        'internal_repository_id': affil.get('@id'),
-                        'name'                  : affil.get('cerif:Name').get('#text') if affil.get(
-                            'cerif:Name') else None,
-                        'acronym'               : affil.get('cerif:Acronym'),
-                    })
-                result['affiliations'] = affils
-            person = value.get('cerif:Person')
-            if person:
-                result['internal_repository_id'] = person.get('@id')
-                result['family_names'] = person.get('cerif:FamilyNames')
-                result['first_names'] = person.get('cerif:FirstNames')
-            return result
-
-        fieldname = 'editors'
-        cerif = cerif.get('cerif:Editor')
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif)]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_issn(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        fieldname = 'issn'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            medium = cerif.get('@medium').split('#')[1]
-            return fieldname, [{medium: cerif.get('#text')}]
-        elif isinstance(cerif, list):
-            return fieldname, [{v.get('@medium').split('#')[1]: v.get('#text')} for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_work_keywords(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[str] | None]:
-        fieldname = 'keywords'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [cerif.get('#text')]
-        elif isinstance(cerif, list):
-            return fieldname, [v.get('#text') for v in cerif]
-        else:
-            return fieldname, None
-
-    # --------------------------------------------------------
-    #                 CERIF MAPPING FUNCTIONS
-    # --------------------------------------------------------
-    #                      DATASETS
-    # --------------------------------------------------------
-    async def get_dataset_file_locations(self, cerif_medium: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {
-                'type'     : value.get('cerif:Type').get('#text') if value.get('cerif:Type') else None,
-                'title'    : value.get('cerif:Title').get('#text') if value.get('cerif:Title') else None,
-                'uri'      : value.get('cerif:URI'),
-                'mime_type': value.get('cerif:MimeType'),
-                'size'     : value.get('cerif:Size'),
-                'access'   : value.get('ar:Access'),
-                'license'  : value.get('cerif:License').get('#text') if value.get('cerif:License') else None,
-            }
-            return result
-
-        if not isinstance(cerif_medium, dict):
-            return 'file_locations', None
-        value = cerif_medium.get('cerif:Medium')
-        if isinstance(value, dict):
-            return 'file_locations', [await map_values(value)]
-        elif isinstance(value, list):
-            return 'file_locations', [await map_values(v) for v in value]
-        else:
-            return 'file_locations', None
-
-    async def get_dataset_references(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            title = value.get('cerif:Title')
-            if title:
-                if isinstance(title, dict):
-                    title = title.get('#text')
-                if isinstance(title, list):
-                    title = [i.get('#text') for i in title]
-            result = {
-                'internal_repository_id': value.get('@id'),
-                'peer_reviewed'         : value.get('pubt:Type').get('@pure:peerReviewed') if value.get(
-                    'pubt:Type') else None,
-                'publication_category'  : value.get('pubt:Type').get('@pure:publicationCategory') if value.get(
-                    'pubt:Type') else None,
-                'type'                  : value.get('pubt:Type').get('#text') if value.get('pubt:Type') else None,
-                'title'                 : title,
-            }
-            return result
-
-        fieldname = 'references'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif.get('cerif:Publication'))]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v.get('cerif:Publication')) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_dataset_dates(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | dict | None]:
-
-        fieldname = 'dates'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            result = None
-        elif isinstance(cerif, dict):
-            result = {}
-            for date, vals in cerif.items():
-                result[str(date).split(':')[1].lower()] = {'start': vals.get('@startDate'), 'end': vals.get('@endDate')}
-            result = [result]
-        elif isinstance(cerif, list):
-            result = []
-            for i in cerif:
-                res = {}
-                for date, vals in i.items():
-                    res[str(date).split(':')[1].lower()] = {'start': vals.get('@startDate'),
-                                                            'end'  : vals.get('@endDate')}
-                result.append(res)
-        return fieldname, result
-
-    async def get_dataset_creators(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            if not isinstance(value, dict):
-                return None
-            result = {}
-            affiliations = value.get('cerif:Affiliation')
-            if affiliations:
-                if isinstance(affiliations, dict):
-                    affiliations = [affiliations]
-                affils = []
-                for affil in affiliations:
-                    affils.append({
-                        'internal_repository_id': affil.get('cerif:OrgUnit').get('@id') if affil.get(
-                            'cerif:OrgUnit') else None,
-                        'name'                  : affil.get('cerif:OrgUnit').get('cerif:Name').get(
-                            '#text') if affil.get('cerif:OrgUnit') else None,
-                        'acronym'               : affil.get('cerif:OrgUnit').get('cerif:Acronym') if affil.get(
-                            'cerif:OrgUnit') else None,
-                    })
-                result['affiliations'] = affils
-            person = value.get('cerif:Person')
-            if person:
-                result['internal_repository_id'] = person.get('@id')
-                result['family_names'] = person.get('cerif:PersonName').get('cerif:FamilyNames') if person.get(
-                    'cerif:PersonName') else None
-                result['first_names'] = person.get('cerif:PersonName').get('cerif:FirstNames') if person.get(
-                    'cerif:PersonName') else None
-            return result
-
-        fieldname = 'authors'
-        if 'cerif:Creator' in cerif:
-            cerif = cerif.get('cerif:Creator')
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            return fieldname, None
-        if isinstance(cerif, dict):
-            return fieldname, [await map_values(cerif)]
-        elif isinstance(cerif, list):
-            return fieldname, [await map_values(v) for v in cerif]
-        else:
-            return fieldname, None
-
-    async def get_dataset_generated_by(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        fieldname = 'generated_by'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            result = None
-        elif isinstance(cerif, dict):
-            result = [{
-                'internal_repository_id': cerif.get('cerif:Equipment').get('@id') if cerif.get(
-                    'cerif:Equipment') else None,
-                'name'                  : cerif.get('cerif:Equipment').get('cerif:Name').get('#text') if cerif.get(
-                    'cerif:Equipment') else None,
-            }]
-        elif isinstance(cerif, list):
-            result = []
-            for i in cerif:
-                result.append({
-                    'internal_repository_id': i.get('cerif:Equipment').get('@id') if i.get('cerif:Equipment') else None,
-                    'name'                  : i.get('cerif:Equipment').get('cerif:Name').get('#text') if i.get(
-                        'cerif:Equipment') else None,
-                })
-        return fieldname, result
-
-    async def get_dataset_publishers(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        fieldname = 'publishers'
-        cerif = cerif.get('cerif:Publisher')
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            result = None
-        elif isinstance(cerif, dict):
-            result = [{
-                'internal_repository_id': cerif.get('cerif:OrgUnit').get('@id') if cerif.get('cerif:OrgUnit') else None,
-                'name'                  : cerif.get('cerif:DisplayName'),
-                'org_unit_name'         : cerif.get('cerif:OrgUnit').get('cerif:Name').get('#text') if cerif.get(
-                    'cerif:OrgUnit') else None,
-            }]
-        elif isinstance(cerif, list):
-            result = []
-            for i in cerif:
-                result.append({
-                    'internal_repository_id': i.get('cerif:OrgUnit').get('@id') if i.get('cerif:OrgUnit') else None,
-                    'name'                  : i.get('cerif:DisplayName'),
-                    'org_unit_name'         : i.get('cerif:OrgUnit').get('cerif:Name').get('#text') if i.get(
-                        'cerif:OrgUnit') else None,
-                })
-        return fieldname, result
-
-    async def get_dataset_originates_from(self, cerif: dict[list] | dict[dict]) -> tuple[str, list[dict] | None]:
-        async def map_values(value: dict) -> dict:
-            funder = None
-            funderdict = value.get('cerif:Funder')
-
-            if funderdict:
-                funder = {
-                    'internal_repository_id': funderdict.get('cerif:OrgUnit').get('@id') if funderdict.get(
-                        'cerif:OrgUnit') else None,
-                    'acronym'               : funderdict.get('cerif:OrgUnit').get('cerif:Acronym') if funderdict.get(
-                        'cerif:OrgUnit') else None,
-                    'name'                  : funderdict.get('cerif:OrgUnit').get('cerif:Name').get(
-                        '#text') if funderdict.get('cerif:OrgUnit') else None,
-                }
-            return {
-                'internal_repository_id': value.get('cerif:Equipment').get('@id') if value.get(
-                    'cerif:Equipment') else None,
-                'funder'                : funder,
-                'identifier'            : value.get('cerif:Identifier').get('#text') if value.get(
-                    'cerif:Identifier') else None,
-                'identifier_type'       :
-                    value.get('cerif:Identifier').get('@type').split('/dk/atira/funding/fundingdetails/')[
-                        -1] if value.get('cerif:Identifier') else None,
-                'type'                  : value.get('funt:Type').split('#')[-1] if value.get('funt:Type') else None,
-            }
-
-        fieldname = 'originates_from'
-        if not isinstance(cerif, dict) and not isinstance(cerif, list):
-            result = None
-        elif isinstance(cerif, dict):
-            result = [await map_values(cerif)]
-        elif isinstance(cerif, list):
-            result = []
-            for i in cerif:
-                result.append(await map_values(i))
-        return fieldname, result
-
-    # Check keys for missing values in cerif mapping
-    async def check_keys(self, item, keylist) -> list[str]:
-        missing_keys = []
-        for k in item.keys():
-            if k.startswith('cerif:') and k not in keylist:
-                missing_keys.append(k)
-        return missing_keys
-
     async def process_cerif(self, type: str, data: list[dict]) -> tuple[list[dict], set[str]]:
-        keys_missing = set()
-        results = []
-        mapping = self.CERIF_RESULT_KEY_MAPPING[type]
-        keylist = self.CERIF_RESULT_KEYLIST[type]
-        for i in data:
-            try:
-                item = i['metadata'].get(self.CERIF_ITEM_MAPPING[type])
-            except Exception as e:
-                print(f'error processing cerif data for {type}: {e}')
-                continue
-            result = {}
-            if not item:
+        '''
+        maps a page of raw cerif records using cerif_mapping.map_page
+        runs in the process pool if workers > 0, so the event loop is free to fetch the next pages
+        '''
+        if not self.workers:
+            return cerif_mapping.map_page(type, data)
+        if not self.executor:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, cerif_mapping.map_page, type, data)
+
+    def parse_page(self, text: str) -> dict:
+        '''
+        parses the xml of a ListRecords response and returns the ListRecords part;
+        a noRecordsMatch error is returned as an empty page
+        '''
+        if self.parser == 'lxml':
+            return self.lxml_parser.parse_page(text)
+        parsed = xmltodict.parse(text)
+        error = parsed['OAI-PMH'].get('error')
+        if isinstance(error, dict) and error.get('@code') == 'noRecordsMatch':
+            return {}
+        return parsed['OAI-PMH']['ListRecords']
+
+    @classmethod
+    def get_item_keys(cls) -> dict[str, set[str]]:
+        '''
+        returns the cerif fields used in CERIF_RESULT_KEY_MAPPING per cerif item type, e.g. {'cerif:Publication': {...}}
+        types that share a cerif item (products & datasets) get the union of their fields
+        '''
+        item_keys = defaultdict(set)
+        for type, mapping in cls.CERIF_RESULT_KEY_MAPPING.items():
+            if type not in cls.CERIF_ITEM_MAPPING:
                 continue
+            keys = item_keys[cls.CERIF_ITEM_MAPPING[type]]
             for key, value in mapping.items():
-                try:
-                    if isinstance(value, str):
-                        result[key] = item.get(value)
-                    elif isinstance(value, dict):
-                        temp = item.get(key)
-
-                        if temp:
-                            if isinstance(temp, list):
-                                for k, v in value.items():
-                                    result[k] = []
-                                    for u in temp:
-                                        try:
-                                            result[k].append(u.get(v))
-                                        except Exception:
-                                            ...
-                            elif isinstance(temp, dict):
-                                for k, v in value.items():
-                                    result[k] = temp.get(v)
-                    elif callable(value):
-                        item_result = item.get(key)
-                        if item_result:
-                            keyname, fullvalue = await value(self, item_result)
-                            result[keyname] = fullvalue
-                except Exception as e:
-                    print(f'error {e} processing {key, value} for {type}. Full item: {item}')
-            missing = await self.check_keys(item, keylist)
-            if missing:
-                [keys_missing.add(m) for m in missing]
-            results.append(result)
-        return results, keys_missing
-
-    async def get_results(self, type: str, url: str, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> dict[
-        str, list[Any] | Any]:
-        results = {
-            'raw'         : [],
-            'processed'   : [],
-            'missing_keys': [],
-        }
-
-        async def fetch_response(url):
-            try:
-                r = await self.httpxclient.get(url)
-                parsed = xmltodict.parse(r.text)
-                return parsed['OAI-PMH']['ListRecords']
-            except Exception as e:
-                print(f'error fetching {url}: {e}')
-                return None
+                keys.add(value if isinstance(value, str) else key)
+        return dict(item_keys)
 
+    async def fetch_pages(self, url: str) -> AsyncIterator[dict]:
+        '''
+        pipeline stage 1: yields the parsed ListRecords pages for url, following the resumption tokens.
+        the next page is fetched while the consumer handles the current one.
+        raises OAIFetchError if a page can't be retrieved.
+        '''
         resume_url = url.split('&metadataPrefix')[0]
-        while True:
-            response = await fetch_response(url)
-            if not response:
-                time.sleep(5)
-                continue
-            items = response.get('record')
-            raw_results = []
+        next_page = asyncio.create_task(self.fetcher.fetch(url, self.parse_page))
+        try:
+            while next_page:
+                response = await next_page
+                next_page = None
+                resumption_token = response.get('resumptionToken')
+                if isinstance(resumption_token, dict) and resumption_token.get('#text'):
+                    print(f'{resumption_token.get("@cursor")}/{resumption_token.get("@completeListSize")}')
+                    next_url = f"{resume_url}&resumptionToken={resumption_token.get('#text')}"
+                    next_page = asyncio.create_task(self.fetcher.fetch(next_url, self.parse_page))
+                yield response
+        finally:
+            if next_page:
+                next_page.cancel()
+                # a prefetch that already failed: retrieve its exception, it is not used anymore
+                if next_page.done() and not next_page.cancelled():
+                    next_page.exception()
+
+    async def split_records(self, pages: AsyncIterator[dict]) -> AsyncIterator[tuple[list[dict], list[str]]]:
+        '''
+        pipeline stage 2: splits each page into a list of raw records and a list of ids of deleted records
+        '''
+        async for page in pages:
+            items = page.get('record', [])
             if not isinstance(items, list):
                 items = [items]
+            records = []
+            deleted = []
             for result in items:
-                raw_results.append(result)
-            tmp = await self.process_cerif(type, raw_results)
-            results['processed'].extend(tmp[0])
-            results['missing_keys'].extend(tmp[1])
-            results['missing_keys'] = list(set(results['missing_keys']))
-            try:
-                for subitem in tmp[0]:
-                    await collection.find_one_and_update({"internal_repository_id": subitem['internal_repository_id']},
-                                                         {'$set': subitem}, upsert=True)
-            except Exception as e:
-                print('probably missing internal_repository_id field')
-                print(f'error inserting {type} records: {e}')
-            if response.get('resumptionToken'):
-                print(
-                    f'{response.get("resumptionToken").get("@cursor")}/{response.get("resumptionToken").get("@completeListSize")}')
-                resumetoken = response.get('resumptionToken').get('#text')
-                url = f"{resume_url}&resumptionToken={resumetoken}"
-            else:
-                return results
+                if result['header'].get('@status') == 'deleted':
+                    # deleted records only have a header; the identifier ends with the internal repository id
+                    deleted.append(result['header']['identifier'].split('/')[-1])
+                    continue
+                records.append(result)
+            yield records, deleted
+
+    async def map_records(self, type: str, pages: AsyncIterator[tuple[list[dict], list[str]]]) -> AsyncIterator[
+        tuple[list[dict], set[str], list[str]]]:
+        '''
+        pipeline stage 3: maps the raw records of each page using process_cerif
+        '''
+        async for records, deleted in pages:
+            processed, missing_keys = await self.process_cerif(type, records)
+            yield processed, missing_keys, deleted
+
+    async def get_results(self, type: str, url: str, collection: motor.motor_asyncio.AsyncIOMotorCollection) -> dict[
+        str, int | set | bool]:
+        '''
+        harvests all records for url and stores them in collection, one page at a time:
+        fetch_pages -> split_records -> map_records -> bulk upsert
+        only the counters and the set of missing keys are kept, so memory use is bounded by the page size.
+        '''
+        results = {
+            'processed'   : 0,
+            'skipped'     : 0,
+            'missing_keys': set(),
+            'deleted'     : 0,
+            'failed'      : False,
+        }
+        fetched = self.fetch_pages(url)
+        split = self.split_records(fetched)
+        pages = self.map_records(type, split)
+        try:
+            # async for doesn't close the stage it reads from: close all three stages (in reverse order) when stopping
+            # early, so fetch_pages cancels the prefetched page
+            async with aclosing(fetched), aclosing(split), aclosing(pages):
+                async for processed, missing_keys, deleted in pages:
+                    results['missing_keys'].update(missing_keys)
+                    if deleted:
+                        await collection.delete_many({'internal_repository_id': {'$in': deleted}})
+                        results['deleted'] += len(deleted)
+                    operations = []
+                    for subitem in processed:
+                        if not subitem.get('internal_repository_id'):
+                            results['skipped'] += 1
+                            continue
+                        operations.append(UpdateOne({'internal_repository_id': subitem['internal_repository_id']},
+                                                    {'$set': subitem}, upsert=True))
+                    if not operations:
+                        continue
+                    try:
+                        await collection.bulk_write(operations, ordered=False)
+                    except BulkWriteError as e:
+                        print(f'error inserting {type} records: {len(e.details.get("writeErrors", []))} write errors')
+                    results['processed'] += len(operations)
+        except OAIFetchError as e:
+            print(f'stopped harvesting {type} records: {e}')
+            results['failed'] = True
+        return results
 
     async def get_item_results(self):
         all_itemsets = {
@@ -781,188 +457,41 @@ class OAI_PMH(GenericAPI):
 
         itemsets = [(k, v) for k, v in all_itemsets.items()]
 
-        async with aiometer.amap(functools.partial(self.call_api), itemsets,
-                                 max_at_once=self.api_settings['max_at_once'],
-                                 max_per_second=self.api_settings['max_per_second']) as responses:
-            async for response in responses:
-                cons.print(f'finished getting results {response}')
+        try:
+            async with aiometer.amap(functools.partial(self.call_api), itemsets,
+                                     max_at_once=self.api_settings['max_at_once'],
+                                     max_per_second=self.api_settings['max_per_second']) as responses:
+                async for response in responses:
+                    cons.print(f'finished getting results {response}')
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
 
     async def call_api(self, item) -> str:
         scheme = 'oai_cerif_openaire'
         type = item[0]
         itemset = item[1]
         url = f'{self.api_settings["url"]}?verb=ListRecords&metadataPrefix={scheme}&set={itemset}'
+        since = await self.watermarks.get('pure_cerif', itemset) if self.incremental else None
+        started = datetime.now(timezone.utc)
+        if since:
+            url = f'{url}&from={since.strftime("%Y-%m-%d")}'
         collectionname = f'{itemset}'
-        try:
-            collection: motor.motor_asyncio.AsyncIOMotorCollection = self.motorclient[collectionname]
-        except Exception as e:
-            collection: motor.motor_asyncio.AsyncIOMotorCollection = self.motorclient.mongoclient[collectionname]
+        collection: motor.motor_asyncio.AsyncIOMotorCollection = self.database[collectionname]
         cons.print(f'processing {type} records from {url}, storing in collection {itemset}')
         start_time = time.time()
         results = await self.get_results(type, url, collection)
+        if not results.get('failed'):
+            await self.watermarks.set('pure_cerif', itemset, started)
         end_time = time.time()
-        self.results['total']+=len(results['processed'])
-        return f'Inserted {len(results["processed"])} {type} records into {collectionname} in {int(end_time - start_time)} seconds. Possible missing keys: {results["missing_keys"]}'
-
-    # mus internal type name : cerif type name
-    CERIF_ITEM_MAPPING = {
-        'persons' : 'cerif:Person',
-        'orgs'    : 'cerif:OrgUnit',
-        'works'   : 'cerif:Publication',
-        'products': 'cerif:Product',
-        'patents' : 'cerif:Patent',
-        'datasets': 'cerif:Product',
-        'projects': 'cerif:Project',
-        'funding' : 'cerif:Funding',
-    }
+        self.results['total']+=results['processed']
+        return f'Inserted {results["processed"]} {type} records into {collectionname} and removed {results["deleted"]} deleted records in {int(end_time - start_time)} seconds. Possible missing keys: {results["missing_keys"]}'
 
-    # this indicates how a cerif result is mapped to the stored mongodb item
-    CERIF_RESULT_KEY_MAPPING = {
-        'persons'            : {
-            'internal_repository_id': '@id',
-            'cerif:PersonName'      : {'family_names': 'cerif:FamilyNames', 'first_names': 'cerif:FirstNames'},
-            'orcid'                 : 'cerif:ORCID',
-            'scopus_id'             : 'cerif:ScopusAuthorID',
-            'scopus_affil_id'       : 'cerif:ScopusAffiliationID',
-            'cerif:Affiliation'     : get_person_affiliations,
-            'researcher_id'         : 'cerif:ResearcherID',
-            'isni'                  : 'cerif:ISNI',
-            'cris-id'               : 'cerif:CRIS-ID',
-            'uuid'                  : 'cerif:UUID',
-            'uri'                   : 'cerif:URI',
-            'url'                   : 'cerif:URL',
-        },
-        'orgs'               : {
-            'internal_repository_id': '@id',
-            'cerif:Identifier'      : get_org_identifiers,
-            'cerif:Type'            : {'type': '#text'},
-            'cerif:PartOf'          : get_org_part_of,
-            'cerif:Name'            : {'name': '#text'},
-            'acronym'               : 'cerif:Acronym',
-            'url'                   : 'cerif:ElectronicAddress'
-        },
-        'datasets'           : {
-            'internal_repository_id': '@id',
-            'cerif:FileLocations'   : get_dataset_file_locations,
-            'cerif:Name'            : {'name': '#text'},
-            'cerif:Description'     : {'description': '#text'},
-            'cerif:References'      : get_dataset_references,
-            'cerif:Dates'           : get_dataset_dates,
-            'url'                   : 'cerif:URL',
-            'cerif:Creators'        : get_dataset_creators,
-            'cerif:GeneratedBy'     : get_dataset_generated_by,
-            'doi'                   : 'cerif:DOI',
-            'cerif:License'         : {'license': '#text'},
-            'cerif:Publishers'      : get_dataset_publishers,
-            'cerif:OriginatesFrom'  : get_dataset_originates_from,
-        },
-
-        # possible fields to add:  ['cerif:PublishedIn']
-        'works'              : {
-            'cerif:Subtitle'        : {'subtitle': '#text'},
-            'cerif:FileLocations'   : get_work_file_locations,
-            'cerif:Publication'     : get_work_published_in,
-            'cerif:ISBN'            : get_work_isbn,
-            'volume'                : 'cerif:Volume',
-            'language'              : 'cerif:Language',
-            'number'                : 'cerif:Number',
-            'cerif:References'      : get_work_references,
-            'cerif:OriginatesFrom'  : get_work_originates_from,
-            'start_page'            : 'cerif:StartPage',
-            'edition'               : 'cerif:Edition',
-            'cerif:Status'          : {'status': '#text'},
-            'cerif:License'         : {'license': '#text'},
-            'cerif:Title'           : {'title': '#text'},
-            'issue'                 : 'cerif:Issue',
-            'cerif:Publishers'      : get_work_publishers,
-            'cerif:Abstract'        : {'abstract': '#text'},
-            'isi'                   : 'cerif:ISI-Number',
-            'cerif:PresentedAt'     : get_work_presented_at,
-            'publication_date'      : 'cerif:PublicationDate',
-            'cerif:Authors'         : get_work_authors,
-            'scp_number'            : 'cerif:SCP-Number',
-            'part_of'               : 'cerif:PartOf',
-            'endpage'               : 'cerif:EndPage',
-            'url'                   : 'cerif:URL',
-            'doi'                   : 'cerif:DOI',
-            'cerif:Editors'         : get_work_editors,
-            'cerif:ISSN'            : get_work_issn,
-            'cerif:Keyword'         : get_work_keywords,
-            'internal_repository_id': '@id',
-        },
-        'products'           : {
-            'internal_repository_id': '@id',
-            'presented_at'          : 'cerif:PresentedAt',
-            'keywords'              : 'cerif:Keyword',
-            'filelocations'         : 'cerif:FileLocations',
-            'name'                  : 'cerif:Name',
-            'description'           : 'cerif:Description',
-            'references'            : 'cerif:References',
-            'dates'                 : 'cerif:Dates',
-            'url'                   : 'cerif:URL',
-            'creators'              : 'cerif:Creators',
-            'generated_by'          : 'cerif:GeneratedBy',
-            'doi'                   : 'cerif:DOI',
-            'license'               : 'cerif:License',
-            'publishers'            : 'cerif:Publishers',
-            'originates_from'       : 'cerif:OriginatesFrom',
-        },
-        'patents'            : {
-            'internal_repository_id': '@id',
-            'subject'               : 'cerif:Subject',
-            'keywords'              : 'cerif:Keyword',
-            'references'            : 'cerif:References',
-            'abstract'              : 'cerif:Abstract',
-            'issuer'                : 'cerif:Issuer',
-            'approval_date'         : 'cerif:ApprovalDate',
-            'title'                 : 'cerif:Title',
-            'countrycode'           : 'cerif:CountryCode',
-            'patentnumber'          : 'cerif:PatentNumber',
-            'inventors'             : 'cerif:Inventors'
-        },
-        'projects'           : {
-            'internal_repository_id': '@id',
-            'enddate'               : 'cerif:EndDate',
-            'consortium'            : 'cerif:Consortium',
-            'startdate'             : 'cerif:StartDate',
-            'keywords'              : 'cerif:Keyword',
-            'title'                 : 'cerif:Title',
-            'acronym'               : 'cerif:Acronym',
-            'abstract'              : 'cerif:Abstract',
-            'identifier'            : 'cerif:Identifier',
-            'team'                  : 'cerif:Team',
-        },
-        'funding'            : {
-            'internal_repository_id': '@id',
-            'name'                  : 'cerif:Name',
-            'description'           : 'cerif:Description',
-            'funder'                : 'cerif:Funder',
-            'acronym'               : 'cerif:Acronym',
-        },
-        'ec_funded_resources': {},
-    }
-
-    # a list of cerif fields that are processed -- might be incomplete, check later.
-    # this list is used to check if a field is in the item but not in the mapping
-    CERIF_RESULT_KEYLIST = {
-        'persons'            : ['@id', 'cerif:PersonName', 'cerif:Affiliation', 'cerif:PersonName', 'cerif:Affiliation',
-                                'cerif:ORCID', 'cerif:ScopusAuthorID', 'cerif:ScopusAffiliationID',
-                                'cerif:ResearcherID', 'cerif:ISNI', 'cerif:CRIS-ID', 'cerif:UUID', 'cerif:URI',
-                                'cerif:URL'],
-        'orgs'               : ['cerif:Identifier', 'cerif:Type', 'cerif:PartOf', 'cerif:Name', 'cerif:Acronym'],
-        'works'              : ['cerif:Keyword', 'cerif:Editors', 'cerif:Subtitle', 'cerif:Publishers', 'cerif:Authors',
-                                'cerif:DOI', 'cerif:ISBN', 'cerif:URL', 'cerif:SCP-Number', 'cerif:Title',
-                                'cerif:Status', 'cerif:FileLocations', 'cerif:PresentedAt', 'cerif:References',
-                                'cerif:Abstract', 'cerif:Language', 'cerif:PublicationDate'],
-        'datasets'           : ['cerif:Creators', 'cerif:Name', 'cerif:GeneratedBy', 'cerif:FileLocations',
-                                'cerif:Dates', 'cerif:OriginatesFrom', 'cerif:DOI', 'cerif:URL', 'cerif:References',
-                                'cerif:Publishers', 'cerif:License', 'cerif:Description'],
-        'products'           : [],
-        'patents'            : [],
-        'projects'           : [],
-        'funding'            : [],
-        'ec_funded_resources': [],
-    }
+    # the mapping itself is defined in cerif_mapping.py
+    CERIF_ITEM_MAPPING = cerif_mapping.CERIF_ITEM_MAPPING
+    CERIF_RESULT_KEY_MAPPING = cerif_mapping.CERIF_RESULT_KEY_MAPPING
+    CERIF_RESULT_KEYLIST = cerif_mapping.CERIF_RESULT_KEYLIST
 
 
 class PureAuthorCSV():
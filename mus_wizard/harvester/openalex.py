@@ -1,3 +1,6 @@
+import contextlib
+import time
+from datetime import datetime, timezone
 from itertools import chain
 from typing import Iterable
 
@@ -7,14 +10,46 @@ import motor.motor_asyncio
 import pyalex
 from pyalex import Authors, Funders, Institutions, Publishers, Sources, Topics, Works
 from pyalex.api import BaseOpenAlex
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from rich.console import Console
 
-from mus_wizard.constants import APIEMAIL, INSTITUTE_ALT_NAME, INSTITUTE_NAME, OPENALEX_INSTITUTE_ID, ROR
-from mus_wizard.database.mongo_client import MusMongoClient
+from mus_wizard.constants import (APIEMAIL, INSTITUTE_ALT_NAME, INSTITUTE_NAME, OPENALEX_API_KEY, OPENALEX_INSTITUTE_ID,
+                                  ROR)
+from mus_wizard.database.mongo_client import HarvestWatermarks, MusMongoClient
 
 cons = Console(markup=True)
 
 
+class RateLimiter():
+    '''
+    Shared rate limiter for concurrent tasks that call the same API.
+    Allows at most max_at_once requests in flight, and starts at most max_per_second requests per second.
+
+    Usage:
+        limiter = RateLimiter(max_per_second=10, max_at_once=5)
+        async with limiter.limit():
+            response = await client.get(url)
+    '''
+
+    def __init__(self, max_per_second: float = 10, max_at_once: int = 5):
+        self.interval: float = 1 / max_per_second
+        self.semaphore: asyncio.Semaphore = asyncio.Semaphore(max_at_once)
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.next_slot: float = 0
+
+    @contextlib.asynccontextmanager
+    async def limit(self):
+        async with self.semaphore:
+            async with self.lock:
+                now = time.monotonic()
+                wait = self.next_slot - now
+                self.next_slot = max(now, self.next_slot) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield
+
+
 class OpenAlexAPI():
     '''
     class to get data from the OpenAlex API and store it in MongoDB
@@ -30,9 +65,15 @@ class OpenAlexAPI():
 
     mongoclient: MusMongoClientq
 
+    incremental: bool
+    default: None -> True if OPENALEX_API_KEY is set, False otherwise
+        only retrieve works that changed since the last successful harvest (see OpenAlexQuery)
+        needs an api key: openalex only accepts the from_updated_date filter with one
+
     '''
 
-    def __init__(self, years: list[int] = None, openalex_requests: dict = None, mongoclient = None):
+    def __init__(self, years: list[int] = None, openalex_requests: dict = None, mongoclient = None,
+                 incremental: bool = None):
         if openalex_requests:
             self.openalex_requests = openalex_requests
         else:
@@ -62,6 +103,7 @@ class OpenAlexAPI():
             self.mongoclient = MusMongoClient()
         else:
             self.mongoclient = mongoclient
+        self.incremental = bool(OPENALEX_API_KEY) if incremental is None else incremental
         self.init_pyalex()
 
     def init_pyalex(self):
@@ -80,7 +122,8 @@ class OpenAlexAPI():
                 start = datetime.now()
                 cons.print('running OpenAlexQuery for works')
                 res = await OpenAlexQuery(mongoclient=self.mongoclient, mongocollection=self.mongoclient.works_openalex,
-                                          pyalextype='works', item_ids=self.requested_works, years=self.years).run()
+                                          pyalextype='works', item_ids=self.requested_works, years=self.years,
+                                          stream=True, incremental=self.incremental).run()
                 cons.print(f'took {datetime.now() - start}')
                 results.append(res)
             if request == 'authors_openalex':
@@ -136,16 +179,23 @@ class OpenAlexQuery():
     mongocollection: Collection - the primary collection to store results in for this item
     pyalextype: BaseOpenAlex - the pyalex type to query; e.g. Works, Authors, Sources, Funders, Institutions
     item_ids: Iterable[str] - a list of item_ids to query; if None, will use the default query for the itemtype
+    years: list[int] - the publication years to retrieve works for when using the default works query
+    stream: bool - for the default works query: harvest all years concurrently using run_stream() instead of one year at a time
+    incremental: bool - for run_stream(): only request works updated since the last successful harvest of that year,
+        using the from_updated_date filter and the watermarks stored in the harvest_watermarks collection.
+        Only used if OPENALEX_API_KEY is set; otherwise the full cursor is walked and unchanged works are skipped.
 
     Functions
     ---------
     add_to_querylist(query) - adds a query to the list of queries to run. if no query is provided, it will add default queries for the itemtype
     run() - runs the query and updates the database, if no queries are initialized, it calls add_to_querylist() to add default queries based on itemtype
+    run_stream() - harvests the default works query for all years concurrently, writing each page with a single bulk_write
 
     '''
 
     def __init__(self, mongoclient: MusMongoClient, mongocollection: motor.motor_asyncio.AsyncIOMotorCollection,
-                pyalextype: str, item_ids: Iterable[str] = None, id_type: str = 'openalex', years: list[int] = [2022, 2023, 2024, 2025]):
+                pyalextype: str, item_ids: Iterable[str] = None, id_type: str = 'openalex', years: list[int] = [2022, 2023, 2024, 2025],
+                stream: bool = False, incremental: bool = False):
         self.mongoclient: MusMongoClient = mongoclient
         self.collection: motor.motor_asyncio.AsyncIOMotorCollection = mongocollection
         self.item_ids: Iterable[str] = item_ids
@@ -153,7 +203,10 @@ class OpenAlexQuery():
         self.non_institution_authors: Iterable[str] = []
         self.querylist: list[BaseOpenAlex] = []
         self.years = years
-        self.httpxclient: httpx.AsyncClient = httpx.AsyncClient()
+        self.stream: bool = stream
+        self.incremental: bool = incremental
+        self.watermarks: HarvestWatermarks = HarvestWatermarks(self.mongoclient.harvest_watermarks)
+        self.httpxclient: httpx.AsyncClient = httpx.AsyncClient(timeout=30)
         if self.collection == self.mongoclient.non_instution_authors_openalex:
             self.only_institute = False
         else:
@@ -323,11 +376,123 @@ class OpenAlexQuery():
             self.querylist.append(self.pyalexmapping[self.pyalextype]().filter(orcid=orcid_batch))
         cons.print(f'{self.pyalextype} |> added {len(self.querylist)} queries')
 
+    async def load_updated_dates(self) -> dict[str, str]:
+        '''
+        returns a {id: updated_date} snapshot of all items currently in the collection
+        '''
+        return {item['id']: item.get('updated_date') async for item in
+                self.collection.find({}, projection={'id': 1, 'updated_date': 1, '_id': 0}) if item.get('id')}
+
+    async def harvest_year(self, year: int, limiter: RateLimiter, updated_dates: dict[str, str],
+                           stats: dict[str, int], since: datetime = None, max_retries: int = 5) -> bool:
+        '''
+        walks the cursor for the default works query of a single year
+        items that are new or have a different updated_date than in updated_dates are upserted using a
+        single unordered bulk_write per page; unchanged items are skipped.
+        if since is passed, only works updated after that moment are requested.
+        returns True if the cursor was walked to the end
+        '''
+        cursor = '*'
+        amountperpage = 200
+        retries = 0
+        query_filter = f'publication_year:{year},institutions.ror:{ROR}'
+        if since:
+            query_filter = f'{query_filter},from_updated_date:{since.strftime("%Y-%m-%dT%H:%M:%S")}'
+        api_key = f'&api_key={OPENALEX_API_KEY}' if OPENALEX_API_KEY else ''
+        while cursor:
+            url = (f'https://api.openalex.org/works?filter={query_filter}'
+                   f'&per-page={amountperpage}&cursor={cursor}&mailto={APIEMAIL}{api_key}')
+            try:
+                async with limiter.limit():
+                    response = await self.httpxclient.get(url)
+                if response.status_code == 403 and 'pagination' in str(response.content).lower():
+                    return False
+                if response.status_code in [429, 473, 500, 503]:
+                    raise httpx.HTTPStatusError(f'status code {response.status_code}', request=response.request,
+                                                response=response)
+                json_r = response.json()
+            except Exception as e:
+                retries += 1
+                if retries > max_retries:
+                    cons.print(f'works {year} |> too many retries, stopping this year. Last error: {e}')
+                    return False
+                amountperpage = max(amountperpage // 2, 25)
+                cons.print(f'works {year} |> error {e}, retrying with {amountperpage} papers per page')
+                await asyncio.sleep(2 ** retries)
+                continue
+            if json_r.get('error'):
+                cons.print(f'works {year} |> api error: {json_r.get("error")}')
+                return False
+            retries = 0
+            amountperpage = 200
+            cursor = json_r.get('meta', {}).get('next_cursor')
+            operations = []
+            changed = []
+            for item in json_r.get('results', []):
+                stats['retrieved'] += 1
+                if item['id'] in updated_dates and updated_dates[item['id']] == item.get('updated_date'):
+                    stats['unchanged'] += 1
+                    continue
+                operations.append(UpdateOne({'id': item['id']}, {'$set': item}, upsert=True))
+                changed.append(item)
+            if not operations:
+                continue
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                cons.print(f'works {year} |> {len(e.details.get("writeErrors", []))} errors while writing page')
+            for item in changed:
+                updated_dates[item['id']] = item.get('updated_date')
+                self.results.append(item['id'])
+            stats['written'] += len(operations)
+        cons.print(f'works {year} |> finished')
+        return True
+
+    async def harvest_year_incremental(self, year: int, limiter: RateLimiter, updated_dates: dict[str, str],
+                                       stats: dict[str, int]) -> None:
+        '''
+        runs harvest_year() starting from the watermark for this year, and moves the watermark forward
+        to the start of this harvest if it finished successfully
+        '''
+        set_name = f'works:{year}'
+        # the from_updated_date filter is rejected without an api key, see run_stream
+        use_since = self.incremental and OPENALEX_API_KEY
+        since = await self.watermarks.get('openalex', set_name) if use_since else None
+        started = datetime.now(timezone.utc)
+        if since:
+            cons.print(f'works {year} |> incremental harvest, changes since {since}')
+        if await self.harvest_year(year, limiter, updated_dates, stats, since=since):
+            await self.watermarks.set('openalex', set_name, started)
+
+    async def run_stream(self, max_per_second: float = 10, max_at_once: int = 5) -> dict:
+        '''
+        harvests the default works query for all years in self.years concurrently.
+        All year cursors share a single RateLimiter; existing updated_dates are loaded once at the start.
+        If self.incremental and OPENALEX_API_KEY are set, each year only requests the works updated since its last harvest.
+        '''
+        start = time.perf_counter()
+        stats = {'retrieved': 0, 'unchanged': 0, 'written': 0}
+        updated_dates = await self.load_updated_dates()
+        cons.print(f'works |> loaded {len(updated_dates)} known updated_dates, harvesting {self.years}')
+        if self.incremental and not OPENALEX_API_KEY:
+            cons.print('[yellow]works |> incremental harvest needs OPENALEX_API_KEY for the from_updated_date filter; '
+                       'walking the full cursor for each year instead (unchanged works are still skipped)')
+        limiter = RateLimiter(max_per_second=max_per_second, max_at_once=max_at_once)
+        async with asyncio.TaskGroup() as tg:
+            for year in self.years:
+                tg.create_task(self.harvest_year_incremental(year, limiter, updated_dates, stats))
+        stats['elapsed'] = round(time.perf_counter() - start, 2)
+        cons.print(f'works |> finished -- retrieved {stats["retrieved"]} items -- skipped {stats["unchanged"]} unchanged '
+                   f'-- added/updated {stats["written"]} items in {stats["elapsed"]} s')
+        return {'results': self.results, 'type': self.pyalextype, 'stats': stats}
+
     async def run(self) -> list:
         cons.print(f'running {self.pyalextype}')
         ids = []
         noneresults = 0
 
+        if self.pyalextype == 'works' and not self.querylist and self.stream:
+            return await self.run_stream()
         if self.pyalextype == 'works' and not self.querylist:
             cons.print(f'Getting works for {self.years}')
             for year in self.years:
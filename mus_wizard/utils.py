@@ -1,4 +1,6 @@
+import time
 from datetime import date, datetime
+from typing import Iterable
 
 from rich.console import Console
 from mus_wizard.database.mongo_client import MusMongoClient
@@ -218,25 +220,91 @@ async def get_mongo_collection_mapping():
     return mapping
 
 
-async def parse_reversed_abstract(abstract_raw: dict) -> str:
-    """
-    Inverts the given abstract by converting it from a string representation to a dictionary.
-    Then, it creates a list of word-index pairs by iterating over the inverted abstract dictionary.
-    Finally, it sorts the list based on the index and returns the concatenation of all word-index pairs.
+def reconstruct_abstract(inverted_index: dict[str, list[int]] | None) -> str:
+    '''
+    rebuilds the text of an abstract from an openalex abstract_inverted_index {word: [positions]}
+    the words are placed directly in a list sized by the highest position, so no sorting is needed (O(n)).
+    missing positions are skipped; words sharing a position are all kept, in dict order (same as a stable sort)
+    returns '' for empty or invalid input
+    '''
+    if not inverted_index or not isinstance(inverted_index, dict):
+        return ''
+    try:
+        size = 0
+        count = 0
+        for positions in inverted_index.values():
+            count += len(positions)
+            for position in positions:
+                if position >= size:
+                    size = position + 1
+        if size > 64 * count + 1024:
+            # very sparse positions (corrupt data?): sorting is cheaper than a huge mostly empty list
+            return ' '.join(word for word, _ in sorted(((word, position) for word, positions in inverted_index.items()
+                                                         for position in positions), key=lambda x: x[1]))
+        words: list[str | None] = [None] * size
+        duplicates: dict[int, list[str]] = {}
+        for word, positions in inverted_index.items():
+            for position in positions:
+                if position < 0:
+                    raise ValueError(f'negative position {position}')
+                if words[position] is None:
+                    words[position] = word
+                else:
+                    duplicates.setdefault(position, []).append(word)
+        if duplicates:
+            for position, extra in duplicates.items():
+                words[position] = ' '.join([words[position]] + extra)
+        return ' '.join([word for word in words if word is not None])
+    except Exception:
+        return ''
 
-    Parameters:
-    - inverted_abstract (str): The string representation of the inverted abstract.
 
-    Returns:
-    - str: The concatenated word-index pairs.
-    """
-    try:
+def reconstruct_abstracts(inverted_indexes: Iterable[dict[str, list[int]] | None]) -> list[str]:
+    '''
+    batch version of reconstruct_abstract
+    '''
+    return [reconstruct_abstract(inverted_index) for inverted_index in inverted_indexes]
+
+
+def benchmark_abstracts(inverted_indexes: list[dict[str, list[int]]], repeat: int = 5) -> dict[str, float]:
+    '''
+    compares the abstracts/sec of reconstruct_abstracts with the old sort-based reconstruction
+    use real abstracts, e.g. from get_abstract_sample()
+    '''
+
+    def sort_based(inverted_index: dict) -> str:
         word_index = []
-        for k, v in abstract_raw.items():
+        for k, v in inverted_index.items():
             for index in v:
                 word_index.append([k, index])
         word_index = sorted(word_index, key=lambda x: x[1])
-        text = " ".join(word[0] for word in word_index)
-    except Exception:
-        text = ""
-    return text
+        return " ".join(word[0] for word in word_index)
+
+    results = {}
+    for name, reconstruct in [('sort', lambda: [sort_based(i) for i in inverted_indexes]),
+                              ('positions', lambda: reconstruct_abstracts(inverted_indexes))]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            texts = reconstruct()
+        elapsed = time.perf_counter() - start
+        results[name] = round(len(inverted_indexes) * repeat / elapsed, 1)
+        cons.print(f'{name}: {len(texts)} abstracts x {repeat} in {elapsed:.3f} s -- {results[name]} abstracts/s')
+    cons.print(f'speedup: {results["positions"] / results["sort"]:.2f}x')
+    return results
+
+
+async def get_abstract_sample(size: int = 5000) -> list[dict[str, list[int]]]:
+    '''
+    returns the abstract_inverted_index of (max) size works from works_openalex, for benchmark_abstracts
+    '''
+    collection = MusMongoClient().works_openalex
+    cursor = collection.find({'abstract_inverted_index': {'$ne': None}},
+                             projection={'_id': 0, 'abstract_inverted_index': 1}).limit(size)
+    return [work['abstract_inverted_index'] async for work in cursor]
+
+
+async def parse_reversed_abstract(abstract_raw: dict) -> str:
+    '''
+    async wrapper around reconstruct_abstract
+    '''
+    return reconstruct_abstract(abstract_raw)